@@ -1,62 +1,107 @@
 /*
-   pulse.c
+   read_gpio.c
 
-   gcc -o pulse pulse.c -lpigpio -lrt -lpthread
+   Samples a list of GPIO pins in a tight loop. Built as shared library and loaded with ctypes by
+   src/core/sample_backend.py:
 
-   sudo ./pulse
+   gcc -Wall -O2 -shared -fPIC -o libreadgpio.so read_gpio.c -lpigpio -lrt -lpthread
+
+   Each pass reads the levels of all pins at once and packs them into a bitmask:
+   bit i of masks[pass] is the level of pins[i]. timestamps[pass] is CLOCK_MONOTONIC in nanoseconds.
 */
 
-#include <stdio.h>
+#include <stdint.h>
+#include <time.h>
 #include <pigpio.h>
 
-#define ARRAY_LENGTH 1000
+#define MAX_PINS 32
+
+static int initialised = 0;
 
-int main(int argc, char *argv[])
+int read_gpio_initialise(void)
 {
- //  double start;
-   int pin = 20;
- //  int val = -1;
-   int i = 0;
-   int reads[ARRAY_LENGTH][2];
+   int internals;
 
-   if (gpioInitialise() < 0)
+   if (initialised)
    {
-      fprintf(stderr, "pigpio initialisation failed\n");
-      return 1;
+      return 0;
    }
 
-   /* Set GPIO modes */
-   gpioSetMode(pin, PI_INPUT);
-
-
-//    start = time_time();
+   /* The python process keeps its own signal handlers */
+   internals = gpioCfgGetInternals();
+   internals |= PI_CFG_NOSIGHANDLER;
+   gpioCfgSetInternals(internals);
 
-//    while ((time_time() - start) < 60.0)
-//    {
-//       gpioWrite(18, 1); /* on */
+   if (gpioInitialise() < 0)
+   {
+      return -1;
+   }
+   initialised = 1;
+   return 0;
+}
 
-//       time_sleep(0.5);
+void read_gpio_terminate(void)
+{
+   if (!initialised)
+   {
+      return;
+   }
+   /* Stop DMA, release resources */
+   gpioTerminate();
+   initialised = 0;
+}
 
-//       gpioWrite(18, 0); /* off */
+static uint64_t monotonic_ns(void)
+{
+   struct timespec ts;
 
-//       time_sleep(0.5);
+   clock_gettime(CLOCK_MONOTONIC, &ts);
+   return (uint64_t)ts.tv_sec * 1000000000ULL + (uint64_t)ts.tv_nsec;
+}
 
-//       /* Mirror GPIO24 from GPIO23 */
-//       gpioWrite(24, );
-//    }
-    for(i = 0; i < ARRAY_LENGTH; i++) {
-        reads[i][0] = gpioRead(pin);
-        reads[i][1] = clock();
-    }
+int read_gpio_samples(const uint32_t *pins, int pin_count, int passes, uint32_t *masks, uint64_t *timestamps)
+{
+   uint32_t bank_bits[MAX_PINS];
+   uint32_t levels;
+   uint32_t mask;
+   int i;
+   int pass;
 
-    for(i = 0; i < ARRAY_LENGTH; i++){
-        printf("%d %d %d\n", i, reads[i][0], reads[i][1]);
-    }
+   if (!initialised)
+   {
+      return -1;
+   }
+   if (pin_count < 1 || pin_count > MAX_PINS || passes < 1)
+   {
+      return -2;
+   }
 
-    
+   /* Set GPIO modes */
+   for (i = 0; i < pin_count; i++)
+   {
+      if (pins[i] > 31)
+      {
+         return -2;
+      }
+      gpioSetMode(pins[i], PI_INPUT);
+      gpioSetPullUpDown(pins[i], PI_PUD_DOWN);
+      bank_bits[i] = 1u << pins[i];
+   }
 
-   /* Stop DMA, release resources */
-   gpioTerminate();
+   for (pass = 0; pass < passes; pass++)
+   {
+      levels = gpioRead_Bits_0_31();
+      mask = 0;
+      for (i = 0; i < pin_count; i++)
+      {
+         if (levels & bank_bits[i])
+         {
+            mask |= 1u << i;
+         }
+      }
+      masks[pass] = mask;
+      timestamps[pass] = monotonic_ns();
+   }
 
-   return 0;
-}
\ No newline at end of file
+   return passes;
+}
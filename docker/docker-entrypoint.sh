@@ -16,6 +16,9 @@ KEY_FILE=""
 APP_HOST=0.0.0.0
 APP_PORT=80
 
+# One process, set SERVER_MODE=workers (e.g. in balena.io) for HTTP worker processes and one process that owns the hardware
+SERVER_MODE=development
+
 #############################
 ## Configured in balena.io ##
 # SECRET_KEY=               #
@@ -1,21 +1,30 @@
+import os
+
 from flask import Flask
 
 from config.swagger import INDEX_SWAGGER_BP
 from config import FLASK_APP
-from config.environment_tools import get_cert, get_key
-from config.flask_config import FlaskExceptionConfig, post_configuration, register_blueprints
+from config.environment_tools import get_cert, get_key, get_server_mode
+from config.flask_config import FlaskExceptionConfig, MetricsConfig, ProfilingConfig, post_configuration, register_blueprints
 
-from resources import DEVICE_BP
+from resources import DEVICE_BP, METRICS_BP, PROFILES_BP
+from core import CM_API, WEB_API, JOB_OUTBOX
+from controllers.profiles import PROFILER
+from utils.http import is_admin
 
 
 def start_app(app: Flask):
     _EXCEPTION_CONF = FlaskExceptionConfig(app)
     _blueprints = [
         INDEX_SWAGGER_BP,
-        DEVICE_BP
+        DEVICE_BP,
+        METRICS_BP,
+        PROFILES_BP
     ]
     _configs = [
-        _EXCEPTION_CONF
+        _EXCEPTION_CONF,
+        MetricsConfig(app),
+        ProfilingConfig(app, profiler=PROFILER, is_admin=is_admin)
     ]
     post_configuration(app, _configs)
     register_blueprints(app, _blueprints)
@@ -32,9 +41,23 @@ def start_app(app: Flask):
 
     _host = app.config['HOST']
     _port = app.config['PORT']
+    if get_server_mode() == 'workers':
+        # Imported here, gunicorn is only needed for this mode
+        from serving import serve_with_workers
+        serve_with_workers(app=app, host=_host, port=_port, ssl_context=_ssl_context, start_hardware=start_hardware)
+        return
+
+    start_hardware()
     _threaded = True
     app.run(host=_host, port=_port, ssl_context=_ssl_context, threaded=_threaded)
 
 
+def start_hardware():
+    CM_API.configure_pins()
+    CM_API.start_status_monitoring()
+    WEB_API.warm_up()
+    JOB_OUTBOX.start()
+
+
 if __name__ == '__main__':
     start_app(FLASK_APP)
\ No newline at end of file
@@ -2,13 +2,15 @@ from flask import Flask, Blueprint
 from flask_cors import CORS
 from flasgger import Swagger
 
-from config.environment_tools import init_environment, get_environment_mode
+from config.environment_tools import init_environment, get_environment_mode, get_log_level, get_log_format, get_log_max_bytes, get_log_backup_count
+from config.logger import configure_logging
 from config.swagger import get_swagger_template
 
 def create_app(env_path: str):
     app = Flask(__name__)
     CORS(app, allow_headers="*")
     init_environment(env_path=env_path)
+    configure_logging(level=get_log_level(), log_format=get_log_format(), max_bytes=get_log_max_bytes(), backup_count=get_log_backup_count())
     app.config.from_pyfile('default_config.py')
     mode = get_environment_mode()
     app.config.from_pyfile(mode.config_path)
@@ -46,6 +46,56 @@ _available_environment_variables = {
     'SSL_CA_BUNDLE': None
 }
 
+# Optional environment variables and their defaults
+_optional_environment_variables = {
+    'STATUS_SAMPLE_INTERVAL': '0.5',
+    'STATUS_MAX_AGE': '1.0',
+    # Seconds without a status request after which the LEDs are no longer sampled
+    'STATUS_IDLE_TIME': '60',
+    'GPIO_READ_MODE': 'poll',
+    'GPIO_SAMPLE_BACKEND': 'python',
+    'GPIO_NATIVE_LIBRARY': '/usr/local/lib/libreadgpio.so',
+    # Empty: "simulated" in test mode, "rpi" otherwise
+    'HARDWARE_BACKEND': '',
+    'SIMULATION_TIME_SCALE': '1.0',
+    # Shared secret or PEM public key of the WebAPI tokens, enables local token verification
+    'WEBAPI_JWT_KEY': '',
+    'WEBAPI_JWKS_URL': '',
+    'WEBAPI_JWT_ALGORITHMS': 'HS256',
+    'AUTH_CACHE_SIZE': '1024',
+    'AUTH_CACHE_TTL': '60',
+    'WEBAPI_POOL_SIZE': '4',
+    'WEBAPI_CONNECT_TIMEOUT': '3.05',
+    'WEBAPI_READ_TIMEOUT': '10',
+    'WEBAPI_RETRIES': '2',
+    # "development": Werkzeug server in one process, "workers": HTTP worker processes and one hardware owner process
+    'SERVER_MODE': 'development',
+    # 0: one worker per CPU core
+    'SERVER_WORKERS': '0',
+    'SERVER_THREADS': '8',
+    'HARDWARE_SOCKET': '/tmp/coffee_machine_hardware.sock',
+    # "true": every response gets a Server-Timing header, otherwise only profiled requests
+    'SERVER_TIMING': 'false',
+    # Share of the requests (0 to 1) that are profiled with cProfile, admins can profile single requests with the header X-Profile
+    'PROFILE_SAMPLE_RATE': '0',
+    'PROFILE_MAX_FILES': '20',
+    'LOG_LEVEL': 'INFO',
+    # "text" or "json" (one object per line)
+    'LOG_FORMAT': 'text',
+    # Size in bytes at which app.log and error.log are rotated
+    'LOG_MAX_BYTES': '1048576',
+    'LOG_BACKUP_COUNT': '5',
+    # Memory mapped file of the LED history, empty: kept in memory only
+    'STATUS_HISTORY_FILE': '/data/status_history.bin',
+    # Number of LED records (9 bytes each) in the history
+    'STATUS_HISTORY_SIZE': '65536',
+    # I2C address of the ADS1115 behind the 74HC4051 multiplexer (e.g. 0x48), empty: fill levels are not measured
+    'FILL_LEVEL_ADC_ADDRESS': '',
+    'FILL_LEVEL_SCAN_INTERVAL': '5',
+    # "gpio": one GPIO per button and the relais, "shift_register": all outputs through the 74HC4094 of the device board
+    'OUTPUT_DRIVER': 'gpio'
+}
+
 
 def init_environment(env_path: str = None, debug: bool = True):
     if env_path:
@@ -55,13 +105,15 @@ def init_environment(env_path: str = None, debug: bool = True):
     for key in _available_environment_variables.keys():
         _env_var = os.environ[key]
         if debug and len(_env_var) == 0:
-            logger.warning('Environment variable "{}" is empty'.format(key))
+            logger.warning('Environment variable "%s" is empty', key)
         _available_environment_variables[key] = _env_var
+    for key, default in _optional_environment_variables.items():
+        _optional_environment_variables[key] = os.environ.get(key) or default
     _replace_environment_mode(_available_environment_variables)
 
 
 def get_env_vars() -> List[str]:
-    return list(_available_environment_variables.keys())
+    return list(_available_environment_variables.keys()) + list(_optional_environment_variables.keys())
 
 
 def get_environment_mode():
@@ -108,6 +160,141 @@ def get_ssl_ca_bundle():
     return _available_environment_variables['SSL_CA_BUNDLE']
 
 
+def get_status_sample_interval() -> float:
+    return float(_optional_environment_variables['STATUS_SAMPLE_INTERVAL'])
+
+
+def get_status_max_age() -> float:
+    return float(_optional_environment_variables['STATUS_MAX_AGE'])
+
+
+def get_status_idle_time() -> float:
+    return float(_optional_environment_variables['STATUS_IDLE_TIME'])
+
+
+def get_gpio_read_mode() -> str:
+    return _optional_environment_variables['GPIO_READ_MODE']
+
+
+def get_gpio_sample_backend() -> str:
+    return _optional_environment_variables['GPIO_SAMPLE_BACKEND']
+
+
+def get_gpio_native_library() -> str:
+    return _optional_environment_variables['GPIO_NATIVE_LIBRARY']
+
+
+def get_hardware_backend() -> str:
+    return _optional_environment_variables['HARDWARE_BACKEND']
+
+
+def get_simulation_time_scale() -> float:
+    return float(_optional_environment_variables['SIMULATION_TIME_SCALE'])
+
+
+def get_webapi_jwt_key() -> str:
+    return _optional_environment_variables['WEBAPI_JWT_KEY']
+
+
+def get_webapi_jwks_url() -> str:
+    return _optional_environment_variables['WEBAPI_JWKS_URL']
+
+
+def get_webapi_jwt_algorithms() -> List[str]:
+    return [a.strip() for a in _optional_environment_variables['WEBAPI_JWT_ALGORITHMS'].split(',')]
+
+
+def get_auth_cache_size() -> int:
+    return int(_optional_environment_variables['AUTH_CACHE_SIZE'])
+
+
+def get_auth_cache_ttl() -> float:
+    return float(_optional_environment_variables['AUTH_CACHE_TTL'])
+
+
+def get_webapi_pool_size() -> int:
+    return int(_optional_environment_variables['WEBAPI_POOL_SIZE'])
+
+
+def get_webapi_connect_timeout() -> float:
+    return float(_optional_environment_variables['WEBAPI_CONNECT_TIMEOUT'])
+
+
+def get_webapi_read_timeout() -> float:
+    return float(_optional_environment_variables['WEBAPI_READ_TIMEOUT'])
+
+
+def get_webapi_retries() -> int:
+    return int(_optional_environment_variables['WEBAPI_RETRIES'])
+
+
+def get_server_mode() -> str:
+    return _optional_environment_variables['SERVER_MODE']
+
+
+def get_server_workers() -> int:
+    return int(_optional_environment_variables['SERVER_WORKERS'])
+
+
+def get_server_threads() -> int:
+    return int(_optional_environment_variables['SERVER_THREADS'])
+
+
+def get_hardware_socket() -> str:
+    return _optional_environment_variables['HARDWARE_SOCKET']
+
+
+def get_server_timing() -> bool:
+    return _optional_environment_variables['SERVER_TIMING'].lower() in ('true', '1', 'yes')
+
+
+def get_profile_sample_rate() -> float:
+    return float(_optional_environment_variables['PROFILE_SAMPLE_RATE'])
+
+
+def get_profile_max_files() -> int:
+    return int(_optional_environment_variables['PROFILE_MAX_FILES'])
+
+
+def get_log_level() -> str:
+    return _optional_environment_variables['LOG_LEVEL'].upper()
+
+
+def get_log_format() -> str:
+    return _optional_environment_variables['LOG_FORMAT']
+
+
+def get_log_max_bytes() -> int:
+    return int(_optional_environment_variables['LOG_MAX_BYTES'])
+
+
+def get_log_backup_count() -> int:
+    return int(_optional_environment_variables['LOG_BACKUP_COUNT'])
+
+
+def get_status_history_file() -> str:
+    return _optional_environment_variables['STATUS_HISTORY_FILE']
+
+
+def get_status_history_size() -> int:
+    return int(_optional_environment_variables['STATUS_HISTORY_SIZE'])
+
+
+def get_fill_level_adc_address() -> int:
+    address = _optional_environment_variables['FILL_LEVEL_ADC_ADDRESS']
+    if not address:
+        return None
+    return int(address, 0)
+
+
+def get_fill_level_scan_interval() -> float:
+    return float(_optional_environment_variables['FILL_LEVEL_SCAN_INTERVAL'])
+
+
+def get_output_driver() -> str:
+    return _optional_environment_variables['OUTPUT_DRIVER']
+
+
 def _replace_environment_mode(params: dict):
     _chosen_config = get_default_mode()
     _possible_modes = '|'.join(map(lambda m: m.mode_str, list(Mode)))
@@ -118,7 +305,7 @@ def _replace_environment_mode(params: dict):
             _chosen_config = mode
             break
 
-    logger.debug('Replaced {} with {}'.format(params['MODE'], _chosen_config))
+    logger.debug('Replaced %s with %s', params['MODE'], _chosen_config)
     params['MODE'] = _chosen_config
     return params
 
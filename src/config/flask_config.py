@@ -1,7 +1,12 @@
-from typing import List
-from flask import Flask, Blueprint, jsonify
+import random
+import time
 
-from config.environment_tools import get_app_url_prefix
+from typing import Callable, List
+from flask import Flask, Blueprint, g, jsonify, request
+
+from config.environment_tools import get_app_url_prefix, get_server_timing, get_profile_sample_rate
+from utils.metrics import HTTP_REQUEST_SECONDS
+from utils.profiling import RequestProfiler, recording, format_server_timing, PROFILE_SUFFIX
 
 # Flask Exceptions
 
@@ -67,6 +72,88 @@ class FlaskExceptionConfig:
         self.configure_handlers()
 
 
+class MetricsConfig:
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    def configure_app(self):
+        self.app.before_request(start_request_timer)
+        self.app.after_request(observe_request)
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+def observe_request(response):
+    started = g.get('request_started')
+    if not (started is None):
+        # The url rule instead of the path, so ids do not create new series
+        endpoint = 'unmatched' if request.url_rule is None else request.url_rule.rule
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, response.status_code)
+    return response
+
+
+class ProfilingConfig:
+    # Server-Timing header with the steps of a request (auth, status, dac, press, report)
+    # and cProfile captures of single requests, requested by an admin with the header X-Profile or sampled
+    def __init__(self, flask_app, profiler: RequestProfiler, is_admin: Callable[[str], bool]):
+        self.app = flask_app
+        self.profiler = profiler
+        self.is_admin = is_admin
+        self.server_timing = get_server_timing()
+        self.sample_rate = get_profile_sample_rate()
+
+    def configure_app(self):
+        self.app.before_request(self.start_request)
+        self.app.after_request(self.finish_request)
+        self.app.teardown_request(self.teardown_request)
+
+    def start_request(self):
+        profile_requested = self._is_profile_requested()
+        if not (self.server_timing or profile_requested):
+            return
+        g.timing_started = time.perf_counter()
+        g.timing = recording()
+        g.timing_recorder = g.timing.__enter__()
+        if profile_requested:
+            # None while another request is profiled
+            g.profile = self.profiler.start()
+
+    def finish_request(self, response):
+        recorder = g.get('timing_recorder')
+        if recorder is None:
+            return response
+        spans = recorder.spans + [('total', time.perf_counter() - g.timing_started)]
+        profile = g.pop('profile', None)
+        if not (profile is None):
+            response.headers['X-Profile-Name'] = self.profiler.stop(profile, _get_profile_label()) + PROFILE_SUFFIX
+        response.headers['Server-Timing'] = format_server_timing(spans)
+        return response
+
+    def teardown_request(self, exc):
+        # Requests that failed without a response must not keep the profiler or the recording
+        profile = g.pop('profile', None)
+        if not (profile is None):
+            self.profiler.stop(profile, _get_profile_label())
+        timing = g.pop('timing', None)
+        if not (timing is None):
+            timing.__exit__(None, None, None)
+
+    def _is_profile_requested(self) -> bool:
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return True
+        if not (PROFILE_HEADER in request.headers):
+            return False
+        token = request.headers.get('x-access-token')
+        # The header of other users is ignored
+        return bool(token) and self.is_admin(token)
+
+
+def _get_profile_label() -> str:
+    return '{0}-{1}'.format(request.method, request.endpoint or 'unmatched')
+
+
 def apply_servername(response):
     response.headers['server'] = 'some_server'
     return response
@@ -80,4 +167,8 @@ def post_configuration(app: Flask, configs):
 
 def register_blueprints(app: Flask, blueprints: List[Blueprint]):
     for bp in blueprints:
-        app.register_blueprint(bp, url_prefix=get_app_url_prefix())
\ No newline at end of file
+        app.register_blueprint(bp, url_prefix=get_app_url_prefix())
+
+
+# Header an admin sends to profile a request, the response names the capture in X-Profile-Name
+PROFILE_HEADER = 'X-Profile'
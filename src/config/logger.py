@@ -1,6 +1,10 @@
+import atexit
+import copy
+import json
 import logging.handlers
 import os
 import errno
+import queue
 
 _LOG_DIR = 'logs'
 
@@ -12,28 +16,110 @@ if not os.path.isdir(_LOG_DIR):
             raise
 
 
+def get_log_dir() -> str:
+    return _LOG_DIR
+
+
 def get_logger_name(name=None):
     if name:
         return 'app.{}'.format(name)
     return 'app'
 
 
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, fields passed with extra={...} are added as they are
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if not (key in _RECORD_ATTRIBUTES):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The calling thread only merges the arguments into the message,
+    # timestamps, JSON and tracebacks are formatted by the listener thread
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(level: str = 'INFO', log_format: str = 'text', max_bytes: int = None, backup_count: int = None):
+    # Called once the environment is loaded, records logged before use the defaults
+    formatter = json_formatter if log_format == 'json' else text_formatter
+    for handler in _handlers:
+        handler.setFormatter(formatter)
+    for handler in (error_handler, general_file_handler):
+        if not (max_bytes is None):
+            handler.maxBytes = max_bytes
+        if not (backup_count is None):
+            handler.backupCount = backup_count
+    logger.setLevel(level)
+    debug_handler.setLevel(level)
+
+
+def stop_logging():
+    # Writes the records that are still queued, e.g. before a process leaves with os._exit
+    global _listener
+    if not (_listener is None):
+        _listener.stop()
+        _listener = None
+
+
+def _start_listener():
+    global _listener
+    # The file I/O is done by the listener thread, never by request threads
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive a fork, the child gets its own queue and thread
+    queue_handler.queue = queue.SimpleQueue()
+    _start_listener()
+
+
+# Attributes every LogRecord has, the others were passed with extra={...}
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__.keys()) | {'message', 'asctime', 'taskName'}
+
 logger = logging.getLogger(get_logger_name())
-logger.setLevel(logging.DEBUG)
+# Records below the level are dropped before their message is built, see configure_logging()
+logger.setLevel(logging.INFO)
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)-8s - %(name)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+text_formatter = logging.Formatter('%(asctime)s - %(levelname)-8s - %(name)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+json_formatter = JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z')
 
 debug_handler = logging.StreamHandler()
 debug_handler.setLevel(logging.INFO)
-debug_handler.setFormatter(formatter)
-logger.addHandler(debug_handler)
+debug_handler.setFormatter(text_formatter)
 
-error_handler = logging.handlers.RotatingFileHandler('{dir}/error.log'.format(dir=_LOG_DIR), maxBytes=1024*10, backupCount=3)
+error_handler = logging.handlers.RotatingFileHandler('{dir}/error.log'.format(dir=_LOG_DIR), maxBytes=1024*1024, backupCount=5)
 error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
-logger.addHandler(error_handler)
+error_handler.setFormatter(text_formatter)
 
-general_file_handler = logging.handlers.RotatingFileHandler('{dir}/app.log'.format(dir=_LOG_DIR), maxBytes=1024*10, backupCount=3)
+general_file_handler = logging.handlers.RotatingFileHandler('{dir}/app.log'.format(dir=_LOG_DIR), maxBytes=1024*1024, backupCount=5)
 general_file_handler.setLevel(logging.INFO)
-general_file_handler.setFormatter(formatter)
-logger.addHandler(general_file_handler)
+general_file_handler.setFormatter(text_formatter)
+
+_handlers = (debug_handler, error_handler, general_file_handler)
+
+queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+logger.addHandler(queue_handler)
+
+_listener = None
+_start_listener()
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+atexit.register(stop_logging)
@@ -0,0 +1,30 @@
+from typing import List
+
+from models import DeviceDAC
+from core import CM_API, I2C_BUS_NUMBER, I2C_ADDRESS_MAPPINGS
+
+
+class DeviceDACController:
+    def get_dacs(self, token:str) -> List[DeviceDAC]:
+        dacs = []
+        for name, address in I2C_ADDRESS_MAPPINGS.items():
+            value, stats = CM_API.i2c.stats(bus_number=I2C_BUS_NUMBER, address=address)
+            dacs.append(DeviceDAC(
+                name=name,
+                bus_number=I2C_BUS_NUMBER,
+                address=address,
+                value=value,
+                writes=stats.writes,
+                skipped_writes=stats.skipped_writes,
+                errors=stats.errors,
+                mean_latency_in_ms=_to_milli(stats.mean_latency()),
+                max_latency_in_ms=_to_milli(stats.max_latency),
+                last_latency_in_ms=_to_milli(stats.last_latency)
+            ))
+        return dacs
+
+
+def _to_milli(seconds: float) -> float:
+    if seconds is None:
+        return None
+    return seconds * 1000
@@ -1,7 +1,12 @@
-from models import DeviceJob, CreateDeviceJob
-from core import CM_API, WEB_API, RemoteSession
-from config.flask_config import ResourceException
+import time
+
+from models import DeviceJob, CreateDeviceJob, DeviceJobTicket, DeviceRuntimeState
+from core import CM_API, WEB_API, JOB_OUTBOX, RemoteSession, OutboxEntry, BREW_QUEUE_MAX_SIZE, BREW_READY_TIMEOUT, BREW_CYCLE_ESTIMATE, I2C_ADDRESS_MAPPINGS
+from core.brew_queue import BrewQueue, BrewQueueFullException, BrewTicket
+from core.exceptions import DACWriteException
+from config.flask_config import ResourceException, ResourceNotFound
 from utils.basic import validate_percent_value, get_percent_value
+from utils.profiling import span, add_spans
 
 
 from config.logger import logging, get_logger_name
@@ -10,38 +15,120 @@ from config.logger import logging, get_logger_name
 logger = logging.getLogger(get_logger_name(__name__))
 
 class DeviceJobController:
-    def create_job(self, token:str, create_job: CreateDeviceJob) -> DeviceJob:
+    def create_job(self, token:str, create_job: CreateDeviceJob) -> DeviceJobTicket:
+        JOB_OUTBOX.provide_token(token)
+        if not (create_job.doses in (1, 2)):
+            msg = 'Kaffeeauftrag mit {doses} Dosen nicht möglich.'.format(doses=create_job.doses)
+            raise ResourceException(status_code=405, message=msg)
+        try:
+            validate_percent_value(value=create_job.water_in_percent)
+            validate_percent_value(value=create_job.coffee_strength_in_percent)
+        except ValueError as err:
+            raise ResourceException(status_code=400, message=str(err))
+
+        # Jobs are queued while the machine is busy or starting up, only an idle machine that is not ready rejects them
         status = CM_API.status
-        if not status.device_ready:
+        is_starting = status.device_runtime_state == DeviceRuntimeState.STARTUP
+        if BREW_QUEUE.is_idle() and not CM_API.has_session and not status.device_ready and not is_starting:
             raise ResourceException(status_code=405, message='Kaffeemaschine ist nicht bereit.')
+        try:
+            ticket = BREW_QUEUE.submit(token, create_job)
+        except BrewQueueFullException:
+            raise ResourceException(status_code=503, message='Warteschlange ist voll.', headers={'Retry-After': str(int(BREW_QUEUE.cycle_estimate))})
+        return self._to_ticket(ticket)
+
+    def get_ticket(self, token:str, ticket_id:str) -> DeviceJobTicket:
+        JOB_OUTBOX.provide_token(token)
+        ticket = BREW_QUEUE.get(ticket_id)
+        if ticket is None:
+            raise ResourceNotFound('Ticket nicht gefunden.')
+        # The job is brewed after its POST returned, so the steps of the brew are reported with its ticket
+        add_spans(ticket.timings, prefix='brew-')
+        return self._to_ticket(ticket)
+
+    def _to_ticket(self, ticket: BrewTicket) -> DeviceJobTicket:
+        return DeviceJobTicket(
+            ticket_id=ticket.ticket_id,
+            state=ticket.state,
+            position=BREW_QUEUE.position(ticket),
+            estimated_start=int(BREW_QUEUE.estimated_start(ticket)),
+            local_id=ticket.result,
+            message=ticket.message
+        )
+
+    def get_job(self, token:str, local_id:str) -> DeviceJob:
+        # Reports waiting for a token of the user are sent with this one
+        JOB_OUTBOX.provide_token(token)
+        entry = JOB_OUTBOX.get(local_id)
+        if entry is None:
+            raise ResourceNotFound('Auftrag nicht gefunden.')
+        return self._to_device_job(entry)
+
+    def _to_device_job(self, entry: OutboxEntry) -> DeviceJob:
+        server_job = entry.server_job or {}
+        job = DeviceJob(**{**entry.job, **server_job})
+        job.local_id = entry.local_id
+        job.report_state = entry.state
+        return job
+
+
+def _brew(ticket: BrewTicket, session: RemoteSession) -> str:
+    # The session was opened by _wait_until_ready and is released here
+    try:
+        token = ticket.token
+        create_job = ticket.job
         settings = CM_API.settings
+        if settings.price < 0:
+            # Product data is only taken from the cache of the caller, it must not cost a round trip
+            coffee_product = WEB_API.peek_coffee_product(token, settings.coffee_product_id)
+            if not (coffee_product is None) and 'price' in coffee_product:
+                settings.price = coffee_product['price']
         create_job_body = {
             **(create_job.__dict__),
             **(settings.__dict__)
         }
-        
-        session = RemoteSession(cm_hw_api=CM_API)
-        session.open()
 
         water_in_percent = create_job.water_in_percent
         water_in_percent = get_percent_value(value=water_in_percent, accuracy=0)
         coffee_strength_in_percent = create_job.coffee_strength_in_percent
         coffee_strength_in_percent = get_percent_value(value=coffee_strength_in_percent, accuracy=0)
         doses = create_job.doses
-        logger.debug('Doses: {0}, Water: {1}, Coffee: {2}'.format(doses, water_in_percent, coffee_strength_in_percent))
-        try:
-            CM_API.set_water_in_percent(water_in_percent=water_in_percent)
-        except OSError:
-            logger.warning('Could not set water value. Choosing previous value. (Default: 50 %)')
+        logger.debug('Doses: %s, Water: %s, Coffee: %s', doses, water_in_percent, coffee_strength_in_percent)
         try:
-            CM_API.set_coffee_strength_in_percent(coffee_strength_in_percent=coffee_strength_in_percent)
-        except OSError:
-            logger.warning('Could not set coffee strength value. Choosing previous value. (Default: 50 %)')
+            CM_API.set_dac_values_in_percent(water_in_percent=water_in_percent, coffee_strength_in_percent=coffee_strength_in_percent)
+        except DACWriteException as err:
+            if I2C_ADDRESS_MAPPINGS['WATER'] in err.errors:
+                logger.warning('Could not set water value. Choosing previous value. (Default: 50 %)')
+            if I2C_ADDRESS_MAPPINGS['COFFEE_STRENGTH'] in err.errors:
+                logger.warning('Could not set coffee strength value. Choosing previous value. (Default: 50 %)')
         CM_API.make_coffee(doses=doses)
+    finally:
         session.close()
 
-        create_job_body['price'] = create_job_body['price'] * doses
-        response = WEB_API.create_job(token, create_job_body)
-        response_json = response.json()
+    create_job_body['price'] = create_job_body['price'] * doses
+    # The job is reported to the WebAPI in the background
+    with span('report'):
+        entry = JOB_OUTBOX.append(token, create_job_body)
+    return entry.local_id
+
+
+def _wait_until_ready(timeout: float) -> RemoteSession:
+    # The previous job holds its session until the machine is ready again. The session is acquired as part of the wait,
+    # a session opened by someone else in between makes the wait go on instead of failing the job.
+    deadline = time.monotonic() + timeout
+    session = RemoteSession(cm_hw_api=CM_API)
+    while True:
+        status = CM_API.wait_for_status(lambda s: s.device_ready and not CM_API.has_session, timeout=max(0, deadline - time.monotonic()))
+        if status is None:
+            return None
+        if session.try_open():
+            return session
+
 
-        return DeviceJob(**response_json)
+BREW_QUEUE = BrewQueue(
+    brew=_brew,
+    wait_until_ready=_wait_until_ready,
+    max_size=BREW_QUEUE_MAX_SIZE,
+    ready_timeout=BREW_READY_TIMEOUT,
+    cycle_estimate=BREW_CYCLE_ESTIMATE
+)
@@ -0,0 +1,7 @@
+from models import DeviceSession
+from core import CM_API
+
+
+class DeviceSessionController:
+    def get_session(self, token:str) -> DeviceSession:
+        return DeviceSession(**CM_API.session_supervisor.info())
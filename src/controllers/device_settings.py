@@ -1,5 +1,3 @@
-import requests
-
 from models import DeviceSettings
 from core import CM_API, WEB_API
 
@@ -12,8 +10,13 @@ class DeviceSettingsController:
         coffee_machine_id = new_settings.coffee_machine_id
         coffee_product_id = new_settings.coffee_product_id
 
-        coffee_machine = WEB_API.get_coffee_machine(token, coffee_machine_id)
-        coffee_product = WEB_API.get_coffee_product(token, coffee_product_id)
+        # Both lookups are independent, the machine is fetched concurrently
+        coffee_machine_future = WEB_API.submit(WEB_API.lookup_coffee_machine, token, coffee_machine_id)
+        coffee_product = WEB_API.lookup_coffee_product(token, coffee_product_id)
+        coffee_machine = coffee_machine_future.result()
+
+        if new_settings.price < 0 and 'price' in coffee_product:
+            new_settings.price = coffee_product['price']
 
         CM_API.settings = new_settings
         return CM_API.settings
@@ -1,5 +1,14 @@
-from models import DeviceStatus, EditDeviceStatus, DeviceRuntimeState
-from core import CM_API, RemoteSession
+import json
+import math
+import time
+
+from typing import Iterator
+
+from models import DeviceStatus, EditDeviceStatus, DeviceRuntimeState, DeviceStatusHistory, DeviceStatusHistoryPoint
+from core import (
+    CM_API, RemoteSession, LED_NAMES, STATUS_STREAM_HEARTBEAT, STATUS_STREAM_RETRY, STATUS_POLL_TIMEOUT, STATUS_POLL_MAX_TIMEOUT,
+    STATUS_HISTORY_RANGE, STATUS_HISTORY_POINTS, STATUS_HISTORY_MAX_POINTS
+)
 from config.flask_config import ResourceException
 from config.logger import logging, get_logger_name
 
@@ -8,14 +17,77 @@ logger = logging.getLogger(get_logger_name(__name__))
 
 
 class DeviceStatusController:
+    def __init__(self, status_source=None):
+        # Provides the status reads, CM_API or the status mirror of an HTTP worker
+        self.status_source = CM_API if status_source is None else status_source
+
     def get_status(self, token:str) -> DeviceStatus:
-        return CM_API.status
-    
+        return self.status_source.status
+
+    def poll_status(self, token:str, version:str = None, timeout:str = None):
+        # Long poll: answers as soon as the status differs from the given version
+        try:
+            version = -1 if version is None else int(version)
+            timeout = STATUS_POLL_TIMEOUT if timeout is None else float(timeout)
+        except ValueError:
+            raise ResourceException(status_code=400, message='Version oder Timeout ist ungültig.')
+        timeout = min(max(timeout, 0), STATUS_POLL_MAX_TIMEOUT)
+        snapshot = self.status_source.get_status_snapshot()
+        if snapshot.version <= version:
+            snapshot = self.status_source.wait_for_snapshot(version=version, timeout=timeout)
+        return snapshot.status, 200, {'X-Status-Version': str(snapshot.version)}
+
+    def stream_status(self, token:str) -> Iterator[str]:
+        # Server-sent events: the full status on connect, afterwards only the fields that changed.
+        # All clients wait on the shared status snapshots, so clients do not cause hardware reads.
+        snapshot = self.status_source.get_status_snapshot()
+        version = snapshot.version
+        sent = snapshot.to_dict()
+        yield 'retry: {}\n\n'.format(STATUS_STREAM_RETRY)
+        yield _get_event(event='snapshot', event_id=version, data=sent)
+        while True:
+            snapshot = self.status_source.wait_for_snapshot(version=version, timeout=STATUS_STREAM_HEARTBEAT)
+            if snapshot.version <= version:
+                # Keeps proxies from closing the idle connection and detects clients that went away
+                yield ': heartbeat\n\n'
+                continue
+            version = snapshot.version
+            current = snapshot.to_dict()
+            delta = {name: value for name, value in current.items() if sent.get(name) != value}
+            sent = current
+            if delta:
+                yield _get_event(event='delta', event_id=version, data=delta)
+
+    def get_history(self, token:str, since:str = None, until:str = None, points:str = None) -> DeviceStatusHistory:
+        # The LED history of since..until (unix seconds) downsampled to points of equal length,
+        # each with the share of the time every LED was on
+        try:
+            until = time.time() if until is None else float(until)
+            since = until - STATUS_HISTORY_RANGE if since is None else float(since)
+            points = STATUS_HISTORY_POINTS if points is None else int(points)
+        except ValueError:
+            raise ResourceException(status_code=400, message='Zeitraum oder Anzahl der Punkte ist ungültig.')
+        if not (since < until) or points < 1 or math.isinf(until - since):
+            raise ResourceException(status_code=400, message='Zeitraum oder Anzahl der Punkte ist ungültig.')
+        points = min(points, STATUS_HISTORY_MAX_POINTS)
+        history = CM_API.history
+        if history is None:
+            raise ResourceException(status_code=503, message='Der Statusverlauf wird nicht aufgezeichnet.')
+        times, coverage, shares = history.downsample(since=int(since * 1000), until=int(until * 1000), points=points, led_count=len(LED_NAMES))
+        result = DeviceStatusHistory(since=since, until=until, resolution_in_sec=(until - since) / points)
+        for i in range(points):
+            point = DeviceStatusHistoryPoint(time=float(times[i]) / 1000, coverage=round(float(coverage[i]), 3))
+            for bit, name in enumerate(LED_NAMES):
+                share = float(shares[i, bit])
+                setattr(point, name.lower(), None if math.isnan(share) else round(share, 3))
+            result.points.append(point)
+        return result
+
     def set_status(self, token:str, status:EditDeviceStatus) -> DeviceStatus:
         session = RemoteSession(cm_hw_api=CM_API)
         session.open()
         try:
-            current_status = CM_API.status
+            current_status = CM_API.get_status(fresh=True)
 
             state_id = status.coffee_machine_runtime_state
             if not(state_id is None):
@@ -26,7 +98,7 @@ class DeviceStatusController:
                 elif state == DeviceRuntimeState.OFF:
                     current_status = self.turn_off(token, current_status)
                 # No other actions are allowed if runtime state changed
-                new_status = CM_API.status
+                new_status = CM_API.get_status(fresh=True)
                 new_status.coffee_machine_runtime_state = state.state_id
                 return new_status
 
@@ -54,7 +126,7 @@ class DeviceStatusController:
                 elif not steam:
                     current_status = self.turn_steam_off(current_status)
 
-            new_status = CM_API.status
+            new_status = CM_API.get_status(fresh=True)
         except ValueError as err:
             raise ResourceException(status_code=404, message=str(err))
         finally:
@@ -66,6 +138,9 @@ class DeviceStatusController:
         if status.is_on():
             logger.info('Coffee Machine is already on.')
             return status
+        if status.device_runtime_state == DeviceRuntimeState.STARTUP:
+            logger.info('Coffee Machine is already starting.')
+            return status
         logger.info('Coffee Machine Runtime State: ON')
         CM_API.toggle_power()
         return CM_API.status
@@ -74,6 +149,9 @@ class DeviceStatusController:
         if status.is_off():
             logger.info('Coffee Machine is already off.')
             return status
+        if status.device_runtime_state == DeviceRuntimeState.SHUTDOWN:
+            logger.info('Coffee Machine is already shutting down.')
+            return status
         logger.info('Coffee Machine Runtime State: OFF')
         CM_API.toggle_power()
         return CM_API.status
@@ -124,4 +202,8 @@ class DeviceStatusController:
             return status
         logger.info('Coffee Machine Steam: OFF')
         CM_API.toggle_steam()
-        return CM_API.status
\ No newline at end of file
+        return CM_API.status
+
+
+def _get_event(event: str, event_id: int, data: dict) -> str:
+    return 'event: {0}\nid: {1}\ndata: {2}\n\n'.format(event, event_id, json.dumps(data))
@@ -0,0 +1,35 @@
+from models import DeviceTiming, DeviceActionTiming
+from core import CM_API, I2C_FINAL_DELAY, GPIO_OUT_PINS
+
+
+class DeviceTimingController:
+    def get_timing(self, token:str) -> DeviceTiming:
+        timing = CM_API.timing
+        buttons = []
+        for name in GPIO_OUT_PINS.keys():
+            if name == 'RELAIS':
+                continue
+            button = timing.button_timing(name)
+            buttons.append(DeviceActionTiming(
+                name=name,
+                samples=button.samples,
+                misses=button.misses,
+                ack_latency_in_sec=button.latency,
+                min_duration_in_sec=timing.press_min_duration(name),
+                max_duration_in_sec=timing.press_timeout(name)
+            ))
+        dac = timing.dac_timing()
+        return DeviceTiming(
+            button_press_duration_in_sec=timing.button_press_duration,
+            i2c_delay_in_sec=timing.i2c_delay,
+            i2c_final_delay_in_sec=I2C_FINAL_DELAY,
+            buttons=buttons,
+            dac=DeviceActionTiming(
+                name='DAC',
+                samples=dac.samples,
+                misses=dac.misses,
+                ack_latency_in_sec=dac.latency,
+                min_duration_in_sec=0,
+                max_duration_in_sec=timing.dac_timeout()
+            )
+        )
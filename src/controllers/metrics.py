@@ -0,0 +1,12 @@
+from utils.metrics import REGISTRY
+
+
+class MetricsController:
+    def get_metrics(self, source: str = None, state: dict = None) -> str:
+        # source and state are the metrics of the HTTP worker that asks, so they are up to date in the result
+        if not (source is None):
+            REGISTRY.merge(source, state)
+        return REGISTRY.render()
+
+    def merge_metrics(self, source: str, state: dict):
+        REGISTRY.merge(source, state)
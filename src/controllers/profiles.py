@@ -0,0 +1,23 @@
+from pathlib import Path
+from typing import List
+
+from models import Profile
+from config.environment_tools import get_profile_max_files
+from config.flask_config import ResourceNotFound
+from config.logger import get_log_dir
+from utils.profiling import RequestProfiler
+
+
+class ProfilesController:
+    def get_profiles(self, token: str) -> List[Profile]:
+        return [Profile(**profile) for profile in PROFILER.list()]
+
+    def get_profile_path(self, token: str, name: str) -> Path:
+        path = PROFILER.path(name)
+        if path is None:
+            raise ResourceNotFound('Aufzeichnung nicht gefunden.')
+        return path
+
+
+# Captures of all processes (HTTP workers) end up in the same directory
+PROFILER = RequestProfiler(directory=Path(get_log_dir()) / 'profiles', max_files=get_profile_max_files())
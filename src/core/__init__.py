@@ -1,20 +1,49 @@
+import atexit
+import copy
 import json
 import os
 import errno
+import re
 import requests
 import threading
 import time
 
-from typing import List
+from typing import Callable, List
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
 
-from models import DeviceSettings, DeviceStatus, DeviceRuntimeState
+from models import DeviceSettings, DeviceStatus, DeviceRuntimeState, DeviceWarning
 from config.logger import logging, get_logger_name
-from config.environment_tools import get_webapi_domain, get_webapi_port, get_ssl_ca_bundle
+from config.environment_tools import (
+    get_webapi_domain, get_webapi_port, get_ssl_ca_bundle, get_status_sample_interval, get_status_max_age, get_status_idle_time, get_gpio_read_mode,
+    get_gpio_sample_backend, get_gpio_native_library, get_webapi_pool_size, get_webapi_connect_timeout, get_webapi_read_timeout,
+    get_webapi_retries, get_status_history_file, get_status_history_size, get_fill_level_adc_address, get_fill_level_scan_interval, get_output_driver
+)
 from config.flask_config import ResourceException
-from core.gpio import set_gpio, RemoteGPIOSession, read_gpio_list, GPIORead
-from core.i2c import set_dac_value
-from core.exceptions import DeviceBlockedException
+from core.gpio import press_output, RemoteGPIOSession, read_gpio_list, read_gpio_mask, GPIOSnapshot, GPIOReadMode, GPIOEdgeMonitor, InterleavedGPIOSampler
+from core.i2c import I2CBusManager
+from core.exceptions import DeviceBlockedException, DACWriteException
+from core.hardware import configure_simulation
+from core.pins import PIN_CONFIGURATION
+from core.outbox import JobOutbox, OutboxEntry
+from core.lookup import LookupCache
+from core.sample_backend import load_sample_backend
+from core.snapshot import StatusCache, StatusDemand, StatusSampler, StatusSnapshot
+from core.history import StatusHistory
+from core.blink import BlinkDecoder, BlinkSampler, LEDPattern
+from core.fill_level import AnalogMultiplexer, ADS1115, FillLevelSensor, FillLevelScanner
+from core.outputs import OutputDriver, GPIOOutputDriver, ShiftRegisterOutputDriver
+from core.session import SessionSupervisor
+from core.timing import TimingCalibration
+from utils.auth import get_token_owner
+from utils.cache import SingleFlight
+from utils.metrics import GPIO_READ_SECONDS, BUTTON_PRESS_SECONDS, WEBAPI_REQUEST_SECONDS, DEVICE_BLOCKED_TOTAL, GPIO_FALLBACK_TOTAL
+from utils.files import atomic_write
+from utils.profiling import span
+from utils.basic import validate_percent_value
 
 
 logger = logging.getLogger(get_logger_name(__name__))
@@ -22,203 +51,460 @@ logger = logging.getLogger(get_logger_name(__name__))
 
 class CoffeeMachineHardwareAPI:
     _settings_file = Path('/data/coffee_machine_settings.json')
+    _timing_file = Path('/data/coffee_machine_timing.json')
 
     def __init__(self):
         self.file_path = CoffeeMachineHardwareAPI._settings_file
+        # GPIO session of the relay while a session is active, see SessionSupervisor
         self._session = None
+        self._settings = None
+        self._settings_lock = threading.RLock()
+        # (mtime, inode, size) of the settings file when it was loaded
+        self._settings_stamp = None
+        self._settings_checked_at = None
+        # Serializes every access to the GPIO pins (status reads, button presses, relais)
+        self.hardware_lock = threading.RLock()
+        # Buttons and relais, written through GPIOs or the shift register
+        self.outputs = _create_output_driver()
+        self._status_cache = StatusCache()
+        # Concurrent readers of a stale status share one hardware read
+        self._status_flight = SingleFlight()
+        # The samplers pause while nobody asks for the status
+        self.status_demand = StatusDemand(idle_time=STATUS_IDLE_TIME)
+        self._status_sampler = StatusSampler(read_status=self._read_hardware_status, cache=self._status_cache, interval=STATUS_SAMPLE_INTERVAL, demand=self.status_demand)
+        # LED states over time, opened by the process that monitors the status
+        self._history = None
+        # Tells blinking from steady LEDs. Status reads are too far apart to see a LED blink, so it has its own sampler
+        # and the status reads take the LEDs from its samples.
+        self._blink_decoder = BlinkDecoder(led_count=len(LED_NAMES), window=BLINK_WINDOW, capacity=BLINK_CAPACITY, min_changes=BLINK_MIN_CHANGES)
+        self._blink_sampler = BlinkSampler(read_mask=lambda: read_gpio_mask(gpio_numbers=LED_GPIOS), decoder=self._blink_decoder, interval=BLINK_SAMPLE_INTERVAL, demand=self.status_demand)
+        # Runtime state of the last status read, blinking dose LEDs are a startup after OFF and a shutdown after ON.
+        # The sampler and requests read the status concurrently, each read derives the state from the one before.
+        # Not the hardware lock, it is held for whole button presses.
+        self._runtime_state = None
+        self._runtime_state_lock = threading.Lock()
+        self._edge_monitor = None
+        if GPIO_READ_MODE == GPIOReadMode.EDGE:
+            self._edge_monitor = GPIOEdgeMonitor(gpio_numbers=list(GPIO_IN_PINS.values()), debounce_in_ms=LED_DEBOUNCE_IN_MS, hold_in_sec=LED_BLINK_HOLD_IN_SEC)
+        self._interleaved_sampler = None
+        if GPIO_READ_MODE == GPIOReadMode.INTERLEAVED:
+            backend = load_sample_backend(name=GPIO_SAMPLE_BACKEND, library_path=GPIO_NATIVE_LIBRARY)
+            self._interleaved_sampler = InterleavedGPIOSampler(gpio_numbers=list(GPIO_IN_PINS.values()), passes=SAMPLE_RATE, backend=backend)
+        # Learned button and DAC timings, BUTTON_PRESS_DURATION and I2C_DELAY are the upper bounds
+        self.timing = TimingCalibration(
+            file_path=CoffeeMachineHardwareAPI._timing_file,
+            button_press_duration=BUTTON_PRESS_DURATION,
+            button_press_min_duration=BUTTON_PRESS_MIN_DURATION,
+            i2c_delay=I2C_DELAY
+        )
+        # Monotonic time of the last DAC write, the machine needs I2C_FINAL_DELAY to take over new values
+        self._dac_written_at = None
+        self.i2c = I2CBusManager(cache_ttl=I2C_DAC_CACHE_TTL)
+        self._fill_level_scanner = None
+        if not (FILL_LEVEL_ADC_ADDRESS is None):
+            self._fill_level_scanner = FillLevelScanner(
+                multiplexer=AnalogMultiplexer(select_gpios=MUX_SELECT_PINS),
+                adc=ADS1115(i2c=self.i2c, bus_number=I2C_BUS_NUMBER, address=FILL_LEVEL_ADC_ADDRESS, input_number=FILL_LEVEL_ADC_INPUT),
+                sensors=[FillLevelSensor(name=name, channel=channel, empty_value=empty_value, full_value=full_value) for name, (channel, empty_value, full_value) in FILL_LEVEL_SENSORS.items()],
+                lock=self.hardware_lock,
+                interval=FILL_LEVEL_SCAN_INTERVAL,
+                settle_time=MUX_SETTLE_TIME,
+                smoothing=FILL_LEVEL_SMOOTHING,
+                max_age=FILL_LEVEL_SCAN_INTERVAL * FILL_LEVEL_MAX_MISSED_SCANS
+            )
+        self.session_supervisor = SessionSupervisor(
+            open_relay=self._open_relay,
+            close_relay=self._close_relay,
+            refresh_status=lambda: self.get_status(max_age=STATUS_MAX_AGE),
+            status_cache=self._status_cache,
+            refresh_interval=STATUS_MAX_AGE,
+            ready_stable_time=SESSION_READY_STABLE_TIME,
+            is_settled=self._is_settled,
+            max_release_wait=SESSION_MAX_RELEASE_WAIT
+        )
 
     @property
     def settings(self) -> DeviceSettings:
         self.read_settings()
-        return self._settings
+        return copy.copy(self._settings)
 
     @settings.setter
     def settings(self, new_settings: DeviceSettings):
         settings_as_dict = new_settings.__dict__
-        with open(self.file_path, 'w') as f:
-            json.dump(settings_as_dict, f)
-        self.read_settings()
+        with self._settings_lock:
+            atomic_write(self.file_path, json.dumps(settings_as_dict))
+            self._settings = DeviceSettings(**settings_as_dict)
+            self._settings_stamp = self._stat_settings()
+            self._settings_checked_at = time.monotonic()
 
     @property
     def status(self) -> DeviceStatus:
+        return self.get_status()
+
+    @property
+    def status_snapshot(self) -> StatusSnapshot:
+        return self._status_cache.snapshot
+
+    @property
+    def status_cache(self) -> StatusCache:
+        return self._status_cache
+
+    def get_status(self, max_age: float = None, fresh: bool = False) -> DeviceStatus:
+        self.status_demand.touch()
+        if max_age is None:
+            max_age = STATUS_MAX_AGE
+        if not fresh:
+            snapshot = self._status_cache.get(max_age=max_age)
+            if not (snapshot is None):
+                return snapshot.status
+            return self._status_flight.do('status', self._read_shared_status).status
         self.read_status()
         return self._status
 
+    def _read_shared_status(self) -> StatusSnapshot:
+        # Another reader may have published a snapshot while this one waited for the flight
+        snapshot = self._status_cache.get(max_age=STATUS_MAX_AGE)
+        if snapshot is None:
+            snapshot = self.read_status()
+        return snapshot
+
+    def get_status_snapshot(self) -> StatusSnapshot:
+        # Current snapshot, read from hardware only if none is recent enough
+        self.status_demand.touch()
+        return self._get_status_snapshot()
+
+    def refresh_status(self):
+        # Keeps the snapshot recent while the status is asked for, without counting as a request itself
+        if self.status_demand.is_active():
+            self._get_status_snapshot()
+
+    def _get_status_snapshot(self) -> StatusSnapshot:
+        snapshot = self._status_cache.get(max_age=STATUS_MAX_AGE)
+        if snapshot is None:
+            snapshot = self._status_flight.do('status', self._read_shared_status)
+        return snapshot
+
+    def wait_for_snapshot(self, version: int, timeout: float) -> StatusSnapshot:
+        # Returns the first snapshot with a status newer than version or the current one after the timeout.
+        # All waiting readers share the observations of the sampler, without it the hardware is read once per STATUS_MAX_AGE.
+        deadline = time.monotonic() + timeout
+        while True:
+            self.status_demand.touch()
+            remaining = deadline - time.monotonic()
+            snapshot = self._status_cache.wait_for_version(version=version, timeout=max(0, min(remaining, STATUS_MAX_AGE)))
+            if (not (snapshot is None) and snapshot.version > version) or remaining <= 0:
+                return snapshot
+            snapshot = self.get_status_snapshot()
+            if snapshot.version > version:
+                return snapshot
+
+    def wait_for_status(self, predicate: Callable[[DeviceStatus], bool], timeout: float) -> DeviceStatus:
+        # Returns the first status matching the predicate or None after the timeout, without polling the hardware itself
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._status_cache.snapshot
+            version = 0 if snapshot is None else snapshot.version
+            status = self.status
+            if predicate(status):
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._status_cache.wait_for_update(version=version, timeout=min(remaining, STATUS_MAX_AGE))
+
+    def configure_pins(self):
+        out_pins = self.outputs.pins()
+        if not (self._fill_level_scanner is None):
+            out_pins.update({pin: False for pin in MUX_SELECT_PINS})
+        with self.hardware_lock:
+            PIN_CONFIGURATION.configure(in_pins=list(GPIO_IN_PINS.values()), out_pins=out_pins)
+            # The shift register holds random values after power up
+            self.outputs.reset()
+        atexit.register(self.release_pins)
+
+    def release_pins(self):
+        self.stop_status_monitoring()
+        self.timing.flush()
+        with self.hardware_lock:
+            self.outputs.release()
+            PIN_CONFIGURATION.release()
+
+    @property
+    def history(self) -> StatusHistory:
+        return self._history
+
+    def start_status_monitoring(self):
+        if self._history is None:
+            history_file = get_status_history_file()
+            self._history = StatusHistory(capacity=get_status_history_size(), keepalive=STATUS_HISTORY_KEEPALIVE, file_path=Path(history_file) if history_file else None)
+        if not (self._edge_monitor is None):
+            with self.hardware_lock:
+                self._edge_monitor.start()
+        # The blink sampler reads the inputs without the hardware lock, the pins must not be set up and cleaned up by reads
+        if PIN_CONFIGURATION.are_inputs(LED_GPIOS):
+            self._blink_sampler.start()
+        if not (self._fill_level_scanner is None):
+            if all(PIN_CONFIGURATION.is_output(pin) for pin in MUX_SELECT_PINS):
+                self._fill_level_scanner.start()
+            else:
+                logger.warning('Multiplexer select lines are not configured, fill levels are not measured.')
+        self._status_sampler.start()
+
+    def stop_status_monitoring(self):
+        self._status_sampler.stop()
+        self._blink_sampler.stop()
+        if not (self._fill_level_scanner is None):
+            self._fill_level_scanner.stop()
+        if not (self._edge_monitor is None):
+            with self.hardware_lock:
+                self._edge_monitor.stop()
+        history = self._history
+        self._history = None
+        if not (history is None):
+            history.close()
+
     def init_settings(self):
         if self.file_path.exists():
-            logger.debug('{file} found.'.format(file=self.file_path))
+            logger.debug('%s found.', self.file_path)
             return
-        logger.debug('{file} not found. Initializing with default settings.'.format(file=self.file_path))
+        logger.debug('%s not found. Initializing with default settings.', self.file_path)
         self.settings = DeviceSettings()
 
-    def read_settings(self):
-        if not self.file_path.exists():
-            self.init_settings()
-        logger.debug('Reading config from: {file} '.format(file=self.file_path))
-        with open(self.file_path, 'r') as f:
-            settings_as_dict = json.load(f)
-            settings = DeviceSettings(**settings_as_dict)
-            self._settings = settings
+    def read_settings(self, force: bool = False):
+        with self._settings_lock:
+            # The file is only checked for changes every few seconds
+            now = time.monotonic()
+            checked_at = self._settings_checked_at
+            if not force and not (self._settings is None) and not (checked_at is None) and now - checked_at < SETTINGS_CHECK_INTERVAL:
+                return
+            self._settings_checked_at = now
+
+            stamp = self._stat_settings()
+            if stamp is None:
+                self.init_settings()
+                return
+            if not force and stamp == self._settings_stamp:
+                return
+            logger.debug('Reading config from: %s ', self.file_path)
+            with open(self.file_path, 'r') as f:
+                settings_as_dict = json.load(f)
+                settings = DeviceSettings(**settings_as_dict)
+                self._settings = settings
+            self._settings_stamp = stamp
+
+    def _stat_settings(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
     
-    def read_status(self):
-        gpio_numbers = list(GPIO_IN_PINS.values())
-        session = self._session
-        reads = read_gpio_list(gpio_numbers=gpio_numbers, sample_rate=SAMPLE_RATE, check_cycles=CHECK_CYCLES, session=session)
-        status = DeviceStatus()
-
-        # Check water LED
-        water_gpio = GPIO_IN_PINS['WATER']
-        water_led = self._read_single_status(gpio_reads=reads, gpio_number=water_gpio, fallback=True, status_name='Water LED')
-        
-        # Check coffee grounds LED
-        coffee_grounds_gpio = GPIO_IN_PINS['COFFEE_GROUNDS_CONTAINER']
-        coffee_grounds_led = self._read_single_status(gpio_reads=reads, gpio_number=coffee_grounds_gpio, fallback=True, status_name='Coffee Grounds Container LED')
-
-        # Check one dose LED
-        one_dose_gpio = GPIO_IN_PINS['ONE_DOSE']
-        one_dose_led = self._read_single_status(gpio_reads=reads, gpio_number=one_dose_gpio, fallback=False, status_name='One Dose LED')
-
-        # Check two doses LED
-        two_doses_gpio = GPIO_IN_PINS['TWO_DOSES']
-        two_doses_led = self._read_single_status(gpio_reads=reads, gpio_number=two_doses_gpio, fallback=False, status_name='Two Doses LED')
-
-        # Check warning LED
-        warning_gpio = GPIO_IN_PINS['WARNING']
-        warning_led = self._read_single_status(gpio_reads=reads, gpio_number=warning_gpio, fallback=True, status_name='Warning LED')
-
-        # Steam LED
-        steam_gpio = GPIO_IN_PINS['STEAM']
-        steam_led = self._read_single_status(gpio_reads=reads, gpio_number=steam_gpio, fallback=False, status_name='Steam LED')
-
-        # Check maintenance LED
-        maintenance_gpio = GPIO_IN_PINS['MAINTENANCE']
-        maintenance_led = self._read_single_status(gpio_reads=reads, gpio_number=maintenance_gpio, fallback=True, status_name='Maintenance LED')
-
-        # Check eco LED
-        eco_gpio = GPIO_IN_PINS['ECO']
-        eco_led = self._read_single_status(gpio_reads=reads, gpio_number=eco_gpio, fallback=False, status_name='Eco LED')
-
-        # Set status
-        status.water_tank_ready = water_led is False
-        status.coffee_grounds_container_ready = coffee_grounds_led is False
-        status.device_eco_mode = eco_led
-        status.device_maintenance = maintenance_led
-        status.device_steam = steam_led
-        
-        is_on = one_dose_led and two_doses_led
-        runtime_state = DeviceRuntimeState.ON if is_on else DeviceRuntimeState.OFF
-        status.coffee_machine_runtime_state = runtime_state.state_id
-        
-        is_ready = status.water_tank_ready and status.coffee_grounds_container_ready and is_on
-        status.device_ready = is_ready
-
+    def read_status(self) -> StatusSnapshot:
+        with span('status'):
+            status = self._read_hardware_status()
+        snapshot = self._status_cache.publish(status)
         self._status = status
+        return snapshot
+
+    def _read_hardware_status(self) -> DeviceStatus:
+        leds = self._resolve_leds(self._read_leds())
+
+        history = self._history
+        if not (history is None):
+            history.record(leds)
+
+        # Copy of the precomputed status of this LED combination, the lists are the only mutable fields
+        status = copy.copy(STATUS_TABLE[leds])
+        with self._runtime_state_lock:
+            patterns = self._blink_decoder.decode() if self._blink_sampler.is_running() else None
+            if patterns is None:
+                runtime_state = status.device_runtime_state
+                status.device_warnings = list(status.device_warnings)
+            else:
+                decoded = dict(zip(LED_NAMES, patterns))
+                runtime_state = _get_runtime_state(leds=decoded, previous=self._runtime_state)
+                # Brewing blinks a dose LED, the machine is ready once both are steady on
+                doses_steady = all(decoded[name].state == LEDPattern.ON and decoded[name].age >= BLINK_SETTLE_TIME for name in ('ONE_DOSE', 'TWO_DOSES'))
+                status.device_ready = status.water_tank_ready and status.coffee_grounds_container_ready and runtime_state == DeviceRuntimeState.ON and doses_steady
+                status.device_warnings = _get_warnings(leds=decoded)
+            self._runtime_state = runtime_state
+        status.coffee_machine_runtime_state = runtime_state.state_id
 
-    def _read_single_status(self, gpio_reads: List[GPIORead], gpio_number: int, fallback: bool, status_name: str) -> bool:
-        logger.debug('Start checking {}'.format(status_name))
-        filtered_gpio_read = list((r for r in gpio_reads if r.gpio_number == gpio_number))
-
-        return_value = fallback
-        if len(filtered_gpio_read) > 0:
-            gpio_read = filtered_gpio_read[0]
-            return_value = gpio_read.value
-        else:
-            logger.debug('GPIO {0} status was not found in result list. Returning fallback: {1}'.format(gpio_number, fallback))
-        logger.debug('Check of {0} (GPIO {1}) done: {2}'.format(status_name, gpio_number, return_value))
-
-        return return_value
+        scanner = self._fill_level_scanner
+        if not (scanner is None):
+            levels = scanner.levels()
+            status.water_tank_fill_level_in_percent = levels.get('WATER')
+            status.coffee_bean_container_fill_level_in_percent = levels.get('COFFEE_BEANS')
+            status.coffee_grounds_container_fill_level_in_percent = levels.get('COFFEE_GROUNDS')
+            # The machine has no LED for the beans
+            bean_level = status.coffee_bean_container_fill_level_in_percent
+            if not (bean_level is None):
+                status.coffee_bean_container_ready = bean_level > COFFEE_BEANS_EMPTY_LEVEL
+
+        return status
+
+    def _read_leds(self) -> GPIOSnapshot:
+        # The blink sampler reads the LEDs anyway, the status takes them from its samples instead of reading them a second time.
+        # The GPIOs are only read here until its samples cover LED_BLINK_HOLD_IN_SEC or without the sampler.
+        if self._blink_sampler.is_running():
+            snapshot = self._blink_decoder.recent(hold=LED_BLINK_HOLD_IN_SEC)
+            if not (snapshot is None):
+                return snapshot
+        edge_monitor = self._edge_monitor
+        if not (edge_monitor is None) and edge_monitor.is_started():
+            with GPIO_READ_SECONDS.time(GPIOReadMode.EDGE.mode_str):
+                return edge_monitor.read(gpio_numbers=LED_GPIOS)
+        with self.hardware_lock:
+            session = self._session
+            if not (self._interleaved_sampler is None):
+                with GPIO_READ_SECONDS.time(GPIOReadMode.INTERLEAVED.mode_str):
+                    return self._interleaved_sampler.read(check_cycles=CHECK_CYCLES, session=session)
+            with GPIO_READ_SECONDS.time(GPIOReadMode.POLL.mode_str):
+                return read_gpio_list(gpio_numbers=LED_GPIOS, sample_rate=SAMPLE_RATE, check_cycles=CHECK_CYCLES, session=session)
+
+    def _resolve_leds(self, snapshot: GPIOSnapshot) -> int:
+        # LED bitmask in the order of LED_NAMES, LEDs without a reliable read get their fallback value
+        missing = LED_MASK & ~snapshot.known
+        if missing:
+            for bit, gpio in enumerate(LED_GPIOS):
+                if missing & (1 << bit):
+                    GPIO_FALLBACK_TOTAL.inc(gpio)
+            logger.debug('LEDs %#04x were not read reliably. Using fallback: %#04x', missing, LED_FALLBACK_MASK & missing)
+        if snapshot.uncertain:
+            logger.debug('LEDs %#04x read with confidence below 1', snapshot.uncertain)
+        leds = snapshot.resolve(fallback=LED_FALLBACK_MASK)
+        logger.debug('LEDs read: %#04x', leds)
+        return leds
+
+    def _is_settled(self, status: DeviceStatus) -> bool:
+        # A closed session keeps the relay until the machine is ready or waits for the user.
+        # OFF is only trusted from the blink decoder, single reads of blinking dose LEDs can look like OFF.
+        if status.device_ready or len(status.device_warnings) > 0:
+            return True
+        return self._blink_sampler.is_running() and status.device_runtime_state == DeviceRuntimeState.OFF
 
-    def use_session(self, session):
-        # If you want to start a new session, but the old session is still active
-        if (not (session is None)) and (not (self._session is None)):
-            raise DeviceBlockedException
-        self._session = session
+    @property
+    def has_session(self) -> bool:
+        return not self.session_supervisor.is_idle()
+
+    def _open_relay(self):
+        gpio_session = RemoteGPIOSession(outputs=self.outputs, relais_name='RELAIS', relais_value=not OUTPUT_IDLE_VALUES['RELAIS'])
+        with self.hardware_lock:
+            gpio_session.open()
+            self._session = gpio_session
+
+    def _close_relay(self):
+        with self.hardware_lock:
+            gpio_session = self._session
+            self._session = None
+            if not (gpio_session is None):
+                gpio_session.close()
 
     def set_water_in_percent(self, water_in_percent: int):
-        address = I2C_ADDRESS_MAPPINGS['WATER']
-        sensor_name = 'Water'
-        bus_number = I2C_BUS_NUMBER
-        try:
-            set_dac_value(bus_number=bus_number, address=address, percent_value=water_in_percent, i2c_delay=I2C_DELAY, sensor_name=sensor_name)
-        except ValueError as err:
-            raise ResourceException(status_code=400, message='Percent value of sensor {0} is invalid: {1}'.format(sensor_name, water_in_percent))
+        self.set_dac_values_in_percent(water_in_percent=water_in_percent)
     
     def set_coffee_strength_in_percent(self, coffee_strength_in_percent: int):
-        address = I2C_ADDRESS_MAPPINGS['COFFEE_STRENGTH']
-        sensor_name = 'Coffee Strength'
-        bus_number = I2C_BUS_NUMBER
+        self.set_dac_values_in_percent(coffee_strength_in_percent=coffee_strength_in_percent)
+
+    def set_dac_values_in_percent(self, water_in_percent: int = None, coffee_strength_in_percent: int = None):
+        # Both DACs are written in one batch, unchanged values are skipped. Raises DACWriteException if a DAC failed.
+        percent_values = {}
+        sensor_names = {}
+        for name, sensor_name, percent_value in (('WATER', 'Water', water_in_percent), ('COFFEE_STRENGTH', 'Coffee Strength', coffee_strength_in_percent)):
+            if percent_value is None:
+                continue
+            try:
+                validate_percent_value(value=percent_value)
+            except ValueError as err:
+                raise ResourceException(status_code=400, message='Percent value of sensor {0} is invalid: {1}'.format(sensor_name, percent_value))
+            address = I2C_ADDRESS_MAPPINGS[name]
+            percent_values[address] = percent_value
+            sensor_names[address] = sensor_name
+        if len(percent_values) == 0:
+            return
+
+        # The writes end as soon as the DACs hold the values, the learned timeout replaces I2C_DELAY for DACs that cannot be read back
         try:
-            set_dac_value(bus_number=bus_number, address=address, percent_value=coffee_strength_in_percent, i2c_delay=I2C_DELAY, sensor_name=sensor_name)
-        except ValueError as err:
-            raise ResourceException(status_code=400, message='Percent value of sensor {0} is invalid: {1}'.format(sensor_name, coffee_strength_in_percent))
+            with span('dac'):
+                acks = self.i2c.set_dac_values(bus_number=I2C_BUS_NUMBER, percent_values=percent_values, i2c_delay=self.timing.dac_timeout(), sensor_names=sensor_names, verify=True)
+        except DACWriteException:
+            # Other DACs may have been written, the final delay is kept to be safe
+            self._dac_written_at = time.monotonic()
+            raise
+        if len(acks) > 0:
+            self._dac_written_at = time.monotonic()
+        for ack in acks.values():
+            self.timing.record_dac_write(ack)
 
     def make_coffee(self, doses: int):
         if doses == 1:
-            pin = GPIO_OUT_PINS['ONE_DOSE']
+            name = 'ONE_DOSE'
         elif doses == 2:
-            pin = GPIO_OUT_PINS['TWO_DOSES']
+            name = 'TWO_DOSES'
         else:
             msg = 'Kaffeeauftrag mit {doses} Dosen nicht möglich.'.format(doses=doses)
             logger.error(msg)
             raise ResourceException(status_code=405, message=msg)
-        time.sleep(I2C_FINAL_DELAY)
-        self.press_button(pin = pin)
+        # Only the part of the final delay that has not passed since the last DAC write is left
+        if not (self._dac_written_at is None):
+            remaining = I2C_FINAL_DELAY - (time.monotonic() - self._dac_written_at)
+            if remaining > 0:
+                time.sleep(remaining)
+        self.press_button(name = name)
     
     def toggle_power(self):
-        pin = GPIO_OUT_PINS['POWER']
-        self.press_button(pin = pin)
+        self.press_button(name = 'POWER')
     
     def toggle_eco(self):
-        pin = GPIO_OUT_PINS['ECO']
-        self.press_button(pin = pin)
+        self.press_button(name = 'ECO')
     
     def toggle_steam(self):
-        pin = GPIO_OUT_PINS['STEAM']
-        self.press_button(pin = pin)
+        self.press_button(name = 'STEAM')
     
     def toggle_maintenance(self):
-        pin = GPIO_OUT_PINS['MAINTENANCE']
-        self.press_button(pin = pin)
-
-    def press_button(self, pin: int):
-        session = self._session
-        set_gpio(gpio_number=pin, value=False, duration_in_sec=BUTTON_PRESS_DURATION, session=session)
+        self.press_button(name = 'MAINTENANCE')
+
+    def press_button(self, name: str):
+        # The button is released once its LEDs changed, at the latest after the learned or the maximum press duration
+        ack_pins = [GPIO_IN_PINS[led] for led in BUTTON_ACK_LEDS.get(name, [])]
+        with self.hardware_lock:
+            session = self._session
+            # Edge monitoring owns the input pins, they must not be set up or cleaned up again
+            configure_inputs = self._edge_monitor is None or not self._edge_monitor.is_started()
+            with BUTTON_PRESS_SECONDS.time(name), span('press'):
+                ack = press_output(
+                    outputs=self.outputs,
+                    name=name,
+                    duration_in_sec=self.timing.press_timeout(name),
+                    ack_gpio_numbers=ack_pins,
+                    min_duration_in_sec=self.timing.press_min_duration(name),
+                    poll_interval_in_sec=BUTTON_ACK_POLL_INTERVAL,
+                    session=session,
+                    configure_inputs=configure_inputs
+                )
+        logger.debug('Button %s acknowledged after %s seconds.', name, ack)
+        self.timing.record_press(name, ack)
     
 
 class RemoteSession:
     def __init__(self, cm_hw_api: CoffeeMachineHardwareAPI, *args, **kwargs):
         self._api = cm_hw_api
-        _relais_gpio = GPIO_OUT_PINS['RELAIS'] 
-        self._gpio_session = RemoteGPIOSession(relais_gpio=_relais_gpio, relais_value=True)
     
     def open(self):
         try:
-            self._api.use_session(self)
+            self._api.session_supervisor.acquire(self)
         except DeviceBlockedException:
+            DEVICE_BLOCKED_TOTAL.inc()
             raise ResourceException(status_code=405, message='Gerät ist aktuell belegt.')
-        self._gpio_session.open()
+
+    def try_open(self) -> bool:
+        # Like open, but returns False instead of raising if the device is in use
+        return self._api.session_supervisor.try_acquire(self)
     
     def close(self):
-        thread = threading.Thread(target=self.close_in_background_if_device_is_ready)
-        thread.daemon = True
-        thread.start()
-    
-    def close_in_background_if_device_is_ready(self):
-        seconds_to_wait = 2
-        max_seconds = 45
-        current_seconds = 0
-        while not self._api.status.device_ready:
-            logger.debug('Device is not ready. Waiting {0} seconds. (Waited total: {1})'.format(seconds_to_wait, current_seconds))
-            time.sleep(seconds_to_wait)
-            current_seconds = current_seconds + seconds_to_wait
-            if current_seconds >= max_seconds:
-                logger.debug('Reached maximum seconds: {0} ({1})'.format(max_seconds, current_seconds))
-                break
-        logger.debug('Closing session after {0} seconds.'.format(current_seconds))
-        self._api.use_session(None)
-        self._gpio_session.close()
+        # The supervisor releases the relay once the device is ready again
+        self._api.session_supervisor.release(self)
 
-    
 
 I2C_BUS_NUMBER = 1
 
@@ -227,10 +513,48 @@ I2C_ADDRESS_MAPPINGS = {
     'COFFEE_STRENGTH': 0x61
 }
 
+# Maximum time in seconds a DAC takes to hold a written value, writes end earlier once the value was read back
 I2C_DELAY = 0.05
 
+# Time in seconds the machine needs to take over new DAC values before brewing
 I2C_FINAL_DELAY = 0.3
 
+# Seconds a DAC value written before is trusted, after that an unchanged value is written again
+I2C_DAC_CACHE_TTL = 600
+
+# I2C address of the ADS1115 at the common pin of the 74HC4051 multiplexer (ST2 "Analog In"), None: fill levels are not measured
+FILL_LEVEL_ADC_ADDRESS = get_fill_level_adc_address()
+
+# ADS1115 input (AIN0 to AIN3) wired to the multiplexer
+FILL_LEVEL_ADC_INPUT = 0
+
+# GPIOs of the multiplexer select lines A, B and C (ST2 pins 6 S0/Strobe, 8 S1/Data and 7 S2/CP).
+# Not verified: the circuit diagram gives no GPIO for these lines, 23, 25 and 8 are the ST1 pins without a function label.
+MUX_SELECT_PINS = [23, 25, 8]
+
+# Seconds a switched multiplexer channel needs before the ADC input follows the new sensor
+MUX_SETTLE_TIME = 0.0005
+
+# Sensor => (multiplexer channel, ADC value of the empty container, ADC value of the full container).
+# Not verified: the circuit diagram does not show which channel a sensor is wired to, nor its range.
+FILL_LEVEL_SENSORS = {
+    'WATER': (5, 0, 26400),
+    'COFFEE_BEANS': (6, 0, 26400),
+    'COFFEE_GROUNDS': (7, 0, 26400)
+}
+
+# Interval of the fill level scans in seconds
+FILL_LEVEL_SCAN_INTERVAL = get_fill_level_scan_interval()
+
+# Weight of a new reading in the smoothed fill level (exponential moving average)
+FILL_LEVEL_SMOOTHING = 0.3
+
+# A sensor missing this many scans in a row has an unknown fill level
+FILL_LEVEL_MAX_MISSED_SCANS = 3
+
+# Fill level in percent at or below which the bean container is not ready
+COFFEE_BEANS_EMPTY_LEVEL = 5
+
 # GPIO-OUT mappings
 GPIO_OUT_PINS = {
     'ONE_DOSE': 27,
@@ -242,6 +566,30 @@ GPIO_OUT_PINS = {
     'RELAIS': 21
 }
 
+# Buttons are pressed with LOW and idle HIGH, the relais is active with HIGH and idles LOW
+OUTPUT_IDLE_VALUES = {name: name != 'RELAIS' for name in GPIO_OUT_PINS.keys()}
+
+# "gpio" drives the outputs through GPIO_OUT_PINS, "shift_register" shifts all of them into the 74HC4094 of the device board
+OUTPUT_DRIVER = get_output_driver()
+
+# GPIOs of the 74HC4094 strobe, data and clock inputs
+SHIFT_REGISTER_PINS = {
+    'STROBE': 7,
+    'DATA': 10,
+    'CLOCK': 11
+}
+
+# Output => parallel output (QP0 to QP7) of the 74HC4094
+SHIFT_REGISTER_OUTPUTS = {
+    'ONE_DOSE': 0,
+    'TWO_DOSES': 1,
+    'STEAM': 2,
+    'ECO': 3,
+    'POWER': 4,
+    'MAINTENANCE': 5,
+    'RELAIS': 6
+}
+
 # GPIO-IN mappings
 GPIO_IN_PINS = {
     'ECO': 6,
@@ -254,7 +602,27 @@ GPIO_IN_PINS = {
     'COFFEE_GROUNDS_CONTAINER': 19 
 }
 
+# Bit order of the LEDs in history records and blink decoder samples
+LED_NAMES = list(GPIO_IN_PINS.keys())
+
+LED_GPIOS = [GPIO_IN_PINS[name] for name in LED_NAMES]
+
+LED_MASK = (1 << len(LED_NAMES)) - 1
+
+# Value of a LED that could not be read reliably, LEDs that block the machine are taken as on
+LED_FALLBACKS = {
+    'ECO': False,
+    'MAINTENANCE': True,
+    'WARNING': True,
+    'STEAM': False,
+    'TWO_DOSES': False,
+    'ONE_DOSE': False,
+    'WATER': True,
+    'COFFEE_GROUNDS_CONTAINER': True
+}
+
 # Reads a single GPIO-IN signal X amount of times and then continues with the next GPIO-IN signal
+# In interleaved mode: number of passes over all GPIO-IN signals, split evenly between the check cycles
 SAMPLE_RATE = 500
 
 # 1 x "Check cycle" = read a list of GPIO-IN signals 1 time
@@ -263,8 +631,102 @@ SAMPLE_RATE = 500
 # Higher check cycles will increase the accuracy but also increase the duration of the operation
 CHECK_CYCLES = 5
 
+# Maximum duration of a button press in seconds, presses end earlier once the machine acknowledged them
 BUTTON_PRESS_DURATION = 2
 
+# Minimum duration of a button press in seconds, LED changes before are not taken as acknowledgement
+BUTTON_PRESS_MIN_DURATION = 0.25
+
+# Interval in seconds in which the LEDs are checked for an acknowledgement while a button is pressed
+BUTTON_ACK_POLL_INTERVAL = 0.01
+
+# LEDs (GPIO-IN) that change when the machine recognized a button (GPIO-OUT)
+BUTTON_ACK_LEDS = {
+    'ONE_DOSE': ['ONE_DOSE', 'TWO_DOSES'],
+    'TWO_DOSES': ['ONE_DOSE', 'TWO_DOSES'],
+    'STEAM': ['STEAM'],
+    'ECO': ['ECO'],
+    'POWER': ['ONE_DOSE', 'TWO_DOSES'],
+    'MAINTENANCE': ['MAINTENANCE']
+}
+
+# "poll" samples the GPIO-IN signals on every read, "edge" maintains them with edge detection callbacks,
+# "interleaved" samples all GPIO-IN signals in each pass and lets the check cycles vote on the result
+GPIO_READ_MODE = GPIOReadMode.from_str(get_gpio_read_mode())
+
+# "python" samples with RPi.GPIO, "native" with the pigpio based library built from c_lib/read_gpio.c (interleaved mode only)
+GPIO_SAMPLE_BACKEND = get_gpio_sample_backend()
+
+GPIO_NATIVE_LIBRARY = get_gpio_native_library()
+
+# Edges within this window after a previous edge are ignored (edge mode only)
+LED_DEBOUNCE_IN_MS = 5
+
+# A LED that was HIGH within this window is reported as on, so blinking LEDs count as on (edge mode and the samples of the blink sampler)
+LED_BLINK_HOLD_IN_SEC = 1.5
+
+# Interval in seconds in which the blink decoder samples the LEDs, well below the 0.25 seconds a blinking LED is on or off
+BLINK_SAMPLE_INTERVAL = 0.02
+
+# Seconds of LED samples the blink decoder looks at, long enough for the slowest blink (1 second period) to change twice
+BLINK_WINDOW = 2.0
+
+# Changes within the window that make a LED blinking, a single change is a LED that was switched on or off
+BLINK_MIN_CHANGES = 2
+
+BLINK_CAPACITY = int(BLINK_WINDOW / BLINK_SAMPLE_INTERVAL) * 2
+
+# A dose LED that changed within this time may start to blink, the runtime state is kept until it settled (seconds)
+BLINK_SETTLE_TIME = 0.6
+
+# The settings file is checked for external changes at most once per interval (seconds)
+SETTINGS_CHECK_INTERVAL = 2
+
+# Seconds the device must report ready before the relay of a closed session is released (blinking LEDs are not ready)
+SESSION_READY_STABLE_TIME = 1.0
+
+# Maximum seconds a closed session waits for the device to become ready before the relay is released anyway
+SESSION_MAX_RELEASE_WAIT = 45
+
+# Maximum number of queued jobs
+BREW_QUEUE_MAX_SIZE = 10
+
+# Seconds a queued job waits for the machine to become ready before it fails
+BREW_READY_TIMEOUT = 120
+
+# Initial estimate of the seconds between the starts of two back to back jobs, adjusted with every job
+BREW_CYCLE_ESTIMATE = 60
+
+# Interval of the background status sampler in seconds
+STATUS_SAMPLE_INTERVAL = get_status_sample_interval()
+
+# Maximum age of a cached status snapshot in seconds before it is read from hardware again
+STATUS_MAX_AGE = get_status_max_age()
+
+# Seconds without a status request after which the status and blink samplers pause
+STATUS_IDLE_TIME = get_status_idle_time()
+
+# Seconds without a status change after which a heartbeat is sent to status stream clients
+STATUS_STREAM_HEARTBEAT = 15
+
+# Milliseconds status stream clients wait before they reconnect
+STATUS_STREAM_RETRY = 3000
+
+# Default and maximum seconds a long poll waits for a new status
+STATUS_POLL_TIMEOUT = 30
+
+STATUS_POLL_MAX_TIMEOUT = 60
+
+# The LED history gets a record at least every STATUS_HISTORY_KEEPALIVE seconds, longer gaps are times without status reads
+STATUS_HISTORY_KEEPALIVE = 60
+
+# Default range in seconds, default and maximum number of points of a status history query
+STATUS_HISTORY_RANGE = 3600
+
+STATUS_HISTORY_POINTS = 60
+
+STATUS_HISTORY_MAX_POINTS = 1000
+
 ROUTES = {
     'COFFEE_MACHINE': '{base_url}/api/coffee/machines/{id}',
     'COFFEE_PRODUCT': '{base_url}/api/coffee/products/{id}',
@@ -273,13 +735,57 @@ ROUTES = {
     'IS_ADMIN': '{base_url}/api/users'
 }
 
+# Coffee machines and products are served from the cache for LOOKUP_FRESH_TTL seconds,
+# afterwards they are revalidated in the background while the cached data is still returned (up to LOOKUP_STALE_TTL)
+LOOKUP_FRESH_TTL = 60
+
+LOOKUP_STALE_TTL = 60 * 60
+
+# Backoff between retries of WebAPI requests: factor * 2^(retry - 1) seconds
+WEBAPI_RETRY_BACKOFF_FACTOR = 0.3
+
 
 class WebAPI:
-    def __init__(self, domain: str, port: int, ssl_ca_bundle: str):
+    def __init__(self, domain: str, port: int, ssl_ca_bundle: str, pool_size: int = 4, connect_timeout: float = 3.05, read_timeout: float = 10, retries: int = 2):
         self._domain = domain
         self._port = port
         self._ssl_ca_bundle = ssl_ca_bundle
-    
+        self._timeout = (connect_timeout, read_timeout)
+        self._session = self._create_session(pool_size=pool_size, retries=retries)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='webapi')
+        self._lookups = LookupCache(fetch=self._fetch_lookup, executor=self._executor, fresh_ttl=LOOKUP_FRESH_TTL, stale_ttl=LOOKUP_STALE_TTL)
+
+    def _create_session(self, pool_size: int, retries: int) -> requests.Session:
+        # Connection errors are retried for every method, reads and 5xx responses only for idempotent ones
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=WEBAPI_RETRY_BACKOFF_FACTOR,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.verify = self._ssl_ca_bundle
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def warm_up(self):
+        # Opens a pooled connection (incl. TLS handshake) in the background, so the first request doesn't pay for it
+        def _warm_up():
+            try:
+                self._session.head(self.url, timeout=self._timeout)
+                logger.info('WebAPI connection established: %s', self.url)
+            except requests.RequestException as err:
+                logger.warning('WebAPI warm-up failed: %s', err)
+        thread = threading.Thread(target=_warm_up, name='webapi-warm-up')
+        thread.daemon = True
+        thread.start()
+
     @property
     def url(self):
         return '{domain}:{port}'.format(domain=self._domain, port=self._port)
@@ -305,24 +811,63 @@ class WebAPI:
         coffee_product_response = self.get(coffee_product_url, token)
         return coffee_product_response
 
+    def lookup_coffee_machine(self, token: str, coffee_machine_id: int) -> dict:
+        coffee_machine_url = ROUTES['COFFEE_MACHINE'].format(base_url=self.url, id=coffee_machine_id)
+        return self._lookups.get(token, coffee_machine_url)
+
+    def lookup_coffee_product(self, token: str, coffee_product_id: int) -> dict:
+        coffee_product_url = ROUTES['COFFEE_PRODUCT'].format(base_url=self.url, id=coffee_product_id)
+        return self._lookups.get(token, coffee_product_url)
+
+    def peek_coffee_product(self, token: str, coffee_product_id: int) -> dict:
+        coffee_product_url = ROUTES['COFFEE_PRODUCT'].format(base_url=self.url, id=coffee_product_id)
+        return self._lookups.peek(token, coffee_product_url)
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        # Runs a WebAPI call on the pool of the WebAPI, e.g. to issue independent calls concurrently
+        return self._executor.submit(func, *args, **kwargs)
+
+    def _fetch_lookup(self, token: str, url: str, etag: str):
+        headers = {"x-access-token":token}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self._request('GET', url, headers=headers)
+        new_etag = response.headers.get('ETag')
+        if response.status_code == 304:
+            return None, new_etag
+        self._check_response(response)
+        return response.json(), new_etag
+
     def create_job(self, token: str, job_json):
         create_job_url = ROUTES['CREATE_JOB'].format(base_url=self.url)
         return self.post(create_job_url, token, job_json)
     
     def get(self, url: str, token: str):
         headers = {"x-access-token":token}
-        verify = self._ssl_ca_bundle
-        response = requests.get(url, headers=headers, verify=verify)
+        response = self._request('GET', url, headers=headers)
         self._check_response(response)
         return response
     
     def post(self, url: str, token: str, json=None):
         headers = {"x-access-token":token}
-        verify = self._ssl_ca_bundle
-        response = requests.post(url, headers=headers, verify=verify, json=json)
+        response = self._request('POST', url, headers=headers, json=json)
         self._check_response(response)
         return response
 
+    def _request(self, method: str, url: str, **kwargs):
+        try:
+            with WEBAPI_REQUEST_SECONDS.time(_get_route_name(url), method):
+                return self._session.request(method, url, timeout=self._timeout, **kwargs)
+        except requests.Timeout as err:
+            logger.error('WebAPI request timed out: %s %s (%s)', method, url, err)
+            raise ResourceException(status_code=504, message='WebAPI antwortet nicht.')
+        except requests.ConnectionError as err:
+            if _is_read_timeout(err):
+                logger.error('WebAPI request timed out: %s %s (%s)', method, url, err)
+                raise ResourceException(status_code=504, message='WebAPI antwortet nicht.')
+            logger.error('WebAPI not reachable: %s %s (%s)', method, url, err)
+            raise ResourceException(status_code=503, message='WebAPI ist nicht erreichbar.')
+
     def _check_response(self, response):
         status_code = response.status_code
         if 200 <= status_code <= 302:
@@ -330,6 +875,128 @@ class WebAPI:
         json_obj = response.json()
         raise ResourceException(status_code=status_code, message=json_obj['message'])
 
+
+def _is_read_timeout(err: requests.ConnectionError) -> bool:
+    # Read timeouts that used up all retries are raised as connection errors
+    reason = err.args[0] if err.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, ReadTimeoutError)
+
+
+def _get_route_name(url: str) -> str:
+    # Name of the entry in ROUTES the url was built from, urls of the WebAPI are matched without their base url
+    global _ROUTE_PATTERNS
+    if _ROUTE_PATTERNS is None:
+        _ROUTE_PATTERNS = [(name, re.compile(re.escape(route).replace(re.escape('{base_url}'), '.*?').replace(re.escape('{id}'), '[^/]+') + '$')) for name, route in ROUTES.items()]
+    for name, pattern in _ROUTE_PATTERNS:
+        if pattern.match(url):
+            return name
+    return 'OTHER'
+
+
+_ROUTE_PATTERNS = None
+
+
+def _pack_leds(leds: dict) -> int:
+    # One bit per LED in the order of LED_NAMES
+    mask = 0
+    for bit, name in enumerate(LED_NAMES):
+        if leds[name]:
+            mask = mask | (1 << bit)
+    return mask
+
+
+def _get_runtime_state(leds: dict, previous: DeviceRuntimeState) -> DeviceRuntimeState:
+    # leds: LED name => LEDPattern
+    one_dose = leds['ONE_DOSE']
+    two_doses = leds['TWO_DOSES']
+    if one_dose.state == LEDPattern.BLINKING and two_doses.state == LEDPattern.BLINKING:
+        # Both dose LEDs blink while the machine heats up and while it rinses before it turns off
+        if previous in (DeviceRuntimeState.ON, DeviceRuntimeState.SHUTDOWN):
+            return DeviceRuntimeState.SHUTDOWN
+        return DeviceRuntimeState.STARTUP
+    if not (previous is None) and min(one_dose.age, two_doses.age) < BLINK_SETTLE_TIME:
+        # The first change of a blinking LED looks like a switched one
+        return previous
+    # A single blinking dose LED is a brew
+    if one_dose.is_lit or two_doses.is_lit:
+        return DeviceRuntimeState.ON
+    return DeviceRuntimeState.OFF
+
+
+def _get_warnings(leds: dict) -> List[str]:
+    warnings = []
+    if leds['WATER'].is_lit:
+        warnings.append(DeviceWarning.WATER_TANK_EMPTY)
+    if leds['COFFEE_GROUNDS_CONTAINER'].is_lit:
+        warnings.append(DeviceWarning.COFFEE_GROUNDS_CONTAINER_FULL)
+    warning = leds['WARNING']
+    if warning.state == LEDPattern.BLINKING:
+        warnings.append(DeviceWarning.ERROR)
+    elif warning.state == LEDPattern.ON:
+        warnings.append(DeviceWarning.WARNING)
+    return warnings
+
+
+def _get_steady_pattern(value: bool) -> LEDPattern:
+    # Single reads cannot tell blinking LEDs, they are taken as steady
+    return LEDPattern(state=LEDPattern.ON if value else LEDPattern.OFF, frequency=0.0, duty_cycle=1.0 if value else 0.0, age=0.0)
+
+
+def _get_table_status(leds: int) -> DeviceStatus:
+    # Status of a LED combination read at a single moment, blinking LEDs are not visible
+    led = {name: bool(leds & (1 << bit)) for bit, name in enumerate(LED_NAMES)}
+    status = DeviceStatus()
+    # The water and coffee grounds LEDs light up when they need attention
+    status.water_tank_ready = not led['WATER']
+    status.coffee_grounds_container_ready = not led['COFFEE_GROUNDS_CONTAINER']
+    status.device_eco_mode = led['ECO']
+    status.device_maintenance = led['MAINTENANCE']
+    status.device_steam = led['STEAM']
+
+    is_on = led['ONE_DOSE'] and led['TWO_DOSES']
+    runtime_state = DeviceRuntimeState.ON if is_on else DeviceRuntimeState.OFF
+    status.coffee_machine_runtime_state = runtime_state.state_id
+
+    status.device_ready = status.water_tank_ready and status.coffee_grounds_container_ready and is_on
+    status.device_warnings = _get_warnings(leds={name: _get_steady_pattern(value) for name, value in led.items()})
+    return status
+
+
+def _create_output_driver() -> OutputDriver:
+    if OUTPUT_DRIVER == 'gpio':
+        return GPIOOutputDriver(pins=GPIO_OUT_PINS, idle=OUTPUT_IDLE_VALUES)
+    if OUTPUT_DRIVER == 'shift_register':
+        return ShiftRegisterOutputDriver(
+            strobe_gpio=SHIFT_REGISTER_PINS['STROBE'],
+            data_gpio=SHIFT_REGISTER_PINS['DATA'],
+            clock_gpio=SHIFT_REGISTER_PINS['CLOCK'],
+            bits=SHIFT_REGISTER_OUTPUTS,
+            idle=OUTPUT_IDLE_VALUES
+        )
+    raise ValueError('Unknown output driver: {}'.format(OUTPUT_DRIVER))
+
+
+LED_FALLBACK_MASK = _pack_leds(LED_FALLBACKS)
+
+# Status of every LED combination, indexed by the LED bitmask
+STATUS_TABLE = [_get_table_status(leds) for leds in range(1 << len(LED_NAMES))]
+
+
+configure_simulation(
+    in_pins=GPIO_IN_PINS,
+    out_pins=GPIO_OUT_PINS,
+    dac_addresses=I2C_ADDRESS_MAPPINGS,
+    mux_pins=MUX_SELECT_PINS,
+    adc_address=FILL_LEVEL_ADC_ADDRESS,
+    adc_channels={name: channel for name, (channel, empty_value, full_value) in FILL_LEVEL_SENSORS.items()},
+    shift_register=None if OUTPUT_DRIVER != 'shift_register' else {
+        'strobe': SHIFT_REGISTER_PINS['STROBE'],
+        'data': SHIFT_REGISTER_PINS['DATA'],
+        'clock': SHIFT_REGISTER_PINS['CLOCK'],
+        'bits': SHIFT_REGISTER_OUTPUTS
+    }
+)
+
 CM_API = CoffeeMachineHardwareAPI()
 CM_API.init_settings()
 CM_API.read_settings()
@@ -337,4 +1004,20 @@ CM_API.read_settings()
 domain=get_webapi_domain()
 port=get_webapi_port()
 ssl_ca_bundle=get_ssl_ca_bundle()
-WEB_API = WebAPI(domain=domain, port=port, ssl_ca_bundle=ssl_ca_bundle)
\ No newline at end of file
+WEB_API = WebAPI(
+    domain=domain,
+    port=port,
+    ssl_ca_bundle=ssl_ca_bundle,
+    pool_size=get_webapi_pool_size(),
+    connect_timeout=get_webapi_connect_timeout(),
+    read_timeout=get_webapi_read_timeout(),
+    retries=get_webapi_retries()
+)
+
+
+def _report_job(token: str, job_json: dict) -> dict:
+    response = WEB_API.create_job(token, job_json)
+    return response.json()
+
+
+JOB_OUTBOX = JobOutbox(journal_path=Path('/data/job_outbox.jsonl'), send=_report_job, get_owner=get_token_owner)
\ No newline at end of file
@@ -0,0 +1,166 @@
+import threading
+import time
+
+from typing import Callable, List
+
+import numpy as np
+
+from core.gpio import GPIOSnapshot
+from core.snapshot import StatusDemand
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class LEDPattern:
+    OFF = 'off'
+    ON = 'on'
+    BLINKING = 'blinking'
+
+    __slots__ = ('state', 'frequency', 'duty_cycle', 'age')
+
+    def __init__(self, state: str, frequency: float, duty_cycle: float, age: float):
+        self.state = state
+        # Blinks per second within the window, 0 for steady LEDs
+        self.frequency = frequency
+        # Share of the window the LED was on
+        self.duty_cycle = duty_cycle
+        # Seconds since the LED last changed, at least the covered window if it did not change
+        self.age = age
+
+    @property
+    def is_lit(self) -> bool:
+        return self.state != LEDPattern.OFF
+
+    def __repr__(self):
+        return '{0} ({1:.2f} Hz, {2:.0%})'.format(self.state, self.frequency, self.duty_cycle)
+
+
+class BlinkDecoder:
+    # Keeps the timestamped LED bitmasks of the last window and decodes them into steady and blinking LEDs.
+    # A status read only sees a moment, the window tells a blinking LED from a steady one.
+    def __init__(self, led_count: int, window: float, capacity: int, min_changes: int = 2):
+        self._led_count = led_count
+        self._window = window
+        self._min_changes = min_changes
+        self._lock = threading.Lock()
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._masks = np.zeros(capacity, dtype=np.uint32)
+        self._shifts = np.arange(led_count, dtype=np.uint32)
+        self._next = 0
+        self._count = 0
+
+    def add(self, timestamp: float, mask: int):
+        with self._lock:
+            self._times[self._next] = timestamp
+            self._masks[self._next] = mask
+            self._next = (self._next + 1) % len(self._times)
+            self._count = min(self._count + 1, len(self._times))
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self._count = 0
+
+    def recent(self, hold: float, now: float = None) -> GPIOSnapshot:
+        # LEDs that were on within the last hold seconds, like the reads of GPIOEdgeMonitor.
+        # None until the samples cover the hold time or if the sampler stopped adding samples.
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            order = (np.arange(self._count) + self._next - self._count) % len(self._times)
+            times = self._times[order]
+            masks = self._masks[order]
+        if len(times) == 0 or times[0] > now - hold or times[-1] < now - hold:
+            return None
+        # The last sample before the hold time is the state at its start
+        start = max(0, int(np.searchsorted(times, now - hold, side='right')) - 1)
+        masks = masks[start:]
+        values = int(np.bitwise_or.reduce(masks))
+        steady = int(np.bitwise_and.reduce(masks))
+        return GPIOSnapshot(values=values, known=(1 << self._led_count) - 1, uncertain=values & ~steady, time_in_milli=int(round(time.time() * 1000)))
+
+    def decode(self, now: float = None) -> List[LEDPattern]:
+        # One pattern per LED, None until the samples cover half of the window
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            order = (np.arange(self._count) + self._next - self._count) % len(self._times)
+            times = self._times[order]
+            masks = self._masks[order]
+        in_window = times >= now - self._window
+        times = times[in_window]
+        masks = masks[in_window]
+        if len(times) < 2:
+            return None
+        span = times[-1] - times[0]
+        if span < self._window / 2:
+            return None
+        # samples x LEDs
+        bits = np.right_shift(masks[:, np.newaxis], self._shifts) & 1
+        # Every sample holds until the next one
+        durations = np.diff(times)
+        duty_cycle = (bits[:-1] * durations[:, np.newaxis]).sum(axis=0) / span
+        changed = np.diff(bits, axis=0) != 0
+        changes = np.count_nonzero(changed, axis=0)
+        frequency = changes / 2 / span
+        # The sample after the last change of every LED, argmax finds the first change of the reversed samples
+        last_change = len(times) - 1 - np.argmax(changed[::-1], axis=0)
+        age = np.where(changes > 0, now - times[last_change], now - times[0])
+        patterns = []
+        for led in range(self._led_count):
+            if changes[led] >= self._min_changes:
+                patterns.append(LEDPattern(state=LEDPattern.BLINKING, frequency=float(frequency[led]), duty_cycle=float(duty_cycle[led]), age=float(age[led])))
+            else:
+                # A single change is a LED that was switched, it counts with its current state
+                state = LEDPattern.ON if bits[-1, led] else LEDPattern.OFF
+                patterns.append(LEDPattern(state=state, frequency=0.0, duty_cycle=float(duty_cycle[led]), age=float(age[led])))
+        return patterns
+
+
+class BlinkSampler:
+    # Samples the LEDs into the decoder far more often than they blink, the status reads take the LEDs from its samples
+    def __init__(self, read_mask: Callable[[], int], decoder: BlinkDecoder, interval: float, demand: StatusDemand = None):
+        self._read_mask = read_mask
+        self._decoder = decoder
+        self._interval = interval
+        # Without a demand the LEDs are sampled all the time
+        self._demand = demand
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return not (self._thread is None) and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._decoder.clear()
+        self._thread = threading.Thread(target=self._run, name='blink-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Blink sampler started (Interval: %s seconds).', self._interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if not (self._demand is None):
+            self._demand.wake()
+        if self.is_running():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if not (self._demand is None) and not self._demand.is_active():
+                logger.debug('Blink sampler paused, the status was not asked for.')
+                while not self._demand.wait() and not self._stop_event.is_set():
+                    pass
+                # The samples before the pause do not tell anything about the LEDs now
+                self._decoder.clear()
+                continue
+            try:
+                self._decoder.add(time.monotonic(), self._read_mask())
+            except Exception:
+                logger.exception('Sampling LEDs for the blink decoder failed.')
+                self._stop_event.wait(1)
+            self._stop_event.wait(self._interval)
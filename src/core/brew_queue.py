@@ -0,0 +1,188 @@
+import threading
+import time
+import uuid
+
+from collections import OrderedDict, deque
+from typing import Callable
+
+from config.logger import logging, get_logger_name
+from utils.profiling import recording
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class BrewQueueFullException(Exception):
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, args, kwargs)
+
+
+class BrewTicket:
+    QUEUED = 'queued'
+    BREWING = 'brewing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, token: str, job, created_at: float):
+        self.ticket_id = uuid.uuid4().hex
+        self.token = token
+        self.job = job
+        self.created_at = created_at
+        self.state = BrewTicket.QUEUED
+        self.started_at = None
+        self.finished_at = None
+        # Result of the brew function, e.g. the local id of the job
+        self.result = None
+        self.message = None
+        # (name, seconds) of the steps of the brew, incl. the time in the queue
+        self.timings = []
+
+    def is_finished(self) -> bool:
+        return self.state in (BrewTicket.DONE, BrewTicket.FAILED)
+
+
+class BrewQueue:
+    # wait_until_ready(timeout) blocks until the machine can brew the next job and returns what the brew needs
+    # for it (e.g. the session it acquired), None after the timeout
+    # brew(ticket, session) brews the job of a ticket with the return value of wait_until_ready and returns its result
+    def __init__(self, brew: Callable, wait_until_ready: Callable[[float], bool], max_size: int, ready_timeout: float, cycle_estimate: float, max_finished: int = 256):
+        self._brew = brew
+        self._wait_until_ready = wait_until_ready
+        self._max_size = max_size
+        self._ready_timeout = ready_timeout
+        # Seconds from the start of one job until the machine is ready for the next, learned from finished jobs
+        self._cycle_estimate = cycle_estimate
+        self._max_finished = max_finished
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._current = None
+        self._tickets = {}
+        self._finished = OrderedDict()
+        self._thread = None
+
+    @property
+    def cycle_estimate(self) -> float:
+        return self._cycle_estimate
+
+    def is_idle(self) -> bool:
+        with self._condition:
+            return self._current is None and len(self._queue) == 0
+
+    def submit(self, token: str, job) -> BrewTicket:
+        with self._condition:
+            if len(self._queue) >= self._max_size:
+                raise BrewQueueFullException
+            ticket = BrewTicket(token=token, job=job, created_at=time.time())
+            self._queue.append(ticket)
+            self._tickets[ticket.ticket_id] = ticket
+            self._condition.notify_all()
+            self._start()
+        logger.info('Brew ticket %s queued at position %s.', ticket.ticket_id, len(self._queue))
+        return ticket
+
+    def get(self, ticket_id: str) -> BrewTicket:
+        with self._condition:
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None:
+                ticket = self._finished.get(ticket_id)
+            return ticket
+
+    def position(self, ticket: BrewTicket) -> int:
+        # Number of jobs that run before the ticket, 0 once it is brewing
+        with self._condition:
+            if ticket.state != BrewTicket.QUEUED:
+                return 0
+            ahead = 0 if self._current is None else 1
+            for queued in self._queue:
+                if queued is ticket:
+                    return ahead
+                ahead = ahead + 1
+            return 0
+
+    def estimated_start(self, ticket: BrewTicket) -> float:
+        with self._condition:
+            if not (ticket.started_at is None):
+                return ticket.started_at
+            now = time.time()
+            position = self.position(ticket)
+            if position == 0:
+                return now
+            start = now
+            current = self._current
+            if not (current is None) and not (current.started_at is None):
+                # The running job counts with its remaining time only
+                start = max(now, current.started_at + self._cycle_estimate)
+                position = position - 1
+            return start + position * self._cycle_estimate
+
+    def _start(self):
+        if not (self._thread is None) and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='brew-queue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0:
+                    self._condition.wait()
+                ticket = self._queue[0]
+            # A failing ticket must not stop the queue, the tickets after it still run
+            try:
+                self._process(ticket)
+            except Exception as err:
+                logger.exception('Processing ticket %s failed.', ticket.ticket_id)
+                self._finish(ticket, BrewTicket.FAILED, message=getattr(err, 'message', str(err)))
+
+    def _process(self, ticket: BrewTicket):
+        session = self._wait_until_ready(self._ready_timeout)
+        if session is None:
+            self._finish(ticket, BrewTicket.FAILED, message='Kaffeemaschine ist nicht bereit.')
+            return
+
+        with self._condition:
+            self._queue.popleft()
+            self._current = ticket
+            ticket.state = BrewTicket.BREWING
+            ticket.started_at = time.time()
+            self._learn_cycle(ticket)
+
+        ticket.timings.append(('queue', ticket.started_at - ticket.created_at))
+        with recording() as recorder:
+            # The steps of the brew are added to the timings of the ticket
+            recorder.spans = ticket.timings
+            result = self._brew(ticket, session)
+        self._finish(ticket, BrewTicket.DONE, result=result)
+
+    def _learn_cycle(self, ticket: BrewTicket):
+        # Time between the starts of two back to back jobs is a full cycle
+        previous = next(reversed(self._finished.values()), None)
+        if previous is None or previous.state != BrewTicket.DONE:
+            return
+        cycle = ticket.started_at - previous.started_at
+        if cycle <= 0 or (ticket.created_at > previous.finished_at):
+            # The machine was idle in between, so this is not a back to back cycle
+            return
+        self._cycle_estimate = 0.8 * self._cycle_estimate + 0.2 * cycle
+
+    def _finish(self, ticket: BrewTicket, state: str, result=None, message: str = None):
+        with self._condition:
+            if self._queue and self._queue[0] is ticket:
+                self._queue.popleft()
+            if self._current is ticket:
+                self._current = None
+            ticket.state = state
+            ticket.result = result
+            ticket.message = message
+            ticket.finished_at = time.time()
+            if not (ticket.started_at is None):
+                ticket.timings.append(('total', ticket.finished_at - ticket.started_at))
+            # The token is not needed anymore
+            ticket.token = None
+            self._tickets.pop(ticket.ticket_id, None)
+            self._finished[ticket.ticket_id] = ticket
+            while len(self._finished) > self._max_finished:
+                self._finished.popitem(last=False)
+            self._condition.notify_all()
+        logger.info('Brew ticket %s %s.', ticket.ticket_id, state)
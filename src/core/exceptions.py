@@ -1,3 +1,11 @@
 class DeviceBlockedException(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, args, kwargs)
+
+
+class DACWriteException(OSError):
+    # Raised after a batched DAC write, once every other DAC was written
+    def __init__(self, errors: dict):
+        OSError.__init__(self, 'Writing DAC(s) {} failed'.format(', '.join(hex(address) for address in errors)))
+        # address => OSError
+        self.errors = errors
@@ -0,0 +1,203 @@
+import errno
+import threading
+import time
+
+from typing import Dict, List
+
+from core.hardware import GPIO
+from core.i2c import I2CBusManager
+from config.logger import logging, get_logger_name
+from utils.metrics import FILL_LEVEL_SCAN_SECONDS
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class AnalogMultiplexer:
+    # 74HC4051: the select lines A, B and C connect one of the channels X0 to X7 with the common pin X
+    def __init__(self, select_gpios: List[int]):
+        self._select_gpios = list(select_gpios)
+        self._channel = None
+
+    @property
+    def channel_count(self) -> int:
+        return 1 << len(self._select_gpios)
+
+    def select(self, channel: int) -> bool:
+        # Only the select lines that differ are written, the pins must be configured outputs.
+        # Returns whether the channel changed.
+        if channel == self._channel:
+            return False
+        for bit, gpio in enumerate(self._select_gpios):
+            if self._channel is None or ((channel ^ self._channel) >> bit) & 1:
+                GPIO.output(gpio, GPIO.HIGH if (channel >> bit) & 1 else GPIO.LOW)
+        self._channel = channel
+        return True
+
+    def invalidate(self):
+        # The select lines were driven by someone else, all of them are written on the next select
+        self._channel = None
+
+
+class ADS1115:
+    # 16 bit I2C ADC, single-shot conversions of one single-ended input
+    def __init__(self, i2c: I2CBusManager, bus_number: int, address: int, input_number: int = 0):
+        self._i2c = i2c
+        self._bus_number = bus_number
+        self._address = address
+        self._config = ADS1115_START | ((ADS1115_MUX_SINGLE_ENDED | input_number) << 12) | ADS1115_PGA_4_096V | ADS1115_MODE_SINGLE_SHOT | ADS1115_RATE_860 | ADS1115_COMPARATOR_OFF
+
+    @property
+    def address(self) -> int:
+        return self._address
+
+    def read(self) -> int:
+        with self._i2c.transaction(bus_number=self._bus_number, operation='adc') as bus:
+            bus.write_i2c_block_data(self._address, ADS1115_REG_CONFIG, [self._config >> 8, self._config & 0xFF])
+            deadline = time.monotonic() + ADS1115_CONVERSION_TIMEOUT
+            time.sleep(ADS1115_CONVERSION_TIME)
+            # The start bit reads back as 1 once the conversion is done
+            while not (bus.read_i2c_block_data(self._address, ADS1115_REG_CONFIG, 2)[0] & 0x80):
+                if time.monotonic() >= deadline:
+                    raise OSError(errno.ETIMEDOUT, 'ADC conversion timed out')
+                time.sleep(ADS1115_POLL_INTERVAL)
+            data = bus.read_i2c_block_data(self._address, ADS1115_REG_CONVERSION, 2)
+        value = (data[0] << 8) | data[1]
+        if value & 0x8000:
+            value = value - 0x10000
+        # Single-ended inputs are only below ground by noise
+        return max(value, 0)
+
+
+class FillLevelSensor:
+    __slots__ = ('name', 'channel', 'empty_value', 'full_value', 'level', 'read_at')
+
+    def __init__(self, name: str, channel: int, empty_value: int, full_value: int):
+        self.name = name
+        self.channel = channel
+        # ADC values of an empty and a full container, a sensor may count down while the container fills
+        self.empty_value = empty_value
+        self.full_value = full_value
+        # Smoothed fill level in percent
+        self.level = None
+        self.read_at = None
+
+    def update(self, value: int, smoothing: float, now: float):
+        percent = (value - self.empty_value) * 100 / (self.full_value - self.empty_value)
+        percent = min(max(percent, 0.0), 100.0)
+        # Exponential moving average, a level read after a gap starts over
+        if self.level is None:
+            self.level = percent
+        else:
+            self.level = self.level + smoothing * (percent - self.level)
+        self.read_at = now
+
+
+class FillLevelScanner:
+    # Reads all fill level sensors behind the multiplexer in one pass on its own schedule,
+    # status reads only pick up the last smoothed levels and never wait for the ADC
+    def __init__(self, multiplexer: AnalogMultiplexer, adc: ADS1115, sensors: List[FillLevelSensor], lock, interval: float, settle_time: float, smoothing: float, max_age: float):
+        self._multiplexer = multiplexer
+        self._adc = adc
+        # Channels are visited in Gray code order, so every switch changes a single select line
+        self._sensors = sorted(sensors, key=lambda sensor: _get_gray_rank(sensor.channel))
+        # Serializes the select lines with the other users of the GPIO pins
+        self._lock = lock
+        self._interval = interval
+        self._settle_time = settle_time
+        self._smoothing = smoothing
+        # Levels not read within this time are reported as unknown
+        self._max_age = max_age
+        self._levels_lock = threading.Lock()
+        # Sensors whose last read failed, only the first failure is logged as a warning
+        self._failing = set()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def levels(self) -> Dict[str, int]:
+        # Sensor name => fill level in percent, None if the sensor was not read lately
+        now = time.monotonic()
+        with self._levels_lock:
+            return {sensor.name: None if sensor.read_at is None or now - sensor.read_at > self._max_age else int(round(sensor.level)) for sensor in self._sensors}
+
+    def scan(self):
+        values = {}
+        with FILL_LEVEL_SCAN_SECONDS.time():
+            with self._lock:
+                for sensor in self._sensors:
+                    if self._multiplexer.select(sensor.channel):
+                        time.sleep(self._settle_time)
+                    try:
+                        values[sensor.name] = (self._adc.read(), time.monotonic())
+                    except OSError as err:
+                        log = logger.debug if sensor.name in self._failing else logger.warning
+                        log('Reading fill level %s (channel %s, ADC %#x) failed: %s', sensor.name, sensor.channel, self._adc.address, err)
+                        self._failing.add(sensor.name)
+                        continue
+                    if sensor.name in self._failing:
+                        self._failing.discard(sensor.name)
+                        logger.info('Reading fill level %s works again.', sensor.name)
+        with self._levels_lock:
+            for sensor in self._sensors:
+                if sensor.name in values:
+                    value, read_at = values[sensor.name]
+                    if not (sensor.read_at is None) and read_at - sensor.read_at > self._max_age:
+                        sensor.level = None
+                    sensor.update(value=value, smoothing=self._smoothing, now=read_at)
+                    logger.debug('Fill level %s: %s (%.1f %%)', sensor.name, value, sensor.level)
+
+    def is_running(self) -> bool:
+        return not (self._thread is None) and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='fill-level-scanner')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Fill level scanner started (Interval: %s seconds).', self._interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_running():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.scan()
+            except Exception:
+                logger.exception('Scanning fill levels failed.')
+            self._stop_event.wait(self._interval)
+
+
+def _get_gray_rank(value: int) -> int:
+    # Position of a value in the Gray code sequence
+    rank = value
+    shift = value >> 1
+    while shift:
+        rank = rank ^ shift
+        shift = shift >> 1
+    return rank
+
+
+# ADS1115 registers
+ADS1115_REG_CONVERSION = 0x00
+ADS1115_REG_CONFIG = 0x01
+
+# ADS1115 config: start a single-shot conversion of AINx against GND, +-4.096 V, 860 samples per second, no comparator
+ADS1115_START = 0x8000
+ADS1115_MUX_SINGLE_ENDED = 0b100
+ADS1115_PGA_4_096V = 0b001 << 9
+ADS1115_MODE_SINGLE_SHOT = 1 << 8
+ADS1115_RATE_860 = 0b111 << 5
+ADS1115_COMPARATOR_OFF = 0b11
+
+# Seconds of a conversion at 860 samples per second, the ready bit is polled afterwards
+ADS1115_CONVERSION_TIME = 0.0012
+
+ADS1115_POLL_INTERVAL = 0.0002
+
+ADS1115_CONVERSION_TIMEOUT = 0.05
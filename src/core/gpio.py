@@ -1,11 +1,44 @@
-from typing import List
-import RPi.GPIO as GPIO
+import threading
 import time
 
+from enum import Enum
+from typing import List
+
+import numpy as np
+
+from core.hardware import GPIO
+from core.pins import setup_inputs
+from core.sample_backend import PythonSampleBackend
+from core.outputs import OutputDriver
+
+
+class GPIOReadMode(Enum):
+    # Busy polls every pin on each read
+    POLL = ('poll')
+    # Keeps the pin state up to date with edge detection callbacks
+    EDGE = ('edge')
+    # Samples all pins in each pass and votes on the result
+    INTERLEAVED = ('interleaved')
+
+    def __init__(self, mode_str):
+        self._mode_str = mode_str
+
+    @property
+    def mode_str(self):
+        return self._mode_str
+
+    @staticmethod
+    def from_str(mode_str: str):
+        for mode in GPIOReadMode:
+            if mode.mode_str == mode_str:
+                return mode
+        raise ValueError('Unknown GPIO read mode: {}'.format(mode_str))
+
 
 class RemoteGPIOSession:
-    def __init__(self, relais_gpio, relais_value, *args, **kwargs):
-        self._relais_gpio = relais_gpio
+    def __init__(self, outputs: OutputDriver, relais_name: str, relais_value: bool, *args, **kwargs):
+        self._outputs = outputs
+        self._relais_name = relais_name
         self._relais_value = relais_value
         self._opened = False
         self._closed = False
@@ -19,121 +52,241 @@ class RemoteGPIOSession:
     def open(self):
         self._opened = True
         self._closed = False
-        gpio = self._relais_gpio
-        value = self._relais_value
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(gpio, GPIO.OUT)
-        GPIO.output(gpio, value)
+        self._outputs.apply({self._relais_name: self._relais_value})
     
     def close(self):
-        GPIO.cleanup()
+        self._outputs.apply({self._relais_name: not self._relais_value})
         self._opened = False
         self._closed = True
 
 
-class GPIORead:
-    def __init__(self, gpio_number: int, value: bool, time_in_milli: int):
-        self.gpio_number = gpio_number
-        self.value = value
-        self.time_in_milli = time_in_milli
-    
-    def __repr__(self):
-        #return str(self.__dict__)
-        gpio_number_str = str(self.gpio_number).zfill(2)
-        time_str = self.time_in_milli
-        value_str = self.value
-        return '{0} {1}: {2}'.format(gpio_number_str, time_str, value_str)
-
-    def __eq__(self, other):
-        gpio_number_other = other.gpio_number
-        gpio_number_self = self.gpio_number
-        if gpio_number_self != gpio_number_other:
-            return False
-        
-        value_other = other.value
-        value_self = self.value
-        return value_self == value_other
-
-    def __ne__(self, other):
-        return not(self == other)
-
-    def __hash__(self):
-        return hash((self.gpio_number, self.value))
-    
-    def __lt__(self, other):
-        gpio_number_other = other.gpio_number
-        gpio_number_self = self.gpio_number
-        return gpio_number_self < gpio_number_other
+class GPIOSnapshot:
+    # One read of a list of GPIOs as bitmasks, bit i is the i-th GPIO of the read
+    __slots__ = ('values', 'known', 'uncertain', 'time_in_milli')
 
-    def __le__(self, other):
-        gpio_number_other = other.gpio_number
-        gpio_number_self = self.gpio_number
-        return gpio_number_self <= gpio_number_other
+    def __init__(self, values: int, known: int, time_in_milli: int, uncertain: int = 0):
+        # GPIOs that were HIGH
+        self.values = values
+        # GPIOs with a reliable value, the others did not agree between the check cycles
+        self.known = known
+        # GPIOs whose check cycles did not all agree with the value
+        self.uncertain = uncertain
+        self.time_in_milli = time_in_milli
 
-    def __gt__(self, other):
-        gpio_number_other = other.gpio_number
-        gpio_number_self = self.gpio_number
-        return gpio_number_self > gpio_number_other
+    def resolve(self, fallback: int) -> int:
+        # The values with the fallback bits for GPIOs without a reliable value
+        return (self.values & self.known) | (fallback & ~self.known)
 
-    def __ge__(self, other):
-        gpio_number_other = other.gpio_number
-        gpio_number_self = self.gpio_number
-        return gpio_number_self >= gpio_number_other
+    def __repr__(self):
+        return '{0}: {1:#04x} (known {2:#04x})'.format(self.time_in_milli, self.values, self.known)
 
 
-def read_gpio_list(gpio_numbers: List[int], sample_rate: int = 100, check_cycles: int = 1, session = None) -> List[GPIORead]:
+def read_gpio_list(gpio_numbers: List[int], sample_rate: int = 100, check_cycles: int = 1, session = None, backend = None) -> GPIOSnapshot:
     if check_cycles < 1:
         raise ValueError('Check cycles must be greater than 0')
-    
-    read_cycles = []
-    for i in range(0, check_cycles):
-        single_read = _read_gpio_list_single_cycle(gpio_numbers=gpio_numbers, sample_rate=sample_rate, session=session)
-        read_cycles.append(single_read)
-    
-    base_cycle = read_cycles[0]
-    del read_cycles[0]
 
-    for read_cycle in read_cycles:
-        base_cycle = set(base_cycle).intersection(read_cycle)
+    # A sample backend reads all pins in each pass, see InterleavedGPIOSampler
+    if not (backend is None):
+        sampler = InterleavedGPIOSampler(gpio_numbers=gpio_numbers, passes=sample_rate, backend=backend)
+        return sampler.read(check_cycles=check_cycles, session=session)
     
-    return base_cycle
+    base_cycle = _read_gpio_list_single_cycle(gpio_numbers=gpio_numbers, sample_rate=sample_rate, session=session)
+    # GPIOs that differ from the first cycle in any other cycle are filtered out
+    mismatches = 0
+    for i in range(1, check_cycles):
+        read_cycle = _read_gpio_list_single_cycle(gpio_numbers=gpio_numbers, sample_rate=sample_rate, session=session)
+        mismatches = mismatches | (base_cycle ^ read_cycle)
+    known = ((1 << len(gpio_numbers)) - 1) & ~mismatches
+    return GPIOSnapshot(values=base_cycle & known, known=known, time_in_milli=int(round(time.time() * 1000)))
 
     
-def _read_gpio_list_single_cycle(gpio_numbers: List[int], sample_rate: int, session) -> List[GPIORead]:
-    if session is None:
-        GPIO.setmode(GPIO.BCM)
-    for gpio in gpio_numbers:
-        GPIO.setup(gpio, GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
-
-    reads = []
-    for gpio in gpio_numbers:
-        _found_high = False
+def _read_gpio_list_single_cycle(gpio_numbers: List[int], sample_rate: int, session) -> int:
+    cleanup = setup_inputs(gpio_numbers=gpio_numbers, session=session)
+
+    mask = 0
+    for bit, gpio in enumerate(gpio_numbers):
         for i in range(0, sample_rate):
-            _val = GPIO.input(gpio)
-            if _val == GPIO.HIGH:
-                _found_high = True
-                _time_in_milli = int(round(time.time() * 1000))
-                reads.append(GPIORead(gpio_number=gpio, value=True, time_in_milli=_time_in_milli))
+            if GPIO.input(gpio) == GPIO.HIGH:
+                mask = mask | (1 << bit)
                 break
-        if not _found_high:
-            _time_in_milli = int(round(time.time() * 1000))
-            reads.append(GPIORead(gpio_number=gpio, value=False, time_in_milli=_time_in_milli))
     
-    if session is None:
-        GPIO.cleanup()
-    return reads
+    if cleanup:
+        GPIO.cleanup(gpio_numbers)
+    return mask
 
 
-def set_gpio(gpio_number: int, value: bool, duration_in_sec, session = None):
-    if session is None:
-        GPIO.setmode(GPIO.BCM)
-    
-    GPIO.setup(gpio_number, GPIO.OUT)
-    GPIO.output(gpio_number, value)
+def read_gpio_mask(gpio_numbers: List[int]) -> int:
+    # Single read of configured inputs, one bit per GPIO in the order of gpio_numbers
+    mask = 0
+    for bit, gpio in enumerate(gpio_numbers):
+        if GPIO.input(gpio) == GPIO.HIGH:
+            mask = mask | (1 << bit)
+    return mask
+
+
+def press_output(outputs: OutputDriver, name: str, duration_in_sec: float, ack_gpio_numbers: List[int], min_duration_in_sec: float = 0, poll_interval_in_sec: float = 0.01, session = None, configure_inputs: bool = True) -> float:
+    # Holds the output away from its idle value, but releases it early once one of the ack pins changed
+    # and the minimum duration passed.
+    # Returns the seconds until the change was observed or None if nothing changed within the duration.
+    cleanup_inputs = False
+    if configure_inputs:
+        cleanup_inputs = setup_inputs(gpio_numbers=ack_gpio_numbers, session=session)
+    baseline = [GPIO.input(gpio) for gpio in ack_gpio_numbers]
+
+    idle_value = outputs.idle_value(name)
+    outputs.apply({name: not idle_value})
+    started = time.monotonic()
+    ack = None
+    while True:
+        elapsed = time.monotonic() - started
+        if ack is None and [GPIO.input(gpio) for gpio in ack_gpio_numbers] != baseline:
+            ack = elapsed
+        if elapsed >= duration_in_sec or (not (ack is None) and elapsed >= min_duration_in_sec):
+            break
+        remaining = duration_in_sec - elapsed
+        if not (ack is None):
+            remaining = min_duration_in_sec - elapsed
+        time.sleep(min(poll_interval_in_sec, remaining))
+    outputs.apply({name: idle_value})
+
+    if cleanup_inputs:
+        GPIO.cleanup(ack_gpio_numbers)
+    return ack
+
+
+class PinState:
+    __slots__ = ('gpio_number', 'value', 'last_edge', 'last_high')
+
+    def __init__(self, gpio_number: int, value: bool, now: float):
+        self.gpio_number = gpio_number
+        self.value = value
+        self.last_edge = now
+        self.last_high = now if value else None
+
+    def update(self, value: bool, now: float):
+        if value == self.value:
+            return
+        self.value = value
+        self.last_edge = now
+        if value:
+            self.last_high = now
+
+    def is_high(self, now: float, hold_in_sec: float) -> bool:
+        # A blinking LED counts as HIGH as long as it was HIGH within the hold window
+        if self.value:
+            return True
+        return not (self.last_high is None) and (now - self.last_high) <= hold_in_sec
+
+
+class GPIOEdgeMonitor:
+    def __init__(self, gpio_numbers: List[int], debounce_in_ms: int, hold_in_sec: float):
+        self._gpio_numbers = list(gpio_numbers)
+        self._debounce_in_ms = debounce_in_ms
+        self._hold_in_sec = hold_in_sec
+        self._lock = threading.Lock()
+        self._states = {}
+        self._started = False
+        # Whether the monitor set up the pins itself and has to clean them up
+        self._cleanup = False
+
+    def is_started(self) -> bool:
+        return self._started
+
+    def start(self):
+        if self._started:
+            return
+        self._cleanup = setup_inputs(gpio_numbers=self._gpio_numbers)
+        now = time.monotonic()
+        for gpio in self._gpio_numbers:
+            self._states[gpio] = PinState(gpio_number=gpio, value=GPIO.input(gpio) == GPIO.HIGH, now=now)
+            GPIO.add_event_detect(gpio, GPIO.BOTH, callback=self._on_edge, bouncetime=self._debounce_in_ms)
+        self._started = True
+
+    def stop(self):
+        if not self._started:
+            return
+        for gpio in self._gpio_numbers:
+            GPIO.remove_event_detect(gpio)
+        if self._cleanup:
+            GPIO.cleanup(self._gpio_numbers)
+        self._started = False
+
+    def _on_edge(self, gpio: int):
+        value = GPIO.input(gpio) == GPIO.HIGH
+        now = time.monotonic()
+        with self._lock:
+            self._states[gpio].update(value=value, now=now)
+
+    def read(self, gpio_numbers: List[int]) -> GPIOSnapshot:
+        now = time.monotonic()
+        time_in_milli = int(round(time.time() * 1000))
+        values = 0
+        with self._lock:
+            for bit, gpio in enumerate(gpio_numbers):
+                state = self._states[gpio]
+                # Edges swallowed by the debounce window would otherwise leave a stale level behind
+                state.update(value=GPIO.input(gpio) == GPIO.HIGH, now=now)
+                if state.is_high(now=now, hold_in_sec=self._hold_in_sec):
+                    values = values | (1 << bit)
+        return GPIOSnapshot(values=values, known=(1 << len(gpio_numbers)) - 1, time_in_milli=time_in_milli)
+
+
+class InterleavedGPIOSampler:
+    def __init__(self, gpio_numbers: List[int], passes: int, backend = None):
+        if passes < 1:
+            raise ValueError('Passes must be greater than 0')
+        self._gpio_numbers = list(gpio_numbers)
+        self._backend = PythonSampleBackend() if backend is None else backend
+        # Preallocated and reused for every read
+        self._masks = np.zeros(passes, dtype=np.uint32)
+        self._timestamps = np.zeros(passes, dtype=np.uint64)
+        self._shifts = np.arange(len(self._gpio_numbers), dtype=np.uint32)
+        # passes x pins
+        self._samples = np.zeros((passes, len(self._gpio_numbers)), dtype=np.uint8)
+
+    @property
+    def samples(self) -> np.ndarray:
+        return self._samples
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps
+
+    def sample(self, session = None):
+        self._backend.sample(gpio_numbers=self._gpio_numbers, masks=self._masks, timestamps=self._timestamps, session=session)
+        # Unpack the bitmask of every pass into the sample matrix
+        np.bitwise_and(np.right_shift(self._masks[:, np.newaxis], self._shifts), 1, out=self._samples, casting='unsafe')
+
+    def read(self, check_cycles: int = 1, session = None) -> GPIOSnapshot:
+        self.sample(session=session)
+        values, confidence, duty_cycle = reduce_gpio_samples(samples=self._samples, check_cycles=check_cycles)
+        return GPIOSnapshot(
+            values=_pack_bits(values),
+            known=(1 << len(self._gpio_numbers)) - 1,
+            uncertain=_pack_bits(confidence < 1.0),
+            time_in_milli=int(round(time.time() * 1000))
+        )
+
+
+# Splits a passes x pins sample matrix into check cycles. A pin is HIGH within a cycle if any of its samples is HIGH,
+# the cycles then vote on the final value. Returns (values, confidence, duty_cycle) with one entry per pin.
+def reduce_gpio_samples(samples: np.ndarray, check_cycles: int = 1):
+    passes = samples.shape[0]
+    if check_cycles < 1:
+        raise ValueError('Check cycles must be greater than 0')
+    if passes < check_cycles:
+        raise ValueError('At least one pass per check cycle is required')
+
+    usable_passes = passes - (passes % check_cycles)
+    cycles = samples[:usable_passes].reshape(check_cycles, usable_passes // check_cycles, samples.shape[1])
+    votes = cycles.any(axis=1).sum(axis=0)
+    # Ties count as HIGH, a LED seen in half of the cycles is blinking
+    values = (votes * 2) >= check_cycles
+    confidence = np.where(values, votes, check_cycles - votes) / check_cycles
+    duty_cycle = samples.mean(axis=0)
+    return values, confidence, duty_cycle
 
-    if not (duration_in_sec is None):
-        time.sleep(duration_in_sec)
-        GPIO.output(gpio_number, not value)
 
-    if session is None:
-        GPIO.cleanup()
+def _pack_bits(flags: np.ndarray) -> int:
+    # One bit per entry, the first entry is the lowest bit
+    return int(np.dot(flags.astype(np.uint32), np.left_shift(np.uint32(1), np.arange(len(flags), dtype=np.uint32))))
@@ -0,0 +1,48 @@
+from config.environment_tools import Mode, get_environment_mode, get_hardware_backend, get_simulation_time_scale
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+# Hardware backends: "rpi" uses RPi.GPIO and smbus2, "simulated" a simulated coffee machine
+RPI_BACKEND = 'rpi'
+SIMULATED_BACKEND = 'simulated'
+
+
+def _select_backend() -> str:
+    backend = get_hardware_backend()
+    if backend is None or len(backend) == 0:
+        backend = SIMULATED_BACKEND if get_environment_mode() == Mode.TEST else RPI_BACKEND
+    if not (backend in (RPI_BACKEND, SIMULATED_BACKEND)):
+        raise ValueError('Unknown hardware backend: {}'.format(backend))
+    return backend
+
+
+HARDWARE_BACKEND = _select_backend()
+
+SIMULATED_MACHINE = None
+
+if HARDWARE_BACKEND == SIMULATED_BACKEND:
+    from core.simulation import SimulatedCoffeeMachine, SimulatedGPIO, SimulatedSMBus, SimulatedI2CMessage
+
+    logger.info('Using simulated coffee machine hardware.')
+    SIMULATED_MACHINE = SimulatedCoffeeMachine(time_scale=get_simulation_time_scale())
+    GPIO = SimulatedGPIO(SIMULATED_MACHINE)
+
+    def SMBus(bus=None):
+        return SimulatedSMBus(SIMULATED_MACHINE, bus)
+
+    i2c_msg = SimulatedI2CMessage
+else:
+    import RPi.GPIO as GPIO
+    from smbus2 import SMBus, i2c_msg
+
+
+def is_simulated() -> bool:
+    return HARDWARE_BACKEND == SIMULATED_BACKEND
+
+
+def configure_simulation(in_pins: dict, out_pins: dict, dac_addresses: dict, mux_pins: list = None, adc_address: int = None, adc_channels: dict = None, shift_register: dict = None):
+    if not is_simulated():
+        return
+    SIMULATED_MACHINE.configure(in_pins=in_pins, out_pins=out_pins, dac_addresses=dac_addresses, mux_pins=mux_pins, adc_address=adc_address, adc_channels=adc_channels, shift_register=shift_register)
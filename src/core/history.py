@@ -0,0 +1,164 @@
+import mmap
+import os
+import threading
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class StatusHistory:
+    # Ring buffer of the LED states, one record (time in ms, LED bitmask) per change and at least one per keepalive.
+    # The capacity is fixed, the oldest records are overwritten. With a file the buffer is a shared memory map of it,
+    # so the history survives restarts without being serialized.
+    def __init__(self, capacity: int, keepalive: float, file_path: Path = None):
+        if capacity < 2:
+            raise ValueError('Capacity must be at least 2')
+        self._capacity = capacity
+        self._keepalive = keepalive
+        self._file_path = None if file_path is None else Path(file_path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._buffer = None
+        # Wall clock time of the monotonic clock's zero. Records are timed with the monotonic clock,
+        # so they stay in order if the system clock is set while running.
+        self._clock_offset = time.time() - time.monotonic()
+        self._open()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return int(self._header[HEADER_COUNT])
+
+    def now(self) -> int:
+        return int((time.monotonic() + self._clock_offset) * 1000)
+
+    def record(self, leds: int):
+        with self._lock:
+            count = int(self._header[HEADER_COUNT])
+            head = int(self._header[HEADER_HEAD])
+            now = self.now()
+            if count > 0:
+                last = self._records[(head - 1) % self._capacity]
+                if int(last['leds']) == leds and now - int(last['time_in_milli']) < self._keepalive * 1000:
+                    return
+                # Records of a previous run may be ahead if the clock was behind after a reboot
+                now = max(now, int(last['time_in_milli']))
+            self._records[head] = (now, leds)
+            self._header[HEADER_HEAD] = (head + 1) % self._capacity
+            self._header[HEADER_COUNT] = min(count + 1, self._capacity)
+
+    def records(self, since: int = None, until: int = None) -> np.ndarray:
+        # Copy of the records in chronological order, incl. the last record before since (the state at since)
+        with self._lock:
+            count = int(self._header[HEADER_COUNT])
+            head = int(self._header[HEADER_HEAD])
+            if count < self._capacity:
+                ordered = self._records[:count].copy()
+            else:
+                ordered = np.concatenate((self._records[head:], self._records[:head]))
+        times = ordered['time_in_milli']
+        start = 0 if since is None else max(0, int(np.searchsorted(times, since, side='right')) - 1)
+        end = len(ordered) if until is None else int(np.searchsorted(times, until, side='right'))
+        return ordered[start:end]
+
+    def downsample(self, since: int, until: int, points: int, led_count: int):
+        # Splits since..until (ms) into equal buckets. Returns the bucket starts, the share of every bucket covered by records
+        # and per LED the share of the covered time it was on (NaN without coverage).
+        # A record holds until the next one, at most for two keepalives, longer gaps are times the status was not read.
+        records = self.records(since=since)
+        # The first record after until ends the one before
+        records = records[:int(np.searchsorted(records['time_in_milli'], until, side='right')) + 1]
+        edges = np.linspace(since, until, points + 1)
+        if len(records) == 0:
+            return edges[:-1], np.zeros(points), np.full((points, led_count), np.nan)
+        starts = records['time_in_milli'].astype(np.float64)
+        ends = np.empty_like(starts)
+        ends[:-1] = starts[1:]
+        ends[-1] = self.now()
+        ends = np.maximum(np.minimum(ends, starts + 2 * self._keepalive * 1000), starts)
+        durations = ends - starts
+        bits = np.right_shift(records['leds'][:, np.newaxis], np.arange(led_count)) & 1
+        # Integrals of the coverage and of every LED over time, linear within a record and flat in gaps
+        weights = np.column_stack((np.ones(len(records)), bits)) * durations[:, np.newaxis]
+        integrals = np.vstack((np.zeros((1, led_count + 1)), np.cumsum(weights, axis=0)))
+        x = np.empty(2 * len(records))
+        x[0::2] = starts
+        x[1::2] = ends
+        y = np.empty((2 * len(records), led_count + 1))
+        y[0::2] = integrals[:-1]
+        y[1::2] = integrals[1:]
+        sums = np.column_stack([np.diff(np.interp(edges, x, y[:, column])) for column in range(led_count + 1)])
+        width = (until - since) / points
+        coverage = sums[:, 0] / width
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = sums[:, 1:] / sums[:, :1]
+        shares[sums[:, 0] <= 0] = np.nan
+        return edges[:-1], coverage, shares
+
+    def close(self):
+        with self._lock:
+            if isinstance(self._buffer, mmap.mmap):
+                # The arrays must let go of the map before it can be closed
+                self._header = self._header.copy()
+                self._records = self._records.copy()
+                self._buffer.flush()
+                self._buffer.close()
+                self._buffer = None
+            if not (self._file is None):
+                self._file.close()
+                self._file = None
+
+    def _open(self):
+        size = HEADER_SIZE + self._capacity * RECORD_DTYPE.itemsize
+        buffer = None
+        if not (self._file_path is None):
+            try:
+                buffer = self._map_file(size)
+            except OSError as err:
+                logger.warning('Could not map status history %s, keeping it in memory: %s', self._file_path, err)
+        if buffer is None:
+            buffer = bytearray(size)
+        self._buffer = buffer
+        self._header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=HEADER_FIELDS)
+        self._records = np.frombuffer(buffer, dtype=RECORD_DTYPE, count=self._capacity, offset=HEADER_SIZE)
+        if self._header[HEADER_MAGIC] != HISTORY_MAGIC or self._header[HEADER_CAPACITY] != self._capacity or self._header[HEADER_HEAD] >= self._capacity:
+            if isinstance(buffer, mmap.mmap) and self._header[HEADER_MAGIC] != 0:
+                logger.warning('Status history %s has another format or capacity, starting a new one.', self._file_path)
+            self._header[:] = (HISTORY_MAGIC, self._capacity, 0, 0)
+
+    def _map_file(self, size: int) -> mmap.mmap:
+        self._file_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self._file_path), os.O_RDWR | os.O_CREAT, 0o644)
+        f = os.fdopen(fd, 'r+b')
+        try:
+            if os.fstat(fd).st_size != size:
+                f.truncate(0)
+                f.truncate(size)
+            buffer = mmap.mmap(fd, size)
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        return buffer
+
+
+# Header: magic, capacity, index of the next record, number of records
+HEADER_DTYPE = np.dtype('<u8')
+HEADER_FIELDS = 4
+HEADER_SIZE = HEADER_FIELDS * HEADER_DTYPE.itemsize
+HEADER_MAGIC, HEADER_CAPACITY, HEADER_HEAD, HEADER_COUNT = range(HEADER_FIELDS)
+
+# "CMHIST01"
+HISTORY_MAGIC = int.from_bytes(b'CMHIST01', 'little')
+
+# 9 bytes per record: wall clock time in ms taken from the monotonic clock and one bit per LED
+RECORD_DTYPE = np.dtype([('time_in_milli', '<u8'), ('leds', 'u1')])
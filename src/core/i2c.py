@@ -1,38 +1,246 @@
+import threading
 import time
 
-from smbus2 import SMBus
+from contextlib import contextmanager
+from typing import Dict
 
+from core.hardware import SMBus, i2c_msg
+from core.exceptions import DACWriteException
 from config.logger import logging, get_logger_name
 from utils.basic import validate_percent_value
+from utils.metrics import DAC_WRITE_SECONDS, I2C_ERRORS_TOTAL
 
 
 logger = logging.getLogger(get_logger_name(__name__))
 
 
-def set_dac_value(bus_number: int, address: int, percent_value: int, i2c_delay, sensor_name: str='Unknown'):
-    if address is None:
-        logger.warning('Sensor {} i2c bus address is not configured.'.format(sensor_name))
-        return
+class DACStats:
+    __slots__ = ('writes', 'skipped_writes', 'errors', 'total_latency', 'max_latency', 'last_latency')
 
-    validate_percent_value(value=percent_value)
+    def __init__(self):
+        self.writes = 0
+        self.skipped_writes = 0
+        self.errors = 0
+        # Duration of the I2C write transactions in seconds
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = None
 
-    logger.debug('Instanciating SMBus: {}'.format(bus_number))
-    bus = SMBus(bus_number)
-    logger.debug('done.')
-    reg_write_dac = 0x40
-        
+    def record_write(self, latency: float):
+        self.writes = self.writes + 1
+        self.total_latency = self.total_latency + latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_latency = latency
+
+    def mean_latency(self) -> float:
+        if self.writes == 0:
+            return None
+        return self.total_latency / self.writes
+
+    def copy(self):
+        stats = DACStats()
+        for name in DACStats.__slots__:
+            setattr(stats, name, getattr(self, name))
+        return stats
+
+
+class CachedDACValue:
+    __slots__ = ('value', 'written_at')
+
+    def __init__(self, value: int, written_at: float):
+        self.value = value
+        self.written_at = written_at
+
+
+class I2CBusManager:
+    # Keeps one SMBus handle per bus, serializes its use and skips DAC writes of values the DAC already holds
+    def __init__(self, cache_ttl: float):
+        # Cached values are written again after the TTL, in case the DAC lost its value (e.g. power loss)
+        self._cache_ttl = cache_ttl
+        self._lock = threading.Lock()
+        self._buses = {}
+        self._bus_locks = {}
+        # (bus number, address) => CachedDACValue / DACStats
+        self._values = {}
+        self._stats = {}
+
+    def set_dac_value(self, bus_number: int, address: int, percent_value: int, i2c_delay, sensor_name: str='Unknown', verify: bool=False) -> float:
+        # Returns the seconds until the DAC acknowledged the value, see set_dac_values
+        acks = self.set_dac_values(bus_number=bus_number, percent_values={address: percent_value}, i2c_delay=i2c_delay, sensor_names={address: sensor_name}, verify=verify)
+        return acks.get(address)
+
+    def set_dac_values(self, bus_number: int, percent_values: Dict[int, int], i2c_delay, sensor_names: Dict[int, str]=None, verify: bool=False) -> Dict[int, float]:
+        # Writes all changed DACs of a bus in one go and waits i2c_delay once for all of them.
+        # With verify the DAC registers are read back until they hold the new values, i2c_delay is then only the upper bound.
+        # Returns address => seconds until the DAC acknowledged the value (None if not verified) for every written DAC,
+        # unchanged DACs are skipped and not part of the result.
+        sensor_names = sensor_names or {}
+        for address, percent_value in percent_values.items():
+            if address is None:
+                logger.warning('Sensor %s i2c bus address is not configured.', sensor_names.get(address, 'Unknown'))
+                continue
+            validate_percent_value(value=percent_value)
+
+        written = {}
+        errors = {}
+        with self._get_bus_lock(bus_number):
+            now = time.monotonic()
+            for address, percent_value in percent_values.items():
+                if address is None:
+                    continue
+                value, msg = _get_dac_message(percent_value)
+                key = (bus_number, address)
+                stats = self._get_stats(key)
+                cached = self._values.get(key)
+                if not (cached is None) and cached.value == value and now - cached.written_at < self._cache_ttl:
+                    stats.skipped_writes = stats.skipped_writes + 1
+                    logger.debug('DAC %#x already holds %s (%s %%), skipping write.', address, value, percent_value)
+                    continue
+
+                # Write out I2C command: address, reg_write_dac, msg[0], msg[1]
+                logger.debug('Writing block data to i2c address %#x: [0] => %#x, [1] => %#x', address, msg[0], msg[1])
+                started = time.monotonic()
+                try:
+                    with DAC_WRITE_SECONDS.time(hex(address)):
+                        self._get_bus(bus_number).write_i2c_block_data(address, REG_WRITE_DAC, msg)
+                except OSError as err:
+                    I2C_ERRORS_TOTAL.inc('write')
+                    stats.errors = stats.errors + 1
+                    errors[address] = err
+                    logger.warning('Writing DAC %#x (%s) failed: %s', address, sensor_names.get(address, 'Unknown'), err)
+                    self._reset_bus(bus_number)
+                    continue
+                written_at = time.monotonic()
+                stats.record_write(written_at - started)
+                self._values[key] = CachedDACValue(value=value, written_at=written_at)
+                written[address] = (value, written_at)
+
+            acks = {address: None for address in written}
+            if verify and len(written) > 0:
+                acks = self._wait_for_dac_values(bus_number=bus_number, written=written, timeout=i2c_delay)
+            if len(written) > 0 and None in acks.values():
+                # Unverified DACs get the full delay, counted from the last write
+                last_written_at = max(written_at for value, written_at in written.values())
+                remaining = i2c_delay - (time.monotonic() - last_written_at)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        if len(errors) > 0:
+            raise DACWriteException(errors)
+        return acks
+
+    @contextmanager
+    def transaction(self, bus_number: int, operation: str):
+        # Exclusive use of a bus for devices other than the DACs, the handle is reopened after an I2C error
+        with self._get_bus_lock(bus_number):
+            try:
+                yield self._get_bus(bus_number)
+            except OSError:
+                I2C_ERRORS_TOTAL.inc(operation)
+                self._reset_bus(bus_number)
+                raise
+
+    def stats(self, bus_number: int, address: int) -> tuple:
+        # (cached DAC value or None, DACStats)
+        key = (bus_number, address)
+        with self._lock:
+            cached = self._values.get(key)
+            stats = self._stats.get(key)
+            return (None if cached is None else cached.value, DACStats() if stats is None else stats.copy())
+
+    def close(self):
+        with self._lock:
+            bus_numbers = list(self._buses.keys())
+        for bus_number in bus_numbers:
+            with self._get_bus_lock(bus_number):
+                self._reset_bus(bus_number)
+
+    def _get_bus_lock(self, bus_number: int) -> threading.Lock:
+        with self._lock:
+            lock = self._bus_locks.get(bus_number)
+            if lock is None:
+                lock = threading.Lock()
+                self._bus_locks[bus_number] = lock
+            return lock
+
+    def _get_stats(self, key: tuple) -> DACStats:
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = DACStats()
+                self._stats[key] = stats
+            return stats
+
+    def _get_bus(self, bus_number: int):
+        # Called with the bus lock held
+        bus = self._buses.get(bus_number)
+        if bus is None:
+            logger.debug('Instanciating SMBus: %s', bus_number)
+            bus = SMBus(bus_number)
+            with self._lock:
+                self._buses[bus_number] = bus
+        return bus
+
+    def _reset_bus(self, bus_number: int):
+        # Called with the bus lock held. The handle is reopened on the next write and no cached value is trusted anymore.
+        with self._lock:
+            bus = self._buses.pop(bus_number, None)
+            for key in [key for key in self._values if key[0] == bus_number]:
+                del self._values[key]
+        if bus is None:
+            return
+        try:
+            bus.close()
+        except OSError as err:
+            I2C_ERRORS_TOTAL.inc('close')
+            logger.debug('Closing SMBus %s failed: %s', bus_number, err)
+
+    def _wait_for_dac_values(self, bus_number: int, written: dict, timeout: float) -> Dict[int, float]:
+        # MCP4725 read: status byte (bit 7 is set when the DAC is ready), followed by the 12 bit DAC register (left aligned).
+        # The MCP4725 has no register pointer, a plain read is used, a register read would write a command byte first.
+        acks = {address: None for address in written}
+        pending = set(written.keys())
+        bus = self._get_bus(bus_number)
+        while len(pending) > 0:
+            now = time.monotonic()
+            for address in list(pending):
+                value, written_at = written[address]
+                message = i2c_msg.read(address, 3)
+                try:
+                    bus.i2c_rdwr(message)
+                except OSError as err:
+                    I2C_ERRORS_TOTAL.inc('read')
+                    logger.debug('Could not read back DAC %#x: %s', address, err)
+                    pending.discard(address)
+                    continue
+                data = list(message)
+                if (data[0] & 0x80) and ((data[1] << 4) | (data[2] >> 4)) == value:
+                    acks[address] = time.monotonic() - written_at
+                    pending.discard(address)
+                elif now - written_at >= timeout:
+                    pending.discard(address)
+            if len(pending) > 0:
+                time.sleep(DAC_POLL_INTERVAL)
+        return acks
+
+
+def _get_dac_message(percent_value: int) -> tuple:
     # Create our 12-bit number representing relative voltage
     max_voltage = 0xFFF
     rate = percent_value / 100
     voltage = int(max_voltage * rate) & 0xFFF
-    logger.debug('Voltage: {0} ({1} %)'.format(voltage, percent_value))
+    logger.debug('Voltage: %s (%s %%)', voltage, percent_value)
 
     # Shift everything left by 4 bits and separate bytes
     msg = (voltage & 0xff0) >> 4
     msg = [msg, (msg & 0xf) << 4]
+    # Value of the DAC register after writing msg
+    value = (msg[0] << 4) | (msg[1] >> 4)
+    return value, msg
+
+
+# MCP4725 "write DAC register" command
+REG_WRITE_DAC = 0x40
 
-    # Write out I2C command: address, reg_write_dac, msg[0], msg[1]
-    logger.debug('Writing block data to i2c address {0}: [0] => {1}, [1] => {2}'.format(str(hex(address)), str(hex(msg[0])), str(hex(msg[1]))))
-    bus.write_i2c_block_data(address, reg_write_dac, msg)
-    time.sleep(i2c_delay)
-    logger.debug('done.')
+# Seconds between two read backs of a DAC register while waiting for a written value
+DAC_POLL_INTERVAL = 0.002
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from config.flask_config import ResourceException
+from config.logger import logging, get_logger_name
+from utils.cache import TTLCache, SingleFlight, MISSING
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class CachedResource:
+    __slots__ = ('data', 'etag', 'fetched_at')
+
+    def __init__(self, data: dict, etag: str, fetched_at: float):
+        self.data = data
+        self.etag = etag
+        self.fetched_at = fetched_at
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class LookupCache:
+    # fetch(token, url, etag) returns (data, etag), data is None if the resource was not modified.
+    # Entries are kept per caller, (sha256(token), url) => CachedResource: a resource fetched with one token is never served to another,
+    # so the WebAPI still decides for every caller whether it may see the resource.
+    def __init__(self, fetch: Callable, executor: ThreadPoolExecutor, fresh_ttl: float, stale_ttl: float, max_size: int = 256):
+        self._fetch = fetch
+        self._executor = executor
+        self._fresh_ttl = fresh_ttl
+        self._stale_ttl = stale_ttl
+        self._entries = TTLCache(max_size=max_size, ttl=stale_ttl)
+        self._single_flight = SingleFlight()
+        self._revalidating = set()
+        self._lock = threading.Lock()
+
+    def peek(self, token: str, url: str) -> dict:
+        # Cached data of the caller only, never causes a request
+        entry = self._entries.get(_get_key(token, url))
+        if entry is MISSING:
+            return None
+        return entry.data
+
+    def get(self, token: str, url: str) -> dict:
+        key = _get_key(token, url)
+        entry = self._entries.get(key)
+        if entry is MISSING:
+            return self._single_flight.do(key, lambda: self._load(token, url, key, None)).data
+        if entry.age() >= self._fresh_ttl:
+            # Stale while revalidate: the cached data is returned right away and refreshed in the background
+            self._revalidate_in_background(token, url, key, entry)
+        return entry.data
+
+    def _revalidate_in_background(self, token: str, url: str, key: tuple, entry: CachedResource):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def _revalidate():
+            try:
+                self._single_flight.do(key, lambda: self._load(token, url, key, entry))
+            except ResourceException as err:
+                if err.status_code in (401, 403):
+                    # The caller may not see the resource any longer, the cached data must not be served again
+                    self._entries.delete(key)
+                logger.warning('Revalidating %s failed: %s (%s)', url, err.message, err.status_code)
+            except Exception as err:
+                logger.warning('Revalidating %s failed: %s', url, err)
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+        self._executor.submit(_revalidate)
+
+    def _load(self, token: str, url: str, key: tuple, entry: CachedResource) -> CachedResource:
+        etag = None if entry is None else entry.etag
+        data, new_etag = self._fetch(token, url, etag)
+        if data is None:
+            logger.debug('%s not modified.', url)
+            data = entry.data
+            new_etag = new_etag or etag
+        new_entry = CachedResource(data=data, etag=new_etag, fetched_at=time.monotonic())
+        self._entries.set(key, new_entry)
+        return new_entry
+
+
+def _get_key(token: str, url: str) -> tuple:
+    return (hashlib.sha256(token.encode('utf-8')).hexdigest(), url)
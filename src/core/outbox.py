@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from config.flask_config import ResourceException
+from config.logger import logging, get_logger_name
+from utils.files import atomic_write
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class OutboxEntry:
+    PENDING = 'pending'
+    # The token of the user expired or is unknown after a restart, the report waits for the next token of the user
+    AWAITING_TOKEN = 'awaiting_token'
+    REPORTED = 'reported'
+    FAILED = 'failed'
+
+    def __init__(self, local_id: str, owner: str, job: dict, created_at: float, token: str = None):
+        self.local_id = local_id
+        # User the job is reported for, see JobOutbox
+        self.owner = owner
+        # Only kept in memory, tokens are never written to the journal
+        self.token = token
+        self.job = job
+        self.created_at = created_at
+        self.state = OutboxEntry.PENDING if token else OutboxEntry.AWAITING_TOKEN
+        self.server_job = None
+        self.message = None
+
+    def to_record(self) -> dict:
+        return {
+            'op': 'append',
+            'local_id': self.local_id,
+            'owner': self.owner,
+            'job': self.job,
+            'created_at': self.created_at
+        }
+
+
+class JobOutbox:
+    # Journal records (one JSON object per line):
+    # {"op": "append", "local_id": ..., "owner": ..., "job": {...}, "created_at": ...}
+    # {"op": "ack", "local_id": ..., "server_job": {...}}
+    # {"op": "fail", "local_id": ..., "message": ...}
+    # Reports are sent with the token of their user. The journal only holds the owner (get_owner(token)) of a report,
+    # reports without a token in memory wait until provide_token is called with a token of their owner.
+    def __init__(self, journal_path: Path, send: Callable[[str, dict], dict], get_owner: Callable[[str], str], batch_size: int = 10, min_backoff: float = 1, max_backoff: float = 300, max_finished: int = 256):
+        self._journal_path = Path(journal_path)
+        self._send = send
+        self._get_owner = get_owner
+        self._batch_size = batch_size
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._max_finished = max_finished
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()
+        self._finished = OrderedDict()
+        self._journal_records = 0
+        self._stop = False
+        self._thread = None
+        self._replay()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def get(self, local_id: str) -> OutboxEntry:
+        with self._condition:
+            entry = self._pending.get(local_id)
+            if entry is None:
+                entry = self._finished.get(local_id)
+            return entry
+
+    def append(self, token: str, job: dict) -> OutboxEntry:
+        entry = OutboxEntry(local_id=uuid.uuid4().hex, owner=self._get_owner(token), job=dict(job), created_at=time.time(), token=token)
+        with self._condition:
+            self._write_record(entry.to_record())
+            self._pending[entry.local_id] = entry
+            self._condition.notify_all()
+        logger.debug('Job %s added to outbox.', entry.local_id)
+        return entry
+
+    def provide_token(self, token: str):
+        # Hands a fresh token of a user to the pending reports of the user, reports waiting for it are sent again
+        owner = self._get_owner(token)
+        provided = 0
+        with self._condition:
+            for entry in self._pending.values():
+                if entry.owner != owner:
+                    continue
+                entry.token = token
+                if entry.state == OutboxEntry.AWAITING_TOKEN:
+                    entry.state = OutboxEntry.PENDING
+                    provided = provided + 1
+            if provided > 0:
+                self._condition.notify_all()
+        if provided > 0:
+            logger.info('Token provided for %s waiting job report(s).', provided)
+
+    # Journal
+
+    def _replay(self):
+        if not self._journal_path.exists():
+            return
+        # Journals may hold tokens of older versions, only the owner may read them
+        os.chmod(str(self._journal_path), JOURNAL_FILE_MODE)
+        legacy_tokens = False
+        with open(self._journal_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the last record can be torn by a crash while appending
+                    logger.warning('Skipping corrupt record in %s', self._journal_path)
+                    continue
+                self._journal_records = self._journal_records + 1
+                legacy_tokens = legacy_tokens or ('token' in record)
+                self._apply(record)
+        if legacy_tokens:
+            # The tokens stay in memory only
+            self._compact(force=True)
+        logger.info('Replayed job outbox: %s pending report(s).', len(self._pending))
+
+    def _apply(self, record: dict):
+        op = record.get('op')
+        local_id = record.get('local_id')
+        if op == 'append':
+            token = record.get('token')
+            owner = record.get('owner') or self._get_owner(token)
+            entry = OutboxEntry(local_id=local_id, owner=owner, job=record['job'], created_at=record['created_at'], token=token)
+            self._pending[local_id] = entry
+            return
+        entry = self._pending.pop(local_id, None)
+        if entry is None:
+            return
+        if op == 'ack':
+            entry.state = OutboxEntry.REPORTED
+            entry.server_job = record.get('server_job')
+        elif op == 'fail':
+            entry.state = OutboxEntry.FAILED
+            entry.message = record.get('message')
+        self._add_finished(entry)
+
+    def _add_finished(self, entry: OutboxEntry):
+        # Tokens are only needed for pending reports
+        entry.token = None
+        self._finished[entry.local_id] = entry
+        while len(self._finished) > self._max_finished:
+            self._finished.popitem(last=False)
+
+    def _write_record(self, record: dict):
+        fd = os.open(str(self._journal_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, JOURNAL_FILE_MODE)
+        with os.fdopen(fd, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records = self._journal_records + 1
+
+    def _finish(self, entry: OutboxEntry, record: dict):
+        with self._condition:
+            self._write_record(record)
+            self._apply(record)
+            self._compact()
+
+    def _compact(self, force: bool = False):
+        # Rewrites the journal with the pending reports only, once everything else is obsolete
+        obsolete_records = self._journal_records - len(self._pending)
+        if not force and obsolete_records < JOURNAL_COMPACTION_THRESHOLD:
+            return
+        content = ''.join(json.dumps(entry.to_record()) + '\n' for entry in self._pending.values())
+        atomic_write(self._journal_path, content, mode=JOURNAL_FILE_MODE)
+        self._journal_records = len(self._pending)
+        logger.debug('Compacted job outbox journal.')
+
+    # Worker
+
+    def start(self):
+        if not (self._thread is None) and self._thread.is_alive():
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='job-outbox')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if not (self._thread is None):
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        backoff = self._min_backoff
+        while True:
+            with self._condition:
+                while not self._stop and len(self._get_sendable()) == 0:
+                    self._condition.wait()
+                if self._stop:
+                    return
+                batch = self._get_sendable()[:self._batch_size]
+
+            if self._flush(batch):
+                backoff = self._min_backoff
+                continue
+
+            logger.info('Reporting jobs failed, retrying in %s seconds.', backoff)
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop, timeout=backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+
+    def _get_sendable(self):
+        # A report waiting for a token holds back the later reports of its user, reports of other users do not depend on it
+        waiting_owners = set()
+        sendable = []
+        for entry in self._pending.values():
+            if entry.state != OutboxEntry.PENDING or entry.owner in waiting_owners:
+                waiting_owners.add(entry.owner)
+                continue
+            sendable.append(entry)
+        return sendable
+
+    def _flush(self, batch) -> bool:
+        # Reports are sent strictly in order, a failing report blocks the ones after it. The reports of a batch share the
+        # pooled WebAPI connection, the WebAPI takes one job per request.
+        for entry in batch:
+            token = entry.token
+            try:
+                server_job = self._send(token, entry.job)
+            except ResourceException as err:
+                if err.status_code == 401:
+                    # Not a verdict on the job, the report is sent again with the next token of its user
+                    logger.info('Token of job %s not accepted, waiting for a new one.', entry.local_id)
+                    with self._condition:
+                        if entry.token == token:
+                            entry.token = None
+                            entry.state = OutboxEntry.AWAITING_TOKEN
+                    # The rest of the batch may hold later reports of the user, the next batch leaves them out
+                    return True
+                if _is_retryable(err.status_code):
+                    logger.warning('Reporting job %s failed: %s (%s)', entry.local_id, err.message, err.status_code)
+                    return False
+                logger.error('Job %s rejected by WebAPI: %s (%s)', entry.local_id, err.message, err.status_code)
+                self._finish(entry, {'op': 'fail', 'local_id': entry.local_id, 'message': err.message})
+                continue
+            except Exception as err:
+                logger.warning('Reporting job %s failed: %s', entry.local_id, err)
+                return False
+            self._finish(entry, {'op': 'ack', 'local_id': entry.local_id, 'server_job': server_job})
+            logger.debug('Job %s reported.', entry.local_id)
+        return True
+
+
+def _is_retryable(status_code: int) -> bool:
+    return status_code >= 500 or status_code in (408, 429)
+
+
+# Mode of the journal, it holds jobs of the users
+JOURNAL_FILE_MODE = 0o600
+
+# Number of obsolete journal records (reported or failed jobs) before the journal gets rewritten
+JOURNAL_COMPACTION_THRESHOLD = 100
@@ -0,0 +1,139 @@
+import threading
+
+from typing import Dict, List
+
+from core.hardware import GPIO
+from core.pins import PIN_CONFIGURATION
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class OutputDriver:
+    # Drives the button and relais outputs by name. Changes are staged and written together by commit,
+    # so several outputs (e.g. the relais and a button) change in one operation.
+    def __init__(self, idle: Dict[str, bool]):
+        self._lock = threading.RLock()
+        self._idle = dict(idle)
+        self._staged = dict(idle)
+        # Values on the hardware, None until the first commit
+        self._written = None
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._idle.keys())
+
+    def idle_value(self, name: str) -> bool:
+        return self._idle[name]
+
+    def value(self, name: str) -> bool:
+        with self._lock:
+            written = self._written
+            return self._idle[name] if written is None else written[name]
+
+    def pins(self) -> Dict[int, bool]:
+        # GPIO => initial value of the pins the driver writes to
+        raise NotImplementedError
+
+    def stage(self, name: str, value: bool):
+        if not (name in self._idle):
+            raise ValueError('Unknown output: {}'.format(name))
+        with self._lock:
+            self._staged[name] = bool(value)
+
+    def commit(self):
+        with self._lock:
+            if self._staged == self._written:
+                return
+            self._setup_pins()
+            values = dict(self._staged)
+            self._write(values)
+            self._written = values
+
+    def apply(self, values: Dict[str, bool]):
+        # Stages and commits the values as one change
+        with self._lock:
+            for name, value in values.items():
+                self.stage(name, value)
+            self.commit()
+
+    def reset(self):
+        # Writes the idle values, also if the hardware is believed to hold them already
+        with self._lock:
+            self._written = None
+            self.apply(self._idle)
+
+    def release(self):
+        # The pins are cleaned up by their owner, the next commit writes all outputs again
+        with self._lock:
+            self._staged = dict(self._idle)
+            self._written = None
+
+    def _setup_pins(self):
+        # Pins that were not configured for the process are set up on first use and kept
+        for gpio, value in self.pins().items():
+            if not PIN_CONFIGURATION.is_output(gpio):
+                GPIO.setmode(GPIO.BCM)
+                GPIO.setup(gpio, GPIO.OUT, initial=GPIO.HIGH if value else GPIO.LOW)
+
+    def _write(self, values: Dict[str, bool]):
+        raise NotImplementedError
+
+
+class GPIOOutputDriver(OutputDriver):
+    # One Raspberry Pi GPIO per output
+    def __init__(self, pins: Dict[str, int], idle: Dict[str, bool]):
+        super().__init__(idle=idle)
+        self._pins = dict(pins)
+
+    def pins(self) -> Dict[int, bool]:
+        return {gpio: self._idle[name] for name, gpio in self._pins.items()}
+
+    def _write(self, values: Dict[str, bool]):
+        written = self._written
+        changed = [name for name, value in values.items() if written is None or written[name] != value]
+        # One call for all changed pins
+        GPIO.output([self._pins[name] for name in changed], [GPIO.HIGH if values[name] else GPIO.LOW for name in changed])
+
+
+class ShiftRegisterOutputDriver(OutputDriver):
+    # 74HC4094: the outputs are shifted in bit by bit while the strobe is LOW, the strobe pulse latches all of them at once.
+    # Outputs keep their values while shifting, so a commit never shows intermediate states.
+    def __init__(self, strobe_gpio: int, data_gpio: int, clock_gpio: int, bits: Dict[str, int], idle: Dict[str, bool], length: int = 8):
+        super().__init__(idle=idle)
+        self._strobe_gpio = strobe_gpio
+        self._data_gpio = data_gpio
+        self._clock_gpio = clock_gpio
+        # Output => parallel output QP0 to QPn
+        self._bits = dict(bits)
+        self._length = length
+        self._frames = 0
+
+    @property
+    def frames(self) -> int:
+        # Number of latched shift-out transactions
+        return self._frames
+
+    def pins(self) -> Dict[int, bool]:
+        return {self._strobe_gpio: False, self._data_gpio: False, self._clock_gpio: False}
+
+    def frame(self, values: Dict[str, bool]) -> int:
+        frame = 0
+        for name, bit in self._bits.items():
+            if values[name]:
+                frame = frame | (1 << bit)
+        return frame
+
+    def _write(self, values: Dict[str, bool]):
+        frame = self.frame(values)
+        GPIO.output(self._strobe_gpio, GPIO.LOW)
+        # Every clock moves the bits one output further, the highest bit goes first and ends up on the last output
+        for bit in range(self._length - 1, -1, -1):
+            GPIO.output(self._data_gpio, GPIO.HIGH if (frame >> bit) & 1 else GPIO.LOW)
+            GPIO.output(self._clock_gpio, GPIO.HIGH)
+            GPIO.output(self._clock_gpio, GPIO.LOW)
+        GPIO.output(self._strobe_gpio, GPIO.HIGH)
+        GPIO.output(self._strobe_gpio, GPIO.LOW)
+        self._frames = self._frames + 1
+        logger.debug('Shift register latched %#04x.', frame)
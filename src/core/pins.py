@@ -0,0 +1,59 @@
+import threading
+
+from typing import Dict, List
+
+from core.hardware import GPIO
+
+
+class PinConfiguration:
+    # Sets up the GPIO pins once for the whole process. Configured pins are not set up or cleaned up again
+    # by setup_inputs users, other pins are still set up and cleaned up on every use.
+    # Outputs are only written through an OutputDriver, see core/outputs.py
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inputs = frozenset()
+        self._outputs = frozenset()
+
+    def configure(self, in_pins: List[int], out_pins: Dict[int, bool]):
+        # out_pins: pin => idle value
+        with self._lock:
+            GPIO.setmode(GPIO.BCM)
+            for gpio in in_pins:
+                GPIO.setup(gpio, GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
+            for gpio, value in out_pins.items():
+                GPIO.setup(gpio, GPIO.OUT, initial = GPIO.HIGH if value else GPIO.LOW)
+            self._inputs = self._inputs.union(in_pins)
+            self._outputs = self._outputs.union(out_pins.keys())
+
+    def release(self):
+        with self._lock:
+            pins = list(self._inputs.union(self._outputs))
+            self._inputs = frozenset()
+            self._outputs = frozenset()
+            if len(pins) > 0:
+                GPIO.cleanup(pins)
+
+    def is_configured(self) -> bool:
+        return len(self._inputs) > 0 or len(self._outputs) > 0
+
+    def are_inputs(self, gpio_numbers: List[int]) -> bool:
+        inputs = self._inputs
+        return all(gpio in inputs for gpio in gpio_numbers)
+
+    def is_output(self, gpio_number: int) -> bool:
+        return gpio_number in self._outputs
+
+
+PIN_CONFIGURATION = PinConfiguration()
+
+
+def setup_inputs(gpio_numbers: List[int], session = None) -> bool:
+    # Returns whether the caller has to clean up the pins afterwards
+    if PIN_CONFIGURATION.are_inputs(gpio_numbers):
+        return False
+    if session is None:
+        GPIO.setmode(GPIO.BCM)
+    for gpio in gpio_numbers:
+        GPIO.setup(gpio, GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
+    return session is None
+
@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, Connection
+from typing import Callable
+
+from models import DeviceStatus
+from config.flask_config import ResourceException
+from config.logger import logging, get_logger_name
+from core.snapshot import StatusCache, StatusDemand, StatusSnapshot
+from utils.profiling import recording, add_spans
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class HardwareServer:
+    # Runs in the hardware owner process: executes the controller calls of the HTTP workers
+    # and pushes every published status snapshot to the workers that subscribed to it.
+    def __init__(self, socket_path: str, authkey: bytes, services: dict, refresh_status: Callable, status_cache: StatusCache, push_interval: float):
+        self._socket_path = socket_path
+        self._authkey = authkey
+        # Name => object whose public methods can be called
+        self._services = services
+        # Makes sure the status cache holds a recent snapshot while the status is asked for, reads the hardware only if none was published lately
+        self._refresh_status = refresh_status
+        self._status_cache = status_cache
+        # Longest time without a push, keeps the snapshots of the workers fresh
+        self._push_interval = push_interval
+        self._listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self._socket_path):
+            # Left over from a process that did not shut down cleanly
+            os.unlink(self._socket_path)
+        self._listener = Listener(self._socket_path, family='AF_UNIX', authkey=self._authkey)
+        logger.info('Hardware server listening on %s.', self._socket_path)
+        try:
+            while True:
+                try:
+                    connection = self._listener.accept()
+                except (OSError, EOFError) as err:
+                    # Failed authentication or a client that went away during the handshake
+                    logger.warning('Accepting hardware connection failed: %s', err)
+                    continue
+                thread = threading.Thread(target=self._handle, args=(connection,), name='hardware-connection')
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.close()
+
+    def close(self):
+        if not (self._listener is None):
+            self._listener.close()
+            self._listener = None
+
+    def _handle(self, connection: Connection):
+        try:
+            while True:
+                request = connection.recv()
+                if request[0] == 'subscribe':
+                    self._push_snapshots(connection)
+                    return
+                _, service, method, args, kwargs = request
+                # The steps timed in this process go back with the result, see Server-Timing
+                with recording() as recorder:
+                    result, value = self._call(service, method, args, kwargs)
+                connection.send((result, value, recorder.spans))
+        except (EOFError, OSError):
+            # The worker closed the connection
+            pass
+        finally:
+            connection.close()
+
+    def _call(self, service: str, method: str, args: tuple, kwargs: dict) -> tuple:
+        target = self._services.get(service)
+        if target is None or method.startswith('_') or not hasattr(target, method):
+            return ('error', ('{0}.{1} ist unbekannt.'.format(service, method), 501, None, None))
+        try:
+            return ('ok', getattr(target, method)(*args, **kwargs))
+        except ResourceException as err:
+            return ('error', (err.message, err.status_code, err.payload, err.headers))
+        except Exception:
+            logger.exception('Hardware call %s.%s failed.', service, method)
+            return ('error', ('Interner Fehler der Kaffeemaschine.', 500, None, None))
+
+    def _push_snapshots(self, connection: Connection):
+        created_at = None
+        while True:
+            snapshot = self._status_cache.snapshot
+            if not (snapshot is None) and snapshot.created_at != created_at:
+                created_at = snapshot.created_at
+                connection.send(('snapshot', snapshot.status, snapshot.version))
+            version = 0 if snapshot is None else snapshot.version
+            if self._status_cache.wait_for_update(version=version, timeout=self._push_interval) is snapshot:
+                try:
+                    self._refresh_status()
+                except Exception:
+                    logger.exception('Reading device status for the workers failed.')
+
+
+class HardwareClient:
+    # Runs in the HTTP workers: one connection to the hardware owner per thread
+    def __init__(self, socket_path: str, authkey: bytes):
+        self._socket_path = socket_path
+        self._authkey = authkey
+        self._local = threading.local()
+
+    def connect(self) -> Connection:
+        return Client(self._socket_path, family='AF_UNIX', authkey=self._authkey)
+
+    def call(self, service: str, method: str, *args, **kwargs):
+        connection = getattr(self._local, 'connection', None)
+        try:
+            if connection is None:
+                connection = self.connect()
+                self._local.connection = connection
+            connection.send(('call', service, method, args, kwargs))
+            result, value, spans = connection.recv()
+        except (OSError, EOFError, AuthenticationError) as err:
+            # Calls are not repeated, they may already have reached the machine
+            logger.warning('Hardware call %s.%s failed: %s', service, method, err)
+            self._local.connection = None
+            if not (connection is None):
+                connection.close()
+            raise ResourceException(status_code=503, message='Kaffeemaschine ist nicht erreichbar.')
+        add_spans(spans)
+        if result == 'error':
+            message, status_code, payload, headers = value
+            raise ResourceException(message=message, status_code=status_code, payload=payload, headers=headers)
+        return value
+
+
+class RemoteController:
+    # Stands in for a controller of the hardware owner, every method call is sent over the hardware connection
+    def __init__(self, name: str, client: HardwareClient):
+        self._name = name
+        self._client = client
+
+    def __getattr__(self, method: str) -> Callable:
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def _call(*args, **kwargs):
+            return self._client.call(self._name, method, *args, **kwargs)
+        return _call
+
+
+class StatusMirror:
+    # Copy of the status snapshots of the hardware owner in an HTTP worker.
+    # Offers the status reads of CoffeeMachineHardwareAPI, so status requests never leave the worker.
+    # Only the demand is passed on, at most every STATUS_DEMAND_INTERVAL, so the samplers of the owner keep running.
+    def __init__(self, connect: Callable[[], Connection], max_age: float, touch: Callable[[], None] = None):
+        self._connect = connect
+        self._max_age = max_age
+        self._touch = touch
+        self._touched_at = None
+        self._cache = StatusCache()
+        self._thread = None
+
+    def start(self):
+        if not (self._thread is None) and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='status-mirror')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def status(self) -> DeviceStatus:
+        return self.get_status_snapshot().status
+
+    def get_status_snapshot(self) -> StatusSnapshot:
+        self._request_status()
+        snapshot = self._cache.get(max_age=self._max_age)
+        if snapshot is None:
+            # Right after the start of the worker or while the hardware owner is restarting
+            self._cache.wait_for_update(version=self._cache_version(), timeout=self._max_age)
+            snapshot = self._cache.get(max_age=self._max_age)
+        if snapshot is None:
+            raise ResourceException(status_code=503, message='Kaffeemaschine ist nicht erreichbar.')
+        return snapshot
+
+    def wait_for_snapshot(self, version: int, timeout: float) -> StatusSnapshot:
+        self._request_status()
+        self._cache.wait_for_version(version=version, timeout=timeout)
+        return self.get_status_snapshot()
+
+    def _request_status(self):
+        now = time.monotonic()
+        touched_at = self._touched_at
+        if self._touch is None or (not (touched_at is None) and now - touched_at < STATUS_DEMAND_INTERVAL):
+            return
+        # Set before the call, concurrent readers do not pass the demand on as well
+        self._touched_at = now
+        try:
+            self._touch()
+        except ResourceException as err:
+            logger.debug('Passing the status demand on failed: %s', err.message)
+            self._touched_at = None
+
+    def _cache_version(self) -> int:
+        snapshot = self._cache.snapshot
+        return 0 if snapshot is None else snapshot.version
+
+    def _run(self):
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                connection.send(('subscribe',))
+                while True:
+                    _, status, version = connection.recv()
+                    self._cache.publish(status, version=version)
+            except (OSError, EOFError, AuthenticationError) as err:
+                logger.warning('Status mirror lost the hardware connection: %s', err)
+            finally:
+                if not (connection is None):
+                    connection.close()
+            time.sleep(HARDWARE_RECONNECT_DELAY)
+
+
+_HARDWARE_CLIENT = None
+
+_STATUS_MIRROR = None
+
+
+def connect_hardware(socket_path: str, authkey: bytes, max_age: float):
+    # Called in every HTTP worker, afterwards the controllers run in the hardware owner process
+    global _HARDWARE_CLIENT, _STATUS_MIRROR
+    _HARDWARE_CLIENT = HardwareClient(socket_path=socket_path, authkey=authkey)
+    _STATUS_MIRROR = StatusMirror(connect=_HARDWARE_CLIENT.connect, max_age=max_age, touch=lambda: _HARDWARE_CLIENT.call(StatusDemand.__name__, 'touch'))
+    _STATUS_MIRROR.start()
+
+
+def get_controller(controller_class):
+    # HTTP workers send the controller calls to the hardware owner process, see serving.py
+    client = _HARDWARE_CLIENT
+    if client is None:
+        return controller_class()
+    return RemoteController(name=controller_class.__name__, client=client)
+
+
+def get_hardware_client() -> HardwareClient:
+    # None if this process owns the hardware itself
+    return _HARDWARE_CLIENT
+
+
+def get_status_mirror() -> StatusMirror:
+    return _STATUS_MIRROR
+
+
+# Seconds between reconnects of the status mirror to the hardware owner
+HARDWARE_RECONNECT_DELAY = 1
+
+# Seconds between two status demands a worker passes on to the hardware owner, well below STATUS_IDLE_TIME
+STATUS_DEMAND_INTERVAL = 5
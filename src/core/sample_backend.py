@@ -0,0 +1,107 @@
+import atexit
+import ctypes
+import time
+
+from typing import List
+
+import numpy as np
+
+from core.hardware import GPIO, is_simulated
+from core.pins import setup_inputs
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+# A sample backend fills two preallocated arrays with one entry per pass:
+# masks (uint32): bit i is the level of gpio_numbers[i]
+# timestamps (uint64): monotonic time of the pass in nanoseconds
+MAX_PINS = 32
+
+
+def _check_buffers(gpio_numbers: List[int], masks: np.ndarray, timestamps: np.ndarray):
+    if len(gpio_numbers) < 1 or len(gpio_numbers) > MAX_PINS:
+        raise ValueError('Between 1 and {0} pins can be sampled at once, got {1}'.format(MAX_PINS, len(gpio_numbers)))
+    if masks.dtype != np.uint32 or timestamps.dtype != np.uint64:
+        raise ValueError('Sample buffers must be of type uint32 (masks) and uint64 (timestamps)')
+    if not (masks.flags['C_CONTIGUOUS'] and timestamps.flags['C_CONTIGUOUS']):
+        raise ValueError('Sample buffers must be C contiguous')
+    if masks.shape[0] != timestamps.shape[0]:
+        raise ValueError('Sample buffers must have the same length')
+
+
+class PythonSampleBackend:
+    name = 'python'
+
+    def sample(self, gpio_numbers: List[int], masks: np.ndarray, timestamps: np.ndarray, session = None):
+        _check_buffers(gpio_numbers=gpio_numbers, masks=masks, timestamps=timestamps)
+        cleanup = setup_inputs(gpio_numbers=gpio_numbers, session=session)
+
+        _input = GPIO.input
+        _monotonic_ns = time.monotonic_ns
+        bits = [(gpio, 1 << i) for i, gpio in enumerate(gpio_numbers)]
+        for p in range(masks.shape[0]):
+            mask = 0
+            for gpio, bit in bits:
+                if _input(gpio):
+                    mask |= bit
+            masks[p] = mask
+            timestamps[p] = _monotonic_ns()
+
+        if cleanup:
+            GPIO.cleanup(gpio_numbers)
+
+
+class NativeSampleBackend:
+    name = 'native'
+
+    def __init__(self, library_path: str):
+        lib = ctypes.CDLL(library_path)
+        lib.read_gpio_initialise.argtypes = []
+        lib.read_gpio_initialise.restype = ctypes.c_int
+        lib.read_gpio_terminate.argtypes = []
+        lib.read_gpio_terminate.restype = None
+        lib.read_gpio_samples.argtypes = [
+            ctypes.POINTER(ctypes.c_uint32),
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.POINTER(ctypes.c_uint32),
+            ctypes.POINTER(ctypes.c_uint64)
+        ]
+        lib.read_gpio_samples.restype = ctypes.c_int
+        if lib.read_gpio_initialise() < 0:
+            raise OSError('pigpio initialisation failed')
+        atexit.register(lib.read_gpio_terminate)
+        self._lib = lib
+        self._pins = {}
+
+    def sample(self, gpio_numbers: List[int], masks: np.ndarray, timestamps: np.ndarray, session = None):
+        _check_buffers(gpio_numbers=gpio_numbers, masks=masks, timestamps=timestamps)
+        key = tuple(gpio_numbers)
+        pins = self._pins.get(key)
+        if pins is None:
+            pins = (ctypes.c_uint32 * len(key))(*key)
+            self._pins[key] = pins
+        # ctypes releases the GIL for the duration of the call, the library writes directly into the numpy buffers
+        result = self._lib.read_gpio_samples(
+            pins,
+            len(key),
+            masks.shape[0],
+            masks.ctypes.data_as(ctypes.POINTER(ctypes.c_uint32)),
+            timestamps.ctypes.data_as(ctypes.POINTER(ctypes.c_uint64))
+        )
+        if result < 0:
+            raise OSError('Native GPIO sampling failed with code {}'.format(result))
+
+
+def load_sample_backend(name: str, library_path: str = None):
+    if name == NativeSampleBackend.name and is_simulated():
+        logger.warning('Native GPIO sample backend is not available for simulated hardware. Falling back to %s.', PythonSampleBackend.name)
+    elif name == NativeSampleBackend.name:
+        try:
+            return NativeSampleBackend(library_path=library_path)
+        except OSError as err:
+            logger.warning('Native GPIO sample backend not available (%s). Falling back to %s.', err, PythonSampleBackend.name)
+    elif name != PythonSampleBackend.name:
+        raise ValueError('Unknown GPIO sample backend: {}'.format(name))
+    return PythonSampleBackend()
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from typing import Callable
+
+from core.exceptions import DeviceBlockedException
+from core.snapshot import StatusCache
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class SessionState:
+    # No session, the relay is open
+    IDLE = 'idle'
+    # A caller owns the session and controls the machine
+    ACTIVE = 'active'
+    # The caller is done, the relay is released once the machine is ready again
+    RELEASING = 'releasing'
+
+
+class SessionSupervisor:
+    # Owns the relay session: IDLE -(acquire)-> ACTIVE -(release)-> RELEASING -(device settled or timeout)-> IDLE.
+    # A single long-lived thread watches the published status snapshots while a session is releasing.
+    def __init__(self, open_relay: Callable[[], None], close_relay: Callable[[], None], refresh_status: Callable, status_cache: StatusCache, refresh_interval: float, ready_stable_time: float, max_release_wait: float, is_settled: Callable = None):
+        self._open_relay = open_relay
+        self._close_relay = close_relay
+        # Makes sure the status cache holds a recent snapshot, reads the hardware only if none was published lately
+        self._refresh_status = refresh_status
+        self._status_cache = status_cache
+        # Longest wait for a published snapshot before the status is refreshed again
+        self._refresh_interval = refresh_interval
+        # The machine must report ready for this long, so a blinking LED does not release the relay
+        self._ready_stable_time = ready_stable_time
+        # Whether a status ends the session: the machine is ready, off or needs the user
+        self._is_settled = (lambda status: status.device_ready) if is_settled is None else is_settled
+        self._max_release_wait = max_release_wait
+        self._condition = threading.Condition()
+        self._state = SessionState.IDLE
+        self._owner = None
+        self._opened_at = None
+        self._release_requested_at = None
+        self._sessions_opened = 0
+        self._releases_on_ready = 0
+        self._releases_on_timeout = 0
+        self._thread = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def is_idle(self) -> bool:
+        return self._state == SessionState.IDLE
+
+    def info(self) -> dict:
+        with self._condition:
+            return {
+                'state': self._state,
+                'opened_at': self._opened_at,
+                'release_requested_at': self._release_requested_at,
+                'sessions_opened': self._sessions_opened,
+                'releases_on_ready': self._releases_on_ready,
+                'releases_on_timeout': self._releases_on_timeout
+            }
+
+    def acquire(self, owner):
+        # If you want to start a new session, but the old session is still active
+        if not self.try_acquire(owner):
+            raise DeviceBlockedException
+
+    def try_acquire(self, owner) -> bool:
+        # Opens the session if it is idle, returns whether it did
+        with self._condition:
+            if self._state != SessionState.IDLE:
+                return False
+            self._state = SessionState.ACTIVE
+            self._owner = owner
+            self._opened_at = time.time()
+            self._release_requested_at = None
+            self._sessions_opened = self._sessions_opened + 1
+        try:
+            self._open_relay()
+        except BaseException:
+            with self._condition:
+                self._set_idle()
+            raise
+        self._status_cache.notify()
+        return True
+
+    def release(self, owner):
+        with self._condition:
+            if self._state != SessionState.ACTIVE or not (self._owner is owner):
+                logger.warning('Ignoring release of a session that is not active.')
+                return
+            self._state = SessionState.RELEASING
+            self._release_requested_at = time.time()
+            self._start()
+            self._condition.notify_all()
+
+    def _start(self):
+        if not (self._thread is None) and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='session-supervisor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _set_idle(self):
+        self._state = SessionState.IDLE
+        self._owner = None
+        self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._state != SessionState.RELEASING:
+                    self._condition.wait()
+
+            ready = self._wait_until_ready()
+            try:
+                self._close_relay()
+            except Exception:
+                logger.exception('Closing relay session failed.')
+            with self._condition:
+                if ready:
+                    self._releases_on_ready = self._releases_on_ready + 1
+                else:
+                    self._releases_on_timeout = self._releases_on_timeout + 1
+                self._set_idle()
+            self._status_cache.notify()
+            logger.debug('Relay session released (%s).', 'device settled' if ready else 'timeout')
+
+    def _wait_until_ready(self) -> bool:
+        # Only snapshots taken after the release count, earlier ones may predate the last button press
+        requested_at = time.monotonic()
+        deadline = requested_at + self._max_release_wait
+        ready_since = None
+        version = 0
+        last_created_at = None
+        while True:
+            try:
+                self._refresh_status()
+            except Exception:
+                logger.exception('Reading device status while releasing session failed.')
+            snapshot = self._status_cache.snapshot
+            if not (snapshot is None) and snapshot.created_at != last_created_at:
+                version = snapshot.version
+                last_created_at = snapshot.created_at
+                if snapshot.created_at >= requested_at:
+                    if not self._is_settled(snapshot.status):
+                        ready_since = None
+                    elif ready_since is None:
+                        ready_since = snapshot.created_at
+            now = time.monotonic()
+            if not (ready_since is None) and now - ready_since >= self._ready_stable_time:
+                return True
+            if now >= deadline:
+                logger.debug('Device not settled after %s seconds, releasing session anyway.', self._max_release_wait)
+                return False
+            timeout = min(deadline - now, self._refresh_interval)
+            if not (ready_since is None):
+                timeout = min(timeout, ready_since + self._ready_stable_time - now)
+            self._status_cache.wait_for_update(version=version, timeout=timeout)
@@ -0,0 +1,502 @@
+import threading
+import time
+
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class SimulatedCoffeeMachine:
+    # Runtime states of the simulated machine
+    OFF = 'off'
+    STARTUP = 'startup'
+    ON = 'on'
+    SHUTDOWN = 'shutdown'
+
+    # Durations in seconds, multiplied by the time scale
+    BUTTON_RECOGNITION_DELAY = 0.15
+    STARTUP_DURATION = 20.0
+    SHUTDOWN_DURATION = 10.0
+    BREW_DURATION_PER_DOSE = 25.0
+    # Blinking LEDs toggle every half period
+    BLINK_PERIOD = 0.5
+    MAINTENANCE_BLINK_PERIOD = 1.0
+
+    # Consumption per dose in percent of the container
+    WATER_PER_DOSE = 4
+    BEANS_PER_DOSE = 3
+    GROUNDS_PER_DOSE = 5
+
+    DAC_MAX_VALUE = 0xFFF
+
+    # ADC value of a full sensor (3.3 V at +-4.096 V full scale), empty sensors read 0
+    ADC_FULL_VALUE = 26400
+
+    def __init__(self, time_scale: float = 1.0):
+        self._time_scale = time_scale
+        self._lock = threading.RLock()
+        self._in_pins = {}
+        self._out_pins = {}
+        self._dac_addresses = {}
+        self._mux_pins = []
+        self._adc_address = None
+        self._adc_channels = {}
+        self._adc_conversion = 0
+        self._shift_register = None
+        self.reset()
+
+    def configure(self, in_pins: dict, out_pins: dict, dac_addresses: dict, mux_pins: list = None, adc_address: int = None, adc_channels: dict = None, shift_register: dict = None):
+        with self._lock:
+            # pin => name, e.g. 26 => 'WATER'
+            self._in_pins = {pin: name for name, pin in in_pins.items()}
+            self._out_pins = {pin: name for name, pin in out_pins.items()}
+            self._dac_addresses = {address: name for name, address in dac_addresses.items()}
+            self._dac_registers = {address: self.DAC_MAX_VALUE // 2 for address in self._dac_addresses}
+            # Select lines A, B, C of the multiplexer and the ADC at its common pin, channel => sensor name
+            self._mux_pins = list(mux_pins or [])
+            self._adc_address = adc_address
+            self._adc_channels = {channel: name for name, channel in (adc_channels or {}).items()}
+            # 74HC4094 driving the outputs: 'strobe', 'data' and 'clock' pins and 'bits' (output name => parallel output)
+            self._shift_register = shift_register
+            self._shift_stage = 0
+
+    def reset(self):
+        with self._lock:
+            self._runtime_state = SimulatedCoffeeMachine.OFF
+            self._transition_until = None
+            self._eco = False
+            self._steam = False
+            self._maintenance = False
+            self._brewing_doses = None
+            self._brewing_until = None
+            self._water_level = 100
+            self._bean_level = 100
+            self._grounds_level = 0
+            self._outputs = {}
+            # pin => monotonic time the button was pressed
+            self._pressed = {}
+            self._handled_presses = set()
+            self._dac_registers = {address: self.DAC_MAX_VALUE // 2 for address in self._dac_addresses}
+
+    def _scaled(self, seconds: float) -> float:
+        return seconds * self._time_scale
+
+    # Machine state
+
+    @property
+    def runtime_state(self) -> str:
+        with self._lock:
+            self._advance(time.monotonic())
+            return self._runtime_state
+
+    @property
+    def is_brewing(self) -> bool:
+        with self._lock:
+            self._advance(time.monotonic())
+            return not (self._brewing_doses is None)
+
+    @property
+    def water_level(self) -> int:
+        return self._water_level
+
+    @property
+    def bean_level(self) -> int:
+        return self._bean_level
+
+    @property
+    def grounds_level(self) -> int:
+        return self._grounds_level
+
+    def refill_water_tank(self):
+        with self._lock:
+            self._water_level = 100
+
+    def refill_beans(self):
+        with self._lock:
+            self._bean_level = 100
+
+    def empty_grounds_container(self):
+        with self._lock:
+            self._grounds_level = 0
+
+    def _water_tank_empty(self) -> bool:
+        return self._water_level < self.WATER_PER_DOSE
+
+    def _grounds_container_full(self) -> bool:
+        return self._grounds_level + self.GROUNDS_PER_DOSE > 100
+
+    def _advance(self, now: float):
+        if self._runtime_state == SimulatedCoffeeMachine.STARTUP and now >= self._transition_until:
+            self._runtime_state = SimulatedCoffeeMachine.ON
+            self._transition_until = None
+        elif self._runtime_state == SimulatedCoffeeMachine.SHUTDOWN and now >= self._transition_until:
+            self._runtime_state = SimulatedCoffeeMachine.OFF
+            self._transition_until = None
+            self._eco = False
+            self._steam = False
+            self._maintenance = False
+
+        if not (self._brewing_until is None) and now >= self._brewing_until:
+            logger.debug('Simulated machine finished brewing %s dose(s).', self._brewing_doses)
+            self._brewing_doses = None
+            self._brewing_until = None
+
+        # Buttons are recognized after they were held for a short time
+        for pin, pressed_at in list(self._pressed.items()):
+            if (pin, pressed_at) in self._handled_presses:
+                continue
+            if now - pressed_at >= self._scaled(self.BUTTON_RECOGNITION_DELAY):
+                self._handled_presses.add((pin, pressed_at))
+                self._on_button(self._out_pins[pin], pressed_at + self._scaled(self.BUTTON_RECOGNITION_DELAY))
+
+    def _on_button(self, name: str, now: float):
+        logger.debug('Simulated machine recognized button %s.', name)
+        state = self._runtime_state
+        if name == 'POWER':
+            if state == SimulatedCoffeeMachine.OFF:
+                self._runtime_state = SimulatedCoffeeMachine.STARTUP
+                self._transition_until = now + self._scaled(self.STARTUP_DURATION)
+            elif state == SimulatedCoffeeMachine.ON and self._brewing_doses is None:
+                self._runtime_state = SimulatedCoffeeMachine.SHUTDOWN
+                self._transition_until = now + self._scaled(self.SHUTDOWN_DURATION)
+            return
+        if state != SimulatedCoffeeMachine.ON:
+            return
+        if name == 'ECO':
+            self._eco = not self._eco
+        elif name == 'STEAM':
+            self._steam = not self._steam
+        elif name == 'MAINTENANCE':
+            self._maintenance = not self._maintenance
+        elif name in ('ONE_DOSE', 'TWO_DOSES'):
+            self._brew(doses=1 if name == 'ONE_DOSE' else 2, now=now)
+
+    def _brew(self, doses: int, now: float):
+        if not (self._brewing_doses is None) or self._water_tank_empty() or self._grounds_container_full():
+            return
+        # The water DAC scales the brew duration between 50 % and 150 %
+        water_factor = 1.0
+        for address, name in self._dac_addresses.items():
+            if name == 'WATER':
+                water_factor = 0.5 + self._dac_registers[address] / self.DAC_MAX_VALUE
+        self._brewing_doses = doses
+        self._brewing_until = now + self._scaled(self.BREW_DURATION_PER_DOSE) * doses * water_factor
+        self._water_level = max(0, self._water_level - self.WATER_PER_DOSE * doses)
+        self._bean_level = max(0, self._bean_level - self.BEANS_PER_DOSE * doses)
+        self._grounds_level = min(100, self._grounds_level + self.GROUNDS_PER_DOSE * doses)
+
+    def _blink(self, now: float, period: float) -> bool:
+        half_period = self._scaled(period) / 2
+        return int(now / half_period) % 2 == 0
+
+    def _led(self, name: str, now: float) -> bool:
+        state = self._runtime_state
+        if state == SimulatedCoffeeMachine.OFF:
+            return False
+        if name == 'WATER':
+            return self._water_tank_empty()
+        if name == 'COFFEE_GROUNDS_CONTAINER':
+            return self._grounds_container_full()
+        if name == 'WARNING':
+            return self._water_tank_empty() or self._grounds_container_full()
+        if name in ('ONE_DOSE', 'TWO_DOSES'):
+            if state in (SimulatedCoffeeMachine.STARTUP, SimulatedCoffeeMachine.SHUTDOWN):
+                return self._blink(now, self.BLINK_PERIOD)
+            if not (self._brewing_doses is None):
+                brewing_name = 'ONE_DOSE' if self._brewing_doses == 1 else 'TWO_DOSES'
+                return name == brewing_name and self._blink(now, self.BLINK_PERIOD)
+            return True
+        if name == 'ECO':
+            return self._eco
+        if name == 'STEAM':
+            return self._steam
+        if name == 'MAINTENANCE':
+            return self._maintenance and self._blink(now, self.MAINTENANCE_BLINK_PERIOD)
+        return False
+
+    # GPIO
+
+    def _relais_closed(self) -> bool:
+        for pin, name in self._out_pins.items():
+            if name == 'RELAIS':
+                return self._outputs.get(pin, False)
+        return True
+
+    def get_input(self, pin: int) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._advance(now)
+            name = self._in_pins.get(pin)
+            if name is None:
+                return False
+            return self._led(name, now)
+
+    def set_output(self, pin: int, value: bool):
+        with self._lock:
+            now = time.monotonic()
+            self._advance(now)
+            value = bool(value)
+            if not (self._shift_register is None) and pin in (self._shift_register['strobe'], self._shift_register['data'], self._shift_register['clock']):
+                self._set_shift_register_input(pin, value, now)
+                return
+            self._set_output(pin, value, now)
+
+    def _set_shift_register_input(self, pin: int, value: bool, now: float):
+        register = self._shift_register
+        rising = value and not self._outputs.get(pin, False)
+        self._outputs[pin] = value
+        if pin == register['clock'] and rising:
+            self._shift_stage = ((self._shift_stage << 1) | int(self._outputs.get(register['data'], False))) & 0xFF
+        elif pin == register['strobe'] and value:
+            # The latch follows the shift stage while the strobe is HIGH, the outputs act like their GPIOs
+            pins = {name: pin for pin, name in self._out_pins.items()}
+            # The relais goes first, a button latched together with it reaches the machine
+            for name, bit in sorted(register['bits'].items(), key=lambda item: item[0] != 'RELAIS'):
+                if name in pins:
+                    self._set_output(pins[name], bool((self._shift_stage >> bit) & 1), now)
+
+    def _set_output(self, pin: int, value: bool, now: float):
+        self._outputs[pin] = value
+        name = self._out_pins.get(pin)
+        if name is None or name == 'RELAIS':
+            return
+        # Buttons are active low and only reach the machine while the relais is closed
+        if not value and self._relais_closed():
+            self._pressed.setdefault(pin, now)
+        else:
+            self._release(pin)
+
+    def release_output(self, pin: int):
+        with self._lock:
+            self._advance(time.monotonic())
+            self._outputs.pop(pin, None)
+            self._release(pin)
+
+    def _release(self, pin: int):
+        pressed_at = self._pressed.pop(pin, None)
+        self._handled_presses.discard((pin, pressed_at))
+
+    # I2C
+
+    def write_dac(self, address: int, value: int):
+        with self._lock:
+            if not (address in self._dac_addresses):
+                raise OSError(121, 'Remote I/O error')
+            self._dac_registers[address] = value & self.DAC_MAX_VALUE
+
+    def read_dac(self, address: int) -> int:
+        with self._lock:
+            if not (address in self._dac_addresses):
+                raise OSError(121, 'Remote I/O error')
+            return self._dac_registers[address]
+
+    def is_adc(self, address: int) -> bool:
+        return not (self._adc_address is None) and address == self._adc_address
+
+    def start_adc_conversion(self):
+        # Converts the sensor of the channel selected by the multiplexer, conversions finish instantly
+        with self._lock:
+            channel = 0
+            for bit, pin in enumerate(self._mux_pins):
+                if self._outputs.get(pin, False):
+                    channel = channel | (1 << bit)
+            name = self._adc_channels.get(channel)
+            levels = {'WATER': self._water_level, 'COFFEE_BEANS': self._bean_level, 'COFFEE_GROUNDS': self._grounds_level}
+            level = levels.get(name, 0)
+            self._adc_conversion = int(self.ADC_FULL_VALUE * level / 100)
+
+    def read_adc(self) -> int:
+        with self._lock:
+            return self._adc_conversion
+
+
+class SimulatedGPIO:
+    # Constants of RPi.GPIO
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    # Interval of the thread that emulates edge detection
+    EDGE_POLL_INTERVAL = 0.002
+
+    def __init__(self, machine: SimulatedCoffeeMachine):
+        self._machine = machine
+        self._lock = threading.RLock()
+        self._mode = None
+        self._directions = {}
+        # pin => (edge, callback, bouncetime in seconds, last value, last event)
+        self._event_detects = {}
+        self._edge_thread = None
+
+    def setwarnings(self, flag: bool):
+        pass
+
+    def setmode(self, mode):
+        with self._lock:
+            if not (self._mode is None) and self._mode != mode:
+                raise ValueError('A different mode has already been set!')
+            self._mode = mode
+
+    def getmode(self):
+        return self._mode
+
+    def _channels(self, channel):
+        if isinstance(channel, (list, tuple, set)):
+            return list(channel)
+        return [channel]
+
+    def setup(self, channel, direction, pull_up_down=None, initial=None):
+        with self._lock:
+            if self._mode is None:
+                raise RuntimeError('Please set pin numbering mode using GPIO.setmode(GPIO.BOARD) or GPIO.setmode(GPIO.BCM)')
+            for pin in self._channels(channel):
+                self._directions[pin] = direction
+                if direction == SimulatedGPIO.OUT:
+                    self._machine.set_output(pin, True if initial is None else initial)
+
+    def input(self, channel) -> int:
+        if not (channel in self._directions):
+            raise RuntimeError('You must setup() the GPIO channel first')
+        return SimulatedGPIO.HIGH if self._machine.get_input(channel) else SimulatedGPIO.LOW
+
+    def output(self, channel, value):
+        pins = self._channels(channel)
+        # Like RPi.GPIO a list of channels takes a single value or one value per channel
+        values = list(value) if isinstance(value, (list, tuple)) else [value] * len(pins)
+        if len(values) != len(pins):
+            raise RuntimeError('Number of channels != number of values')
+        for pin in pins:
+            if self._directions.get(pin) != SimulatedGPIO.OUT:
+                raise RuntimeError('The GPIO channel has not been set up as an OUTPUT')
+        for pin, pin_value in zip(pins, values):
+            self._machine.set_output(pin, pin_value)
+
+    def cleanup(self, channel=None):
+        with self._lock:
+            pins = list(self._directions.keys()) if channel is None else self._channels(channel)
+            for pin in pins:
+                self.remove_event_detect(pin)
+                if self._directions.pop(pin, None) == SimulatedGPIO.OUT:
+                    self._machine.release_output(pin)
+            if len(self._directions) == 0:
+                self._mode = None
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if self._directions.get(channel) != SimulatedGPIO.IN:
+                raise RuntimeError('You must setup() the GPIO channel as an input first')
+            if channel in self._event_detects:
+                raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+            bounce_in_sec = 0 if bouncetime is None else bouncetime / 1000
+            self._event_detects[channel] = [edge, callback, bounce_in_sec, self._machine.get_input(channel), 0.0]
+            if self._edge_thread is None or not self._edge_thread.is_alive():
+                self._edge_thread = threading.Thread(target=self._poll_edges, name='simulated-gpio-edges')
+                self._edge_thread.daemon = True
+                self._edge_thread.start()
+
+    def remove_event_detect(self, channel):
+        with self._lock:
+            self._event_detects.pop(channel, None)
+
+    def _poll_edges(self):
+        while True:
+            with self._lock:
+                if len(self._event_detects) == 0:
+                    return
+                detects = list(self._event_detects.items())
+            now = time.monotonic()
+            for pin, detect in detects:
+                edge, callback, bounce_in_sec, last_value, last_event = detect
+                value = self._machine.get_input(pin)
+                if value == last_value:
+                    continue
+                detect[3] = value
+                matches = edge == SimulatedGPIO.BOTH or (edge == SimulatedGPIO.RISING) == value
+                if matches and (now - last_event) >= bounce_in_sec:
+                    detect[4] = now
+                    if not (callback is None):
+                        callback(pin)
+            time.sleep(SimulatedGPIO.EDGE_POLL_INTERVAL)
+
+
+class SimulatedSMBus:
+    # MCP4725 "write DAC register" command
+    REG_WRITE_DAC = 0x40
+    # ADS1115 conversion and config register
+    ADC_REG_CONVERSION = 0x00
+    ADC_REG_CONFIG = 0x01
+
+    def __init__(self, machine: SimulatedCoffeeMachine, bus=None):
+        self._machine = machine
+        self.bus = bus
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        pass
+
+    def write_i2c_block_data(self, i2c_addr: int, register: int, data):
+        if self._machine.is_adc(i2c_addr):
+            # ADS1115: writing the config register with the start bit starts a conversion
+            if register == SimulatedSMBus.ADC_REG_CONFIG and len(data) == 2 and data[0] & 0x80:
+                self._machine.start_adc_conversion()
+            return
+        if register != SimulatedSMBus.REG_WRITE_DAC or len(data) != 2:
+            raise OSError(5, 'Input/output error')
+        value = (data[0] << 4) | (data[1] >> 4)
+        self._machine.write_dac(i2c_addr, value)
+
+    def read_i2c_block_data(self, i2c_addr: int, register: int, length: int):
+        if self._machine.is_adc(i2c_addr):
+            # ADS1115: the config register reports a finished conversion, the conversion register holds the value
+            value = 0x8000 if register == SimulatedSMBus.ADC_REG_CONFIG else self._machine.read_adc()
+            return [(value >> 8) & 0xFF, value & 0xFF][:length]
+        # MCP4725 read: status byte followed by the DAC register (12 bit, left aligned)
+        value = self._machine.read_dac(i2c_addr)
+        data = [0xC0, (value >> 4) & 0xFF, (value & 0xF) << 4]
+        return data[:length]
+
+    def i2c_rdwr(self, *messages):
+        # Combined transactions, writes start with the register, plain reads get what a register read of the device gets
+        for message in messages:
+            if message.flags & SimulatedI2CMessage.READ:
+                register = SimulatedSMBus.ADC_REG_CONVERSION if self._machine.is_adc(message.addr) else None
+                message.buf = self.read_i2c_block_data(message.addr, register, message.len)
+            else:
+                self.write_i2c_block_data(message.addr, message.buf[0], message.buf[1:])
+
+
+class SimulatedI2CMessage:
+    # Message of a combined I2C transaction, like smbus2.i2c_msg
+    READ = 0x0001
+
+    def __init__(self, addr: int, flags: int, buf: list):
+        self.addr = addr
+        self.flags = flags
+        self.len = len(buf)
+        self.buf = buf
+
+    def __iter__(self):
+        return iter(self.buf[:self.len])
+
+    @staticmethod
+    def read(address: int, length: int):
+        return SimulatedI2CMessage(address, SimulatedI2CMessage.READ, [0] * length)
+
+    @staticmethod
+    def write(address: int, buf):
+        return SimulatedI2CMessage(address, 0, list(buf))
@@ -0,0 +1,176 @@
+import copy
+import threading
+import time
+
+from typing import Callable
+
+from flask_restful import marshal
+
+from models import DeviceStatus
+from config.logger import logging, get_logger_name
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class StatusSnapshot:
+    __slots__ = ('_status', '_version', '_created_at', '_fields')
+
+    def __init__(self, status: DeviceStatus, version: int, created_at: float):
+        self._status = status
+        self._version = version
+        self._created_at = created_at
+        self._fields = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def created_at(self) -> float:
+        return self._created_at
+
+    @property
+    def status(self) -> DeviceStatus:
+        # The snapshot itself is never modified, callers get their own copy
+        return _copy_status(self._status)
+
+    def age(self) -> float:
+        return time.monotonic() - self._created_at
+
+    def to_dict(self) -> dict:
+        # Marshalled once per snapshot and shared by all readers, callers must not modify it
+        fields = self._fields
+        if fields is None:
+            fields = dict(marshal(self._status, DeviceStatus.get_fields()))
+            self._fields = fields
+        return fields
+
+
+class StatusCache:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+
+    @property
+    def snapshot(self) -> StatusSnapshot:
+        return self._snapshot
+
+    def publish(self, status: DeviceStatus, version: int = None) -> StatusSnapshot:
+        # Every publish is a new snapshot, the version only changes with the status itself.
+        # version is given if the status is mirrored from the cache of another process.
+        with self._condition:
+            current = self._snapshot
+            if not (version is None):
+                self._version = version
+            elif current is None or current._status.__dict__ != status.__dict__:
+                self._version = self._version + 1
+            snapshot = StatusSnapshot(status=_copy_status(status), version=self._version, created_at=time.monotonic())
+            self._snapshot = snapshot
+            self._condition.notify_all()
+        return snapshot
+
+    def notify(self):
+        # Wakes up waiting readers without publishing a new snapshot, e.g. if something besides the status changed
+        with self._condition:
+            self._condition.notify_all()
+
+    def wait_for_update(self, version: int, timeout: float) -> StatusSnapshot:
+        # Waits until a snapshot newer than version was published, the next publish, a notification or the timeout
+        with self._condition:
+            if self._version <= version:
+                self._condition.wait(timeout=timeout)
+            return self._snapshot
+
+    def wait_for_version(self, version: int, timeout: float) -> StatusSnapshot:
+        # Waits until the status changed after version or the timeout, then returns the current snapshot
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version, timeout=timeout)
+            return self._snapshot
+
+    def get(self, max_age: float) -> StatusSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age() > max_age:
+            return None
+        return snapshot
+
+
+class StatusDemand:
+    # Remembers when the status was asked for last, the samplers pause once nobody asked for idle_time seconds
+    def __init__(self, idle_time: float):
+        self._idle_time = idle_time
+        self._condition = threading.Condition()
+        self._requested_at = None
+
+    def touch(self):
+        with self._condition:
+            self._requested_at = time.monotonic()
+            self._condition.notify_all()
+
+    def is_active(self) -> bool:
+        requested_at = self._requested_at
+        return not (requested_at is None) and time.monotonic() - requested_at < self._idle_time
+
+    def wait(self, timeout: float = None) -> bool:
+        # Waits until the status is asked for, the timeout or a wake up. Returns whether the status is asked for.
+        with self._condition:
+            if not self.is_active():
+                self._condition.wait(timeout=timeout)
+            return self.is_active()
+
+    def wake(self):
+        # Lets waiting samplers check whether they were stopped
+        with self._condition:
+            self._condition.notify_all()
+
+
+class StatusSampler:
+    def __init__(self, read_status: Callable[[], DeviceStatus], cache: StatusCache, interval: float, demand: StatusDemand = None):
+        self._read_status = read_status
+        self._cache = cache
+        self._interval = interval
+        # Without a demand the status is sampled all the time
+        self._demand = demand
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return not (self._thread is None) and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='status-sampler')
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info('Status sampler started (Interval: %s seconds).', self._interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if not (self._demand is None):
+            self._demand.wake()
+        if self.is_running():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            if not (self._demand is None) and not self._demand.is_active():
+                logger.debug('Status sampler paused, the status was not asked for.')
+                while not self._demand.wait() and not self._stop_event.is_set():
+                    pass
+                continue
+            try:
+                self._cache.publish(self._read_status())
+            except Exception:
+                logger.exception('Reading device status in background failed.')
+            self._stop_event.wait(self._interval)
+
+
+def _copy_status(status: DeviceStatus) -> DeviceStatus:
+    # The warnings are the only mutable field, they are copied with the status
+    status = copy.copy(status)
+    status.device_warnings = list(status.device_warnings)
+    return status
@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+
+from pathlib import Path
+
+from config.logger import logging, get_logger_name
+from utils.files import atomic_write
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class ActionTiming:
+    __slots__ = ('samples', 'misses', 'latency', 'deviation')
+
+    def __init__(self, samples: int = 0, misses: int = 0, latency: float = None, deviation: float = None):
+        # Number of acknowledged and unacknowledged actions
+        self.samples = samples
+        self.misses = misses
+        # Smoothed acknowledgement latency and its mean deviation in seconds
+        self.latency = latency
+        self.deviation = deviation
+
+    def record(self, latency: float):
+        # Same estimator as the TCP retransmission timer (RFC 6298)
+        if self.latency is None:
+            self.latency = latency
+            self.deviation = latency / 2
+        else:
+            self.deviation = 0.75 * self.deviation + 0.25 * abs(self.latency - latency)
+            self.latency = 0.875 * self.latency + 0.125 * latency
+        self.samples = self.samples + 1
+
+    def is_calibrated(self) -> bool:
+        return self.samples >= TIMING_MIN_SAMPLES
+
+    def timeout(self, upper_bound: float, lower_bound: float) -> float:
+        # Time to wait for an acknowledgement, the upper bound until enough acknowledgements were seen
+        if not self.is_calibrated():
+            return upper_bound
+        return min(upper_bound, max(lower_bound, self.latency + 4 * self.deviation))
+
+    def to_dict(self) -> dict:
+        return {
+            'samples': self.samples,
+            'misses': self.misses,
+            'latency': self.latency,
+            'deviation': self.deviation
+        }
+
+    @staticmethod
+    def from_dict(data: dict):
+        return ActionTiming(
+            samples=int(data.get('samples', 0)),
+            misses=int(data.get('misses', 0)),
+            latency=data.get('latency'),
+            deviation=data.get('deviation')
+        )
+
+
+class TimingCalibration:
+    # Learns how long the machine takes to acknowledge button presses and DAC writes.
+    # The configured delays stay upper bounds, waits end as soon as an acknowledgement was observed.
+    # Recorded actions are saved at most every save_interval seconds, flush() saves the rest.
+    def __init__(self, file_path: Path, button_press_duration: float, button_press_min_duration: float, i2c_delay: float, save_interval: float = 60):
+        self.file_path = Path(file_path)
+        self._button_press_duration = button_press_duration
+        self._button_press_min_duration = button_press_min_duration
+        self._i2c_delay = i2c_delay
+        self._save_interval = save_interval
+        self._lock = threading.Lock()
+        self._buttons = {}
+        self._dac = ActionTiming()
+        # Monotonic time of the last save, None before the first one
+        self._saved_at = None
+        self._unsaved = False
+        self._load()
+
+    @property
+    def button_press_duration(self) -> float:
+        return self._button_press_duration
+
+    @property
+    def i2c_delay(self) -> float:
+        return self._i2c_delay
+
+    def button_timing(self, name: str) -> ActionTiming:
+        with self._lock:
+            return ActionTiming.from_dict(self._button(name).to_dict())
+
+    def press_timeout(self, name: str) -> float:
+        with self._lock:
+            return self._button(name).timeout(upper_bound=self._button_press_duration, lower_bound=self._min_press(name))
+
+    def press_min_duration(self, name: str) -> float:
+        with self._lock:
+            return self._min_press(name)
+
+    def dac_timeout(self) -> float:
+        with self._lock:
+            return self._dac.timeout(upper_bound=self._i2c_delay, lower_bound=min(self._i2c_delay, DAC_MIN_TIMEOUT))
+
+    def dac_timing(self) -> ActionTiming:
+        with self._lock:
+            return ActionTiming.from_dict(self._dac.to_dict())
+
+    def button_names(self) -> list:
+        with self._lock:
+            return sorted(self._buttons.keys())
+
+    def record_press(self, name: str, latency: float):
+        # latency is None if the machine did not acknowledge the press
+        with self._lock:
+            timing = self._button(name)
+            if latency is None:
+                timing.misses = timing.misses + 1
+            else:
+                timing.record(latency)
+            self._save_later()
+
+    def record_dac_write(self, latency: float):
+        with self._lock:
+            if latency is None:
+                self._dac.misses = self._dac.misses + 1
+            else:
+                self._dac.record(latency)
+            self._save_later()
+
+    def reset(self):
+        with self._lock:
+            self._buttons = {}
+            self._dac = ActionTiming()
+            self._save()
+
+    def flush(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _button(self, name: str) -> ActionTiming:
+        timing = self._buttons.get(name)
+        if timing is None:
+            timing = ActionTiming()
+            self._buttons[name] = timing
+        return timing
+
+    def _min_press(self, name: str) -> float:
+        # Acknowledgements well before the usual latency are blinking LEDs, not the machine reacting to the button
+        timing = self._buttons.get(name)
+        if timing is None or not timing.is_calibrated():
+            return self._button_press_min_duration
+        return min(self._button_press_duration, max(self._button_press_min_duration, timing.latency / 2))
+
+    def _load(self):
+        if not self.file_path.exists():
+            return
+        try:
+            with open(self.file_path, 'r') as f:
+                data = json.load(f)
+            self._buttons = {name: ActionTiming.from_dict(timing) for name, timing in data.get('buttons', {}).items()}
+            self._dac = ActionTiming.from_dict(data.get('dac', {}))
+        except (ValueError, TypeError, AttributeError) as err:
+            logger.warning('Ignoring invalid timing calibration in %s: %s', self.file_path, err)
+
+    def _save_later(self):
+        # Every press would otherwise rewrite and sync the file, a crash loses at most the actions of one interval
+        self._unsaved = True
+        if self._saved_at is None or time.monotonic() - self._saved_at >= self._save_interval:
+            self._save()
+
+    def _save(self):
+        self._saved_at = time.monotonic()
+        self._unsaved = False
+        data = {
+            'buttons': {name: timing.to_dict() for name, timing in self._buttons.items()},
+            'dac': self._dac.to_dict()
+        }
+        try:
+            atomic_write(self.file_path, json.dumps(data))
+        except OSError as err:
+            # Calibration is relearned after a restart
+            logger.warning('Could not save timing calibration: %s', err)
+
+
+# Number of acknowledged actions before the learned timing replaces the upper bound
+TIMING_MIN_SAMPLES = 3
+
+# Lower bound in seconds for the learned DAC timeout, a few read backs always fit in
+DAC_MIN_TIMEOUT = 0.005
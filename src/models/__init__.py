@@ -37,6 +37,15 @@ class DeviceRuntimeState(Enum):
         return self._state_id
 
 
+class DeviceWarning:
+    WATER_TANK_EMPTY = 'water_tank_empty'
+    COFFEE_GROUNDS_CONTAINER_FULL = 'coffee_grounds_container_full'
+    # Steady warning LED
+    WARNING = 'warning'
+    # Blinking warning LED
+    ERROR = 'error'
+
+
 @SWAG.definition('DeviceStatus')
 class DeviceStatus:
     """
@@ -45,15 +54,17 @@ class DeviceStatus:
     def __init__(self, *args, **kwargs):
         self.device_ready = True
         self.water_tank_ready = True
-        self.water_tank_fill_level_in_percent = 53
+        # Fill levels are None without a sensor
+        self.water_tank_fill_level_in_percent = None
         self.coffee_bean_container_ready = True
-        self.coffee_bean_container_fill_level_in_percent = 71
+        self.coffee_bean_container_fill_level_in_percent = None
         self.coffee_grounds_container_ready = True
-        self.coffee_grounds_container_fill_level_in_percent = 23
+        self.coffee_grounds_container_fill_level_in_percent = None
         self.coffee_machine_runtime_state = DeviceRuntimeState.OFF.state_id
         self.device_eco_mode = False
         self.device_maintenance = False
         self.device_steam = False
+        self.device_warnings = []
     
     @property
     def device_runtime_state(self) -> DeviceRuntimeState:
@@ -76,15 +87,16 @@ class DeviceStatus:
         return {
             'device_ready': fields.Boolean,
             'water_tank_ready': fields.Boolean,
-            'water_tank_fill_level_in_percent': fields.Integer,
+            'water_tank_fill_level_in_percent': fields.Integer(default=None),
             'coffee_bean_container_ready': fields.Boolean,
-            'coffee_bean_container_fill_level_in_percent': fields.Integer,
+            'coffee_bean_container_fill_level_in_percent': fields.Integer(default=None),
             'coffee_grounds_container_ready': fields.Boolean,
-            'coffee_grounds_container_fill_level_in_percent': fields.Integer,
+            'coffee_grounds_container_fill_level_in_percent': fields.Integer(default=None),
             'coffee_machine_runtime_state': fields.Integer,
             'device_eco_mode': fields.Boolean,
             'device_maintenance': fields.Boolean,
-            'device_steam': fields.Boolean
+            'device_steam': fields.Boolean,
+            'device_warnings': fields.List(fields.String)
         }
 
 @SWAG.definition('EditDeviceStatus')
@@ -150,6 +162,9 @@ class DeviceJob:
         self.price = None if not ('price' in kwargs) else kwargs['price']
         self.doses = None if not ('doses' in kwargs) else kwargs['doses']
         self.coffee_product_id = None if not ('coffee_product_id' in kwargs) else kwargs['coffee_product_id']
+        # Assigned by the device, the id is only known after the job was reported to the WebAPI
+        self.local_id = None if not ('local_id' in kwargs) else kwargs['local_id']
+        self.report_state = None if not ('report_state' in kwargs) else kwargs['report_state']
     
     @staticmethod
     def get_fields():
@@ -162,7 +177,213 @@ class DeviceJob:
             'water_in_percent': fields.Integer,
             'price': fields.Integer,
             'doses': fields.Integer,
-            'coffee_product_id': fields.Integer
+            'coffee_product_id': fields.Integer,
+            'local_id': fields.String,
+            'report_state': fields.String
+        }
+
+
+@SWAG.definition('DeviceJobTicket')
+class DeviceJobTicket:
+    """
+    file: /models/device-job-ticket.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.ticket_id = None if not ('ticket_id' in kwargs) else kwargs['ticket_id']
+        self.state = None if not ('state' in kwargs) else kwargs['state']
+        self.position = None if not ('position' in kwargs) else kwargs['position']
+        self.estimated_start = None if not ('estimated_start' in kwargs) else kwargs['estimated_start']
+        self.local_id = None if not ('local_id' in kwargs) else kwargs['local_id']
+        self.message = None if not ('message' in kwargs) else kwargs['message']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'ticket_id': fields.String,
+            'state': fields.String,
+            'position': fields.Integer,
+            'estimated_start': fields.Integer,
+            'local_id': fields.String,
+            'message': fields.String
+        }
+
+
+@SWAG.definition('DeviceActionTiming')
+class DeviceActionTiming:
+    """
+    file: /models/device-action-timing.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.name = None if not ('name' in kwargs) else kwargs['name']
+        self.samples = 0 if not ('samples' in kwargs) else kwargs['samples']
+        self.misses = 0 if not ('misses' in kwargs) else kwargs['misses']
+        self.ack_latency_in_sec = None if not ('ack_latency_in_sec' in kwargs) else kwargs['ack_latency_in_sec']
+        self.min_duration_in_sec = None if not ('min_duration_in_sec' in kwargs) else kwargs['min_duration_in_sec']
+        self.max_duration_in_sec = None if not ('max_duration_in_sec' in kwargs) else kwargs['max_duration_in_sec']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'name': fields.String,
+            'samples': fields.Integer,
+            'misses': fields.Integer,
+            'ack_latency_in_sec': fields.Float,
+            'min_duration_in_sec': fields.Float,
+            'max_duration_in_sec': fields.Float
+        }
+
+
+@SWAG.definition('DeviceTiming')
+class DeviceTiming:
+    """
+    file: /models/device-timing.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.button_press_duration_in_sec = None if not ('button_press_duration_in_sec' in kwargs) else kwargs['button_press_duration_in_sec']
+        self.i2c_delay_in_sec = None if not ('i2c_delay_in_sec' in kwargs) else kwargs['i2c_delay_in_sec']
+        self.i2c_final_delay_in_sec = None if not ('i2c_final_delay_in_sec' in kwargs) else kwargs['i2c_final_delay_in_sec']
+        self.buttons = [] if not ('buttons' in kwargs) else kwargs['buttons']
+        self.dac = None if not ('dac' in kwargs) else kwargs['dac']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'button_press_duration_in_sec': fields.Float,
+            'i2c_delay_in_sec': fields.Float,
+            'i2c_final_delay_in_sec': fields.Float,
+            'buttons': fields.List(fields.Nested(DeviceActionTiming.get_fields())),
+            'dac': fields.Nested(DeviceActionTiming.get_fields())
+        }
+
+
+@SWAG.definition('DeviceDAC')
+class DeviceDAC:
+    """
+    file: /models/device-dac.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.name = None if not ('name' in kwargs) else kwargs['name']
+        self.bus_number = None if not ('bus_number' in kwargs) else kwargs['bus_number']
+        self.address = None if not ('address' in kwargs) else kwargs['address']
+        self.value = None if not ('value' in kwargs) else kwargs['value']
+        self.writes = 0 if not ('writes' in kwargs) else kwargs['writes']
+        self.skipped_writes = 0 if not ('skipped_writes' in kwargs) else kwargs['skipped_writes']
+        self.errors = 0 if not ('errors' in kwargs) else kwargs['errors']
+        self.mean_latency_in_ms = None if not ('mean_latency_in_ms' in kwargs) else kwargs['mean_latency_in_ms']
+        self.max_latency_in_ms = None if not ('max_latency_in_ms' in kwargs) else kwargs['max_latency_in_ms']
+        self.last_latency_in_ms = None if not ('last_latency_in_ms' in kwargs) else kwargs['last_latency_in_ms']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'name': fields.String,
+            'bus_number': fields.Integer,
+            'address': fields.Integer,
+            'value': fields.Integer,
+            'writes': fields.Integer,
+            'skipped_writes': fields.Integer,
+            'errors': fields.Integer,
+            'mean_latency_in_ms': fields.Float,
+            'max_latency_in_ms': fields.Float,
+            'last_latency_in_ms': fields.Float
+        }
+
+
+@SWAG.definition('DeviceSession')
+class DeviceSession:
+    """
+    file: /models/device-session.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.state = None if not ('state' in kwargs) else kwargs['state']
+        self.opened_at = None if not ('opened_at' in kwargs) else kwargs['opened_at']
+        self.release_requested_at = None if not ('release_requested_at' in kwargs) else kwargs['release_requested_at']
+        self.sessions_opened = 0 if not ('sessions_opened' in kwargs) else kwargs['sessions_opened']
+        self.releases_on_ready = 0 if not ('releases_on_ready' in kwargs) else kwargs['releases_on_ready']
+        self.releases_on_timeout = 0 if not ('releases_on_timeout' in kwargs) else kwargs['releases_on_timeout']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'state': fields.String,
+            'opened_at': fields.Integer,
+            'release_requested_at': fields.Integer,
+            'sessions_opened': fields.Integer,
+            'releases_on_ready': fields.Integer,
+            'releases_on_timeout': fields.Integer
+        }
+
+
+@SWAG.definition('DeviceStatusHistoryPoint')
+class DeviceStatusHistoryPoint:
+    """
+    file: /models/device-status-history-point.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.time = None if not ('time' in kwargs) else kwargs['time']
+        self.coverage = 0 if not ('coverage' in kwargs) else kwargs['coverage']
+        self.eco = None if not ('eco' in kwargs) else kwargs['eco']
+        self.maintenance = None if not ('maintenance' in kwargs) else kwargs['maintenance']
+        self.warning = None if not ('warning' in kwargs) else kwargs['warning']
+        self.steam = None if not ('steam' in kwargs) else kwargs['steam']
+        self.two_doses = None if not ('two_doses' in kwargs) else kwargs['two_doses']
+        self.one_dose = None if not ('one_dose' in kwargs) else kwargs['one_dose']
+        self.water = None if not ('water' in kwargs) else kwargs['water']
+        self.coffee_grounds_container = None if not ('coffee_grounds_container' in kwargs) else kwargs['coffee_grounds_container']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'time': fields.Float,
+            'coverage': fields.Float,
+            'eco': fields.Float,
+            'maintenance': fields.Float,
+            'warning': fields.Float,
+            'steam': fields.Float,
+            'two_doses': fields.Float,
+            'one_dose': fields.Float,
+            'water': fields.Float,
+            'coffee_grounds_container': fields.Float
+        }
+
+
+@SWAG.definition('DeviceStatusHistory')
+class DeviceStatusHistory:
+    """
+    file: /models/device-status-history.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.since = None if not ('since' in kwargs) else kwargs['since']
+        self.until = None if not ('until' in kwargs) else kwargs['until']
+        self.resolution_in_sec = None if not ('resolution_in_sec' in kwargs) else kwargs['resolution_in_sec']
+        self.points = [] if not ('points' in kwargs) else kwargs['points']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'since': fields.Float,
+            'until': fields.Float,
+            'resolution_in_sec': fields.Float,
+            'points': fields.List(fields.Nested(DeviceStatusHistoryPoint.get_fields()))
+        }
+
+
+@SWAG.definition('Profile')
+class Profile:
+    """
+    file: /models/profile.yml
+    """
+    def __init__(self, *args, **kwargs):
+        self.name = None if not ('name' in kwargs) else kwargs['name']
+        self.size = 0 if not ('size' in kwargs) else kwargs['size']
+        self.created_at = None if not ('created_at' in kwargs) else kwargs['created_at']
+
+    @staticmethod
+    def get_fields():
+        return {
+            'name': fields.String,
+            'size': fields.Integer,
+            'created_at': fields.Integer
         }
 
 
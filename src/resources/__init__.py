@@ -1 +1,3 @@
-from resources.device import DEVICE_BP
\ No newline at end of file
+from resources.device import DEVICE_BP
+from resources.metrics import METRICS_BP
+from resources.profiles import PROFILES_BP
@@ -3,23 +3,32 @@ import json
 from typing import List
 
 from flasgger import swag_from
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 from flask_restful import Api, marshal_with, Resource
 
 from utils.http import token_required, get_post_response
-from models import DeviceSettings, DeviceStatus, DeviceJob, CreateDeviceJob, EditDeviceStatus
+from models import DeviceSettings, DeviceStatus, DeviceStatusHistory, DeviceJob, DeviceJobTicket, CreateDeviceJob, EditDeviceStatus, DeviceTiming, DeviceDAC, DeviceSession
 from controllers.device_settings import DeviceSettingsController
 from controllers.device_status import DeviceStatusController
 from controllers.device_job import DeviceJobController
+from controllers.device_timing import DeviceTimingController
+from controllers.device_dac import DeviceDACController
+from controllers.device_session import DeviceSessionController
+from core.rpc import get_controller, get_status_mirror
 
 API_PREFIX = 'device'
 DEVICE_BP = Blueprint('{rsc}_api'.format(rsc=API_PREFIX), __name__)
 api = Api(DEVICE_BP)
 
 
+def _get_status_reader() -> DeviceStatusController:
+    # Status reads are answered from the status snapshots of the own process
+    return DeviceStatusController(status_source=get_status_mirror())
+
+
 class DeviceSettingsResource(Resource):
     def __init__(self):
-        self.controller = DeviceSettingsController()
+        self.controller = get_controller(DeviceSettingsController)
 
     @token_required()
     @swag_from('/resources/device/description/device_settings_get.yml')
@@ -38,13 +47,14 @@ class DeviceSettingsResource(Resource):
 
 class DeviceStatusResource(Resource):
     def __init__(self):
-        self.controller = DeviceStatusController()
+        self.controller = get_controller(DeviceStatusController)
+        self.reader = _get_status_reader()
 
     @token_required()
     @swag_from('/resources/device/description/device_status_get.yml')
     @marshal_with(DeviceStatus.get_fields())
     def get(self, token:str) -> DeviceStatus:
-        return self.controller.get_status(token)
+        return self.reader.get_status(token)
     
     @token_required()
     @swag_from('/resources/device/description/device_status_put.yml')
@@ -55,20 +65,122 @@ class DeviceStatusResource(Resource):
         return self.controller.set_status(token, new_status)
 
 
+class DeviceStatusPollResource(Resource):
+    def __init__(self):
+        self.controller = _get_status_reader()
+
+    @token_required()
+    @swag_from('/resources/device/description/device_status_poll_get.yml')
+    @marshal_with(DeviceStatus.get_fields())
+    def get(self, token:str) -> DeviceStatus:
+        return self.controller.poll_status(token, version=request.args.get('version'), timeout=request.args.get('timeout'))
+
+
+class DeviceStatusStreamResource(Resource):
+    def __init__(self):
+        self.controller = _get_status_reader()
+
+    @token_required()
+    @swag_from('/resources/device/description/device_status_stream_get.yml')
+    def get(self, token:str):
+        events = stream_with_context(self.controller.stream_status(token))
+        response = Response(events, mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Events must not be buffered by a reverse proxy
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class DeviceStatusHistoryResource(Resource):
+    def __init__(self):
+        # The history is kept by the process that reads the hardware
+        self.controller = get_controller(DeviceStatusController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_status_history_get.yml')
+    @marshal_with(DeviceStatusHistory.get_fields())
+    def get(self, token:str) -> DeviceStatusHistory:
+        return self.controller.get_history(token, since=request.args.get('since'), until=request.args.get('until'), points=request.args.get('points'))
+
+
 class DeviceJobResource(Resource):
     def __init__(self):
-        self.controller = DeviceJobController()
+        self.controller = get_controller(DeviceJobController)
     
     @token_required()
     @swag_from('/resources/device/description/device_job_post.yml')
     def post(self, token:str):
         data = request.get_json()
         new_job = CreateDeviceJob(**data)
-        created_job = self.controller.create_job(token, new_job)
-        response = get_post_response(body=created_job, content_type='application/json', api='/{rsc}/job'.format(rsc=API_PREFIX), obj_id=created_job.id)
+        ticket = self.controller.create_job(token, new_job)
+        # The job is queued, its ticket tells when it is brewed
+        response = get_post_response(body=ticket, content_type='application/json', api='/{rsc}/job/queue'.format(rsc=API_PREFIX), obj_id=ticket.ticket_id, code=202)
         return response
 
 
+class DeviceJobItemResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(DeviceJobController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_job_get.yml')
+    @marshal_with(DeviceJob.get_fields())
+    def get(self, token:str, local_id:str) -> DeviceJob:
+        return self.controller.get_job(token, local_id)
+
+
+class DeviceJobTicketResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(DeviceJobController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_job_ticket_get.yml')
+    @marshal_with(DeviceJobTicket.get_fields())
+    def get(self, token:str, ticket_id:str) -> DeviceJobTicket:
+        return self.controller.get_ticket(token, ticket_id)
+
+
+class DeviceTimingResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(DeviceTimingController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_timing_get.yml')
+    @marshal_with(DeviceTiming.get_fields())
+    def get(self, token:str) -> DeviceTiming:
+        return self.controller.get_timing(token)
+
+
+class DeviceDACResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(DeviceDACController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_dac_get.yml')
+    @marshal_with(DeviceDAC.get_fields())
+    def get(self, token:str) -> List[DeviceDAC]:
+        return self.controller.get_dacs(token)
+
+
+class DeviceSessionResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(DeviceSessionController)
+
+    @token_required()
+    @swag_from('/resources/device/description/device_session_get.yml')
+    @marshal_with(DeviceSession.get_fields())
+    def get(self, token:str) -> DeviceSession:
+        return self.controller.get_session(token)
+
+
 api.add_resource(DeviceSettingsResource, '/{rsc}/settings'.format(rsc=API_PREFIX))
 api.add_resource(DeviceStatusResource, '/{rsc}/status'.format(rsc=API_PREFIX))
-api.add_resource(DeviceJobResource, '/{rsc}/job'.format(rsc=API_PREFIX))
\ No newline at end of file
+api.add_resource(DeviceStatusPollResource, '/{rsc}/status/poll'.format(rsc=API_PREFIX))
+api.add_resource(DeviceStatusStreamResource, '/{rsc}/status/stream'.format(rsc=API_PREFIX))
+api.add_resource(DeviceStatusHistoryResource, '/{rsc}/status/history'.format(rsc=API_PREFIX))
+api.add_resource(DeviceJobResource, '/{rsc}/job'.format(rsc=API_PREFIX))
+api.add_resource(DeviceJobTicketResource, '/{rsc}/job/queue/<string:ticket_id>'.format(rsc=API_PREFIX))
+api.add_resource(DeviceJobItemResource, '/{rsc}/job/<string:local_id>'.format(rsc=API_PREFIX))
+api.add_resource(DeviceTimingResource, '/{rsc}/timing'.format(rsc=API_PREFIX))
+api.add_resource(DeviceDACResource, '/{rsc}/dac'.format(rsc=API_PREFIX))
+api.add_resource(DeviceSessionResource, '/{rsc}/session'.format(rsc=API_PREFIX))
\ No newline at end of file
@@ -0,0 +1,47 @@
+import ipaddress
+import os
+
+from flasgger import swag_from
+from flask import Blueprint, Response, request
+from flask_restful import Api, Resource
+
+from config.flask_config import AuthenticationFailed
+from controllers.metrics import MetricsController
+from core.rpc import get_controller, get_hardware_client
+from utils.http import TOKEN_VERIFIER
+from utils.metrics import REGISTRY
+
+API_PREFIX = 'metrics'
+METRICS_BP = Blueprint('{rsc}_api'.format(rsc=API_PREFIX), __name__)
+api = Api(METRICS_BP)
+
+
+class MetricsResource(Resource):
+    def __init__(self):
+        self.controller = get_controller(MetricsController)
+
+    # Scraped by Prometheus on the device, which does not send user tokens. Requests of other hosts need an admin token,
+    # the metrics tell when the machine is used.
+    @swag_from('/resources/metrics/description/metrics_get.yml')
+    def get(self):
+        if not _is_local_request():
+            token = request.headers.get('x-access-token')
+            if not token:
+                raise AuthenticationFailed('Token fehlt.')
+            TOKEN_VERIFIER.verify_admin(token)
+        if get_hardware_client() is None:
+            body = self.controller.get_metrics()
+        else:
+            # The hardware owner adds the HTTP and auth metrics of this worker to its own
+            body = self.controller.get_metrics(source=str(os.getpid()), state=REGISTRY.state())
+        return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _is_local_request() -> bool:
+    try:
+        return ipaddress.ip_address(request.remote_addr).is_loopback
+    except ValueError:
+        return False
+
+
+api.add_resource(MetricsResource, '/{rsc}'.format(rsc=API_PREFIX))
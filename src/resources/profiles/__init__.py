@@ -0,0 +1,40 @@
+from typing import List
+
+from flasgger import swag_from
+from flask import Blueprint, send_file
+from flask_restful import Api, marshal_with, Resource
+
+from utils.http import token_required
+from models import Profile
+from controllers.profiles import ProfilesController
+
+API_PREFIX = 'profiles'
+PROFILES_BP = Blueprint('{rsc}_api'.format(rsc=API_PREFIX), __name__)
+api = Api(PROFILES_BP)
+
+
+class ProfilesResource(Resource):
+    def __init__(self):
+        # The captures are files of this device, they are read in every process
+        self.controller = ProfilesController()
+
+    @token_required(roles=['admin'])
+    @swag_from('/resources/profiles/description/profiles_get.yml')
+    @marshal_with(Profile.get_fields())
+    def get(self, token:str) -> List[Profile]:
+        return self.controller.get_profiles(token)
+
+
+class ProfileItemResource(Resource):
+    def __init__(self):
+        self.controller = ProfilesController()
+
+    @token_required(roles=['admin'])
+    @swag_from('/resources/profiles/description/profile_get.yml')
+    def get(self, token:str, name:str):
+        path = self.controller.get_profile_path(token, name)
+        return send_file(path.resolve(), mimetype='text/plain' if path.suffix == '.txt' else 'application/octet-stream', as_attachment=True, download_name=name)
+
+
+api.add_resource(ProfilesResource, '/{rsc}'.format(rsc=API_PREFIX))
+api.add_resource(ProfileItemResource, '/{rsc}/<string:name>'.format(rsc=API_PREFIX))
@@ -0,0 +1,179 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+from typing import Callable
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+
+from config.environment_tools import get_server_workers, get_server_threads, get_hardware_socket
+from config.logger import logging, get_logger_name, stop_logging
+from core import CM_API, STATUS_MAX_AGE
+from core.rpc import HardwareServer, connect_hardware, get_hardware_client
+from controllers.device_settings import DeviceSettingsController
+from controllers.device_status import DeviceStatusController
+from controllers.device_job import DeviceJobController
+from controllers.device_timing import DeviceTimingController
+from controllers.device_dac import DeviceDACController
+from controllers.device_session import DeviceSessionController
+from controllers.metrics import MetricsController
+from utils.metrics import REGISTRY
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class WorkerApplication(BaseApplication):
+    # Gunicorn with the already configured Flask app
+    def __init__(self, app: Flask, options: dict):
+        self.application = app
+        self.options = options
+        BaseApplication.__init__(self)
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> Flask:
+        return self.application
+
+
+def serve_with_workers(app: Flask, host: str, port: int, ssl_context: tuple, start_hardware: Callable[[], None]):
+    # The GPIO pins, the DACs, the sessions and the brew queue are process global.
+    # A single hardware owner process keeps them, the HTTP workers (TLS, auth, serialization) call its controllers
+    # over a Unix socket and serve status reads from the snapshots it pushes.
+    socket_path = get_hardware_socket()
+    # Only forks of this process know the key of the hardware socket
+    authkey = os.urandom(32)
+    # A plain fork: the workers are forked from this process as well and must not treat the owner as their child
+    owner_pid = os.fork()
+    if owner_pid == 0:
+        exit_code = 0
+        try:
+            _run_hardware_owner(socket_path=socket_path, authkey=authkey, start_hardware=start_hardware)
+        except SystemExit as err:
+            exit_code = err.code or 0
+        except BaseException:
+            logger.exception('Hardware owner process failed.')
+            exit_code = 1
+        finally:
+            # os._exit skips atexit, the queued log records are written here
+            stop_logging()
+            os._exit(exit_code)
+    server_pid = os.getpid()
+    watchdog = threading.Thread(target=_watch_hardware_owner, args=(owner_pid,), name='hardware-owner-watchdog')
+    watchdog.daemon = True
+    watchdog.start()
+
+    workers = get_server_workers() or os.cpu_count()
+    options = {
+        'bind': '{0}:{1}'.format(host, port),
+        'workers': workers,
+        # Status streams keep a thread busy for as long as the client is connected
+        'worker_class': 'gthread',
+        'threads': get_server_threads(),
+        'post_fork': lambda server, worker: _start_worker(socket_path=socket_path, authkey=authkey)
+    }
+    if not (ssl_context is None):
+        options['certfile'], options['keyfile'] = ssl_context
+    logger.info('Serving with %s workers, hardware owner process %s.', workers, owner_pid)
+    try:
+        WorkerApplication(app, options).run()
+    finally:
+        # Exiting workers leave gunicorn through here as well
+        if os.getpid() == server_pid:
+            _stop_hardware_owner(owner_pid)
+
+
+def _start_worker(socket_path: str, authkey: bytes):
+    connect_hardware(socket_path=socket_path, authkey=authkey, max_age=STATUS_MIRROR_MAX_AGE)
+    thread = threading.Thread(target=_push_worker_metrics, name='metrics-push')
+    thread.daemon = True
+    thread.start()
+
+
+def _push_worker_metrics():
+    # Every worker hands its metrics to the hardware owner, so each scrape sees those of all workers
+    source = str(os.getpid())
+    while True:
+        time.sleep(METRICS_PUSH_INTERVAL)
+        try:
+            get_hardware_client().call(MetricsController.__name__, 'merge_metrics', source, REGISTRY.state())
+        except Exception as err:
+            logger.debug('Pushing worker metrics failed: %s', err)
+
+
+def _run_hardware_owner(socket_path: str, authkey: bytes, start_hardware: Callable[[], None]):
+    # Terminating the owner must release the pins like any other shutdown
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    services = {controller.__class__.__name__: controller for controller in (
+        DeviceSettingsController(),
+        DeviceStatusController(),
+        DeviceJobController(),
+        DeviceTimingController(),
+        DeviceDACController(),
+        DeviceSessionController(),
+        MetricsController()
+    )}
+    # The status demand of the workers keeps the samplers running
+    services[CM_API.status_demand.__class__.__name__] = CM_API.status_demand
+    server = HardwareServer(
+        socket_path=socket_path,
+        authkey=authkey,
+        services=services,
+        refresh_status=CM_API.refresh_status,
+        status_cache=CM_API.status_cache,
+        push_interval=STATUS_MAX_AGE
+    )
+    try:
+        start_hardware()
+        server.serve_forever()
+    finally:
+        server.close()
+        CM_API.release_pins()
+
+
+def _stop_hardware_owner(pid: int):
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + HARDWARE_OWNER_STOP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                return
+        except ChildProcessError:
+            # Already reaped by gunicorn
+            return
+        time.sleep(0.1)
+    logger.warning('Hardware owner process %s did not stop, killing it.', pid)
+    os.kill(pid, signal.SIGKILL)
+
+
+def _watch_hardware_owner(pid: int):
+    # Without the hardware owner the workers can only answer with errors, so the whole server stops
+    while True:
+        time.sleep(HARDWARE_OWNER_CHECK_INTERVAL)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            logger.error('Hardware owner process %s stopped, shutting down.', pid)
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+
+
+# Status snapshots of the workers older than this (seconds) are not served, the hardware owner pushes one at least every STATUS_MAX_AGE
+STATUS_MIRROR_MAX_AGE = 3 * STATUS_MAX_AGE
+
+# Seconds between two pushes of the metrics of a worker to the hardware owner
+METRICS_PUSH_INTERVAL = 10
+
+# Seconds between the checks whether the hardware owner process is still running
+HARDWARE_OWNER_CHECK_INTERVAL = 1
+
+# Seconds the hardware owner gets to release the pins when the server stops
+HARDWARE_OWNER_STOP_TIMEOUT = 10
@@ -0,0 +1,22 @@
+import os
+
+
+# The app reads its environment on import, the tests run against the simulated coffee machine
+_TEST_ENVIRONMENT = {
+    'MODE': 'test',
+    'CERT_FILE': '',
+    'KEY_FILE': '',
+    'APP_PORT': '5000',
+    'APP_HOST': 'localhost',
+    'SECRET_KEY': 'test',
+    'APP_URL_PREFIX': '/api',
+    'SWAGGER_BASE_URL': '',
+    'WEBAPI_DOMAIN': 'https://localhost',
+    'WEBAPI_PORT': '1',
+    'SSL_CA_BUNDLE': '',
+    'HARDWARE_BACKEND': 'simulated',
+    'SIMULATION_TIME_SCALE': '0.5'
+}
+
+for _key, _value in _TEST_ENVIRONMENT.items():
+    os.environ.setdefault(_key, _value)
@@ -0,0 +1,83 @@
+import time
+
+import jwt
+import pytest
+
+from config.flask_config import AuthenticationFailed, ResourceException
+from utils.auth import TokenVerifier
+
+
+JWT_KEY = 'test-secret-with-at-least-32-bytes!'
+
+
+class _WebAPI:
+    # Answers is_user like the WebAPI and counts the calls
+    def __init__(self, status_code: int = None):
+        self.status_code = status_code
+        self.calls = 0
+
+    def is_user(self, token: str):
+        self.calls += 1
+        if not (self.status_code is None):
+            raise ResourceException(status_code=self.status_code, message='Nicht erlaubt.')
+
+
+def _token(key: str = JWT_KEY, expires_in: float = 60) -> str:
+    return jwt.encode({'sub': 'user', 'exp': int(time.time() + expires_in)}, key, algorithm='HS256')
+
+
+def test_valid_tokens_are_verified_locally():
+    web_api = _WebAPI()
+    verifier = TokenVerifier(web_api, jwt_key=JWT_KEY)
+    assert verifier.verifies_locally
+    verifier.verify(_token())
+    assert web_api.calls == 0
+
+
+def test_expired_tokens_are_rejected():
+    verifier = TokenVerifier(_WebAPI(), jwt_key=JWT_KEY)
+    with pytest.raises(AuthenticationFailed):
+        verifier.verify(_token(expires_in=-60))
+
+
+def test_tokens_with_bad_signatures_are_rejected():
+    web_api = _WebAPI()
+    verifier = TokenVerifier(web_api, jwt_key=JWT_KEY)
+    with pytest.raises(AuthenticationFailed):
+        verifier.verify(_token(key='another-secret-with-at-least-32-bytes'))
+    assert web_api.calls == 0
+
+
+def test_remote_verdicts_are_cached():
+    web_api = _WebAPI()
+    verifier = TokenVerifier(web_api)
+    assert not verifier.verifies_locally
+    token = _token()
+    verifier.verify(token)
+    verifier.verify(token)
+    assert web_api.calls == 1
+
+
+def test_remote_rejections_are_cached_briefly():
+    web_api = _WebAPI(status_code=401)
+    verifier = TokenVerifier(web_api, negative_cache_ttl=0.05)
+    token = _token()
+    for _ in range(2):
+        with pytest.raises(ResourceException) as err:
+            verifier.verify(token)
+        assert err.value.status_code == 401
+    assert web_api.calls == 1
+    time.sleep(0.1)
+    with pytest.raises(ResourceException):
+        verifier.verify(token)
+    assert web_api.calls == 2
+
+
+def test_remote_errors_are_not_cached():
+    web_api = _WebAPI(status_code=503)
+    verifier = TokenVerifier(web_api)
+    token = _token()
+    for _ in range(2):
+        with pytest.raises(ResourceException):
+            verifier.verify(token)
+    assert web_api.calls == 2
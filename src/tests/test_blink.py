@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+import core
+from core import LED_NAMES, CoffeeMachineHardwareAPI
+from core.blink import BlinkDecoder, BlinkSampler, LEDPattern
+from core.snapshot import StatusDemand
+
+
+def _feed(decoder, duration, interval, mask_at):
+    steps = int(round(duration / interval))
+    for step in range(steps + 1):
+        decoder.add(step * interval, mask_at(step * interval))
+    return steps * interval
+
+
+def test_steady_and_blinking_leds():
+    decoder = BlinkDecoder(led_count=3, window=2.0, capacity=256)
+    # LED 0 steady on, LED 1 off, LED 2 blinks at 2 Hz with 50 % duty cycle
+    now = _feed(decoder, 2.0, 0.02, lambda t: 0b001 | (0b100 if (t + 1e-9) % 0.5 < 0.25 else 0))
+    patterns = decoder.decode(now=now)
+    assert [pattern.state for pattern in patterns] == [LEDPattern.ON, LEDPattern.OFF, LEDPattern.BLINKING]
+    assert patterns[0].is_lit and not patterns[1].is_lit and patterns[2].is_lit
+    assert patterns[0].frequency == patterns[1].frequency == 0
+    assert patterns[2].frequency == pytest.approx(2.0, rel=0.1)
+    assert patterns[0].duty_cycle == pytest.approx(1.0)
+    assert patterns[2].duty_cycle == pytest.approx(0.5, abs=0.05)
+    assert patterns[2].age < 0.25
+    assert patterns[0].age == pytest.approx(2.0)
+
+
+def test_a_single_change_is_a_switched_led():
+    decoder = BlinkDecoder(led_count=1, window=2.0, capacity=256)
+    now = _feed(decoder, 2.0, 0.1, lambda t: 1 if t >= 1.5 else 0)
+    pattern = decoder.decode(now=now)[0]
+    assert pattern.state == LEDPattern.ON
+    assert pattern.frequency == 0
+    assert pattern.age == pytest.approx(0.5)
+
+
+def test_patterns_need_half_a_window():
+    decoder = BlinkDecoder(led_count=1, window=2.0, capacity=256)
+    assert decoder.decode(now=0) is None
+    now = _feed(decoder, 0.9, 0.1, lambda t: 1)
+    assert decoder.decode(now=now) is None
+    decoder.add(1.0, 1)
+    assert decoder.decode(now=1.0)[0].state == LEDPattern.ON
+    # Samples older than the window are ignored
+    assert decoder.decode(now=3.5) is None
+    decoder.clear()
+    assert decoder.decode(now=1.0) is None
+
+
+def test_the_ring_keeps_the_latest_samples():
+    decoder = BlinkDecoder(led_count=1, window=10.0, capacity=8)
+    now = _feed(decoder, 20, 1, lambda t: int(t) % 2)
+    pattern = decoder.decode(now=now)[0]
+    # 8 samples over 7 seconds alternate 7 times
+    assert pattern.state == LEDPattern.BLINKING
+    assert pattern.frequency == pytest.approx(0.5)
+
+
+def test_sampler_feeds_the_decoder():
+    decoder = BlinkDecoder(led_count=1, window=0.2, capacity=64)
+    reads = threading.Semaphore(0)
+
+    def read_mask():
+        reads.release()
+        return 1
+
+    sampler = BlinkSampler(read_mask, decoder, interval=0.01)
+    sampler.start()
+    try:
+        for _ in range(20):
+            assert reads.acquire(timeout=2)
+        assert sampler.is_running()
+        assert decoder.decode()[0].state == LEDPattern.ON
+    finally:
+        sampler.stop()
+    assert not sampler.is_running()
+
+
+def test_sampler_survives_failing_reads():
+    decoder = BlinkDecoder(led_count=1, window=0.2, capacity=64)
+    failed = threading.Event()
+
+    def read_mask():
+        failed.set()
+        raise OSError('Bus error')
+
+    sampler = BlinkSampler(read_mask, decoder, interval=0.01)
+    sampler.start()
+    try:
+        assert failed.wait(timeout=2)
+        assert sampler.is_running()
+    finally:
+        sampler.stop()
+    assert decoder.decode() is None
+
+
+def test_recent_leds_hold_blinking_leds_on():
+    decoder = BlinkDecoder(led_count=3, window=2.0, capacity=256)
+    assert decoder.recent(hold=1.0, now=0) is None
+    # LED 0 steady on, LED 1 blinks, LED 2 went off 1.5 seconds ago
+    now = _feed(decoder, 2.0, 0.02, lambda t: 0b001 | (0b010 if (t + 1e-9) % 0.5 < 0.25 else 0) | (0b100 if t < 0.5 else 0))
+    snapshot = decoder.recent(hold=1.0, now=now)
+    assert (snapshot.values, snapshot.known, snapshot.uncertain) == (0b011, 0b111, 0b010)
+    # The samples must cover the hold time and be recent
+    assert decoder.recent(hold=2.5, now=now) is None
+    assert decoder.recent(hold=1.0, now=now + 1.5) is None
+
+
+def test_status_reads_take_the_leds_from_the_blink_samples(monkeypatch):
+    def read_gpio_list(*args, **kwargs):
+        raise AssertionError('The GPIOs were read a second time')
+
+    api = CoffeeMachineHardwareAPI()
+    water = 1 << LED_NAMES.index('WATER')
+    now = time.monotonic()
+    for step in range(100):
+        api._blink_decoder.add(now - 2 + step * 0.02, water)
+    monkeypatch.setattr(api._blink_sampler, 'is_running', lambda: True)
+    monkeypatch.setattr(core, 'read_gpio_list', read_gpio_list)
+    status = api._read_hardware_status()
+    assert not status.water_tank_ready
+    assert status.coffee_grounds_container_ready
+
+
+def test_concurrent_status_reads_derive_the_runtime_state_one_after_another(monkeypatch):
+    api = CoffeeMachineHardwareAPI()
+    now = time.monotonic()
+    for step in range(100):
+        api._blink_decoder.add(now - 2 + step * 0.02, 0)
+    monkeypatch.setattr(api._blink_sampler, 'is_running', lambda: True)
+    get_runtime_state = core._get_runtime_state
+    running = []
+    overlaps = []
+
+    def slow_runtime_state(leds, previous):
+        running.append(1)
+        overlaps.append(len(running) > 1)
+        time.sleep(0.05)
+        running.pop()
+        return get_runtime_state(leds=leds, previous=previous)
+
+    monkeypatch.setattr(core, '_get_runtime_state', slow_runtime_state)
+    threads = [threading.Thread(target=api._read_hardware_status) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [False, False, False]
+
+
+def test_sampler_pauses_without_demand():
+    decoder = BlinkDecoder(led_count=1, window=0.2, capacity=64)
+    demand = StatusDemand(idle_time=0.1)
+    reads = []
+    sampler = BlinkSampler(lambda: reads.append(1) or 1, decoder, interval=0.01, demand=demand)
+    sampler.start()
+    try:
+        time.sleep(0.05)
+        assert reads == []
+        demand.touch()
+        time.sleep(0.3)
+        # Sampled while asked for, then paused
+        count = len(reads)
+        assert count > 0
+        time.sleep(0.05)
+        assert len(reads) == count
+        # Samples from before the pause are dropped once it resumes
+        demand.touch()
+        time.sleep(0.02)
+        assert decoder.recent(hold=0.15) is None
+    finally:
+        sampler.stop()
+    assert not sampler.is_running()
+
+
+def test_status_requests_keep_the_samplers_running():
+    api = CoffeeMachineHardwareAPI()
+    assert not api.status_demand.is_active()
+    api.refresh_status()
+    # Refreshing for the workers is not a request
+    assert not api.status_demand.is_active()
+    api.get_status_snapshot()
+    assert api.status_demand.is_active()
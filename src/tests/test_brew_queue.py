@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from core.brew_queue import BrewQueue, BrewQueueFullException, BrewTicket
+
+
+def _wait_for_ticket(queue: BrewQueue, ticket: BrewTicket, timeout: float = 5) -> BrewTicket:
+    deadline = time.monotonic() + timeout
+    while not ticket.is_finished() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return queue.get(ticket.ticket_id)
+
+
+def test_failing_ready_wait_does_not_stop_the_queue():
+    waits = []
+
+    def wait_until_ready(timeout):
+        waits.append(timeout)
+        if len(waits) == 1:
+            raise RuntimeError('Status nicht lesbar.')
+        return 'session'
+
+    queue = BrewQueue(brew=lambda ticket, session: 'local-id', wait_until_ready=wait_until_ready, max_size=10, ready_timeout=1, cycle_estimate=60)
+    first = queue.submit('token', 'first job')
+    second = queue.submit('token', 'second job')
+
+    first = _wait_for_ticket(queue, first)
+    assert first.state == BrewTicket.FAILED
+    assert first.message == 'Status nicht lesbar.'
+    second = _wait_for_ticket(queue, second)
+    assert second.state == BrewTicket.DONE
+    assert second.result == 'local-id'
+    assert queue.is_idle()
+
+
+def test_tickets_are_brewed_in_order():
+    brewed = []
+    release = threading.Event()
+
+    def brew(ticket, session):
+        release.wait(timeout=5)
+        brewed.append(ticket.job)
+        return ticket.job
+
+    queue = BrewQueue(brew=brew, wait_until_ready=lambda timeout: 'session', max_size=2, ready_timeout=1, cycle_estimate=60)
+    tickets = [queue.submit('token', 'job {}'.format(i)) for i in range(2)]
+    _wait_for_state(tickets[0], BrewTicket.BREWING)
+    third = queue.submit('token', 'job 2')
+    # The queue holds max_size tickets besides the one that is brewing
+    with pytest.raises(BrewQueueFullException):
+        queue.submit('token', 'job 3')
+    assert [queue.position(ticket) for ticket in tickets + [third]] == [0, 1, 2]
+    assert queue.estimated_start(third) - queue.estimated_start(tickets[1]) == pytest.approx(60, abs=1)
+
+    release.set()
+    for ticket in tickets + [third]:
+        assert _wait_for_ticket(queue, ticket).state == BrewTicket.DONE
+    assert brewed == ['job 0', 'job 1', 'job 2']
+    assert queue.get(third.ticket_id).token is None
+    # The ticket reports the steps of its brew
+    assert [name for name, duration in queue.get(third.ticket_id).timings] == ['queue', 'total']
+
+
+def test_ticket_fails_if_the_machine_does_not_get_ready():
+    brewed = []
+    queue = BrewQueue(brew=lambda ticket, session: brewed.append(ticket), wait_until_ready=lambda timeout: None, max_size=1, ready_timeout=1, cycle_estimate=60)
+    ticket = _wait_for_ticket(queue, queue.submit('token', 'job'))
+    assert (ticket.state, ticket.message) == (BrewTicket.FAILED, 'Kaffeemaschine ist nicht bereit.')
+    assert brewed == []
+
+
+def test_brew_gets_the_session_of_the_ready_wait():
+    sessions = []
+    queue = BrewQueue(brew=lambda ticket, session: sessions.append(session), wait_until_ready=lambda timeout: 'session', max_size=1, ready_timeout=1, cycle_estimate=60)
+    assert _wait_for_ticket(queue, queue.submit('token', 'job')).state == BrewTicket.DONE
+    assert sessions == ['session']
+
+
+def _wait_for_state(ticket: BrewTicket, state: str, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while ticket.state != state and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ticket.state == state
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from utils.cache import MISSING, SingleFlight, TTLCache
+
+
+def test_entries_expire():
+    cache = TTLCache(max_size=4, ttl=0.02)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=10)
+    cache.set('c', 3, ttl=0)
+    assert cache.get('a') == 1
+    assert cache.get('c') is MISSING
+    time.sleep(0.05)
+    assert cache.get('a') is MISSING
+    assert cache.get('a', default=None) is None
+    assert cache.get('b') == 2
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TTLCache(max_size=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert cache.get('b') is MISSING
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    cache.delete('a')
+    assert cache.get('a') is MISSING
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_cache_size_must_be_positive():
+    with pytest.raises(ValueError):
+        TTLCache(max_size=0, ttl=1)
+
+
+def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=2)
+        return 'verdict'
+
+    leader = threading.Thread(target=lambda: results.append(single_flight.do('key', slow_call)))
+    leader.start()
+    assert started.wait(timeout=2)
+    followers = [threading.Thread(target=lambda: results.append(single_flight.do('key', slow_call))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(timeout=2)
+    assert calls == [1]
+    assert results == ['verdict'] * 4
+    # Once the call finished, the next one runs again
+    assert single_flight.do('key', lambda: 'next') == 'next'
+
+
+def test_errors_are_shared_and_not_remembered():
+    single_flight = SingleFlight()
+
+    def failing_call():
+        raise OSError('WebAPI nicht erreichbar')
+
+    with pytest.raises(OSError):
+        single_flight.do('key', failing_call)
+    assert single_flight.do('key', lambda: 1) == 1
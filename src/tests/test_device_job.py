@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from core import CM_API
+from core.brew_queue import BrewTicket
+from core.session import SessionSupervisor
+from core.snapshot import StatusCache
+from core.outbox import JobOutbox
+from utils.auth import get_token_owner
+from models import CreateDeviceJob, DeviceStatus, EditDeviceStatus, DeviceRuntimeState
+from controllers.device_status import DeviceStatusController
+import controllers.device_job as device_job
+
+
+@pytest.fixture(scope='module')
+def hardware():
+    CM_API.configure_pins()
+    CM_API.start_status_monitoring()
+    yield CM_API
+    CM_API.release_pins()
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    # Reports are only journaled, the outbox is not started and never reaches the WebAPI
+    journal = JobOutbox(journal_path=tmp_path / 'job_outbox.jsonl', send=lambda token, job: {}, get_owner=get_token_owner)
+    monkeypatch.setattr(device_job, 'JOB_OUTBOX', journal)
+    return journal
+
+
+def _wait_for_ticket(ticket_id: str, timeout: float) -> BrewTicket:
+    deadline = time.monotonic() + timeout
+    ticket = device_job.BREW_QUEUE.get(ticket_id)
+    while not ticket.is_finished() and time.monotonic() < deadline:
+        time.sleep(0.1)
+        ticket = device_job.BREW_QUEUE.get(ticket_id)
+    return ticket
+
+
+def test_queued_jobs_are_brewed(hardware, outbox):
+    DeviceStatusController().set_status('token', EditDeviceStatus(coffee_machine_runtime_state=DeviceRuntimeState.ON.state_id))
+    assert not (hardware.wait_for_status(lambda s: s.device_ready, timeout=30) is None)
+
+    controller = device_job.DeviceJobController()
+    tickets = [controller.create_job('token', CreateDeviceJob(doses=doses, water_in_percent=50, coffee_strength_in_percent=50)) for doses in (1, 2)]
+
+    for created in tickets:
+        ticket = _wait_for_ticket(created.ticket_id, timeout=device_job.BREW_READY_TIMEOUT)
+        assert ticket.state == BrewTicket.DONE, ticket.message
+        assert not (outbox.get(ticket.result) is None)
+
+
+class _ReadyMachine:
+    # Always ready, someone else takes the session right after the first ready status
+    def __init__(self):
+        self.session_supervisor = SessionSupervisor(
+            open_relay=lambda: None,
+            close_relay=lambda: None,
+            refresh_status=lambda: None,
+            status_cache=StatusCache(),
+            refresh_interval=0.01,
+            ready_stable_time=0,
+            max_release_wait=0
+        )
+        self.waits = 0
+
+    @property
+    def has_session(self) -> bool:
+        return not self.session_supervisor.is_idle()
+
+    def wait_for_status(self, predicate, timeout):
+        self.waits = self.waits + 1
+        status = DeviceStatus()
+        status.device_ready = True
+        if not predicate(status):
+            return None
+        if self.waits == 1:
+            self.session_supervisor.acquire(object())
+        return status
+
+
+def test_ready_wait_acquires_the_session(monkeypatch):
+    machine = _ReadyMachine()
+    monkeypatch.setattr(device_job, 'CM_API', machine)
+    assert device_job._wait_until_ready(timeout=1) is None
+    # The session taken in between makes the wait go on until it ends, the job does not fail with 405
+    assert machine.waits == 2
+
+    with machine.session_supervisor._condition:
+        machine.session_supervisor._set_idle()
+    session = device_job._wait_until_ready(timeout=1)
+    assert not (session is None)
+    assert machine.has_session
+    session.close()
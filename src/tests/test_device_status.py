@@ -0,0 +1,73 @@
+import json
+import time
+
+import pytest
+
+import controllers.device_status as device_status
+from config.flask_config import ResourceException
+from controllers.device_status import DeviceStatusController
+from core import CoffeeMachineHardwareAPI
+from models import DeviceStatus
+
+
+@pytest.fixture
+def api(monkeypatch):
+    # A hardware API of its own, the tests publish the status changes themselves
+    api = CoffeeMachineHardwareAPI()
+    monkeypatch.setattr(device_status, 'CM_API', api)
+    return api
+
+
+def _publish(api: CoffeeMachineHardwareAPI, **fields):
+    status = api.get_status_snapshot().status
+    for name, value in fields.items():
+        setattr(status, name, value)
+    return api._status_cache.publish(status)
+
+
+def test_poll_answers_with_the_new_version(api):
+    version = api.get_status_snapshot().version
+    controller = DeviceStatusController()
+    status, status_code, headers = controller.poll_status('token', version=str(version - 1), timeout='5')
+    assert headers['X-Status-Version'] == str(version)
+
+    snapshot = _publish(api, device_ready=not status.device_ready)
+    status, status_code, headers = controller.poll_status('token', version=str(version), timeout='5')
+    assert headers['X-Status-Version'] == str(snapshot.version)
+    assert status.device_ready == snapshot.status.device_ready
+
+
+def test_poll_times_out_with_the_current_version(api):
+    version = api.get_status_snapshot().version
+    started = time.monotonic()
+    status, status_code, headers = DeviceStatusController().poll_status('token', version=str(version), timeout='0.2')
+    assert 0.2 <= time.monotonic() - started < 2
+    assert (status_code, headers['X-Status-Version']) == (200, str(version))
+
+
+def test_poll_rejects_invalid_parameters(api):
+    with pytest.raises(ResourceException) as err:
+        DeviceStatusController().poll_status('token', version='neu')
+    assert err.value.status_code == 400
+
+
+def _parse_event(event: str) -> dict:
+    lines = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+    return {'event': lines['event'], 'id': int(lines['id']), 'data': json.loads(lines['data'])}
+
+
+def test_stream_sends_the_status_then_changes_and_heartbeats(api, monkeypatch):
+    monkeypatch.setattr(device_status, 'STATUS_STREAM_HEARTBEAT', 0.05)
+    events = DeviceStatusController().stream_status('token')
+    assert next(events).startswith('retry: ')
+    first = _parse_event(next(events))
+    assert first['event'] == 'snapshot'
+    assert sorted(first['data'].keys()) == sorted(DeviceStatus.get_fields().keys())
+
+    # Nothing changed within the heartbeat interval
+    assert next(events) == ': heartbeat\n\n'
+
+    snapshot = _publish(api, device_ready=not first['data']['device_ready'])
+    delta = _parse_event(next(events))
+    assert delta == {'event': 'delta', 'id': snapshot.version, 'data': {'device_ready': snapshot.status.device_ready}}
+    events.close()
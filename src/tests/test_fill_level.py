@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import core.fill_level
+import core.i2c
+from core.fill_level import ADS1115, AnalogMultiplexer, FillLevelScanner, FillLevelSensor, _get_gray_rank
+from core.i2c import I2CBusManager
+from core.simulation import SimulatedCoffeeMachine, SimulatedGPIO, SimulatedSMBus
+
+
+MUX_PINS = [40, 41, 42]
+ADC_ADDRESS = 0x48
+CHANNELS = {'WATER': 5, 'COFFEE_BEANS': 6, 'COFFEE_GROUNDS': 7}
+
+
+class _RecordingGPIO(SimulatedGPIO):
+    def __init__(self, machine):
+        super().__init__(machine)
+        self.outputs = []
+
+    def output(self, channel, value):
+        self.outputs.append((channel, value))
+        super().output(channel, value)
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    # A machine of its own with the multiplexer and the ADC, the app does not measure fill levels in the tests
+    machine = SimulatedCoffeeMachine(time_scale=1)
+    machine.configure(in_pins={}, out_pins={}, dac_addresses={}, mux_pins=MUX_PINS, adc_address=ADC_ADDRESS, adc_channels=CHANNELS)
+    gpio = _RecordingGPIO(machine)
+    gpio.setmode(gpio.BCM)
+    gpio.setup(MUX_PINS, gpio.OUT, initial=gpio.LOW)
+    machine.gpio = gpio
+    monkeypatch.setattr(core.fill_level, 'GPIO', gpio)
+    monkeypatch.setattr(core.i2c, 'SMBus', lambda bus=None: SimulatedSMBus(machine, bus))
+    return machine
+
+
+def _set_levels(machine, water, beans, grounds):
+    machine._water_level = water
+    machine._bean_level = beans
+    machine._grounds_level = grounds
+
+
+def _create_scanner(address=ADC_ADDRESS, max_age=60.0, smoothing=0.5) -> FillLevelScanner:
+    sensors = [FillLevelSensor(name=name, channel=channel, empty_value=0, full_value=SimulatedCoffeeMachine.ADC_FULL_VALUE) for name, channel in CHANNELS.items()]
+    return FillLevelScanner(
+        multiplexer=AnalogMultiplexer(select_gpios=MUX_PINS),
+        adc=ADS1115(i2c=I2CBusManager(cache_ttl=60), bus_number=1, address=address),
+        sensors=sensors,
+        lock=threading.Lock(),
+        interval=60,
+        settle_time=0,
+        smoothing=smoothing,
+        max_age=max_age
+    )
+
+
+def test_gray_rank():
+    # Gray code sequence 0, 1, 3, 2, 6, 7, 5, 4
+    assert [_get_gray_rank(value) for value in (0, 1, 3, 2, 6, 7, 5, 4)] == list(range(8))
+
+
+def test_multiplexer_only_writes_changed_select_lines(machine):
+    gpio = machine.gpio
+    multiplexer = AnalogMultiplexer(select_gpios=MUX_PINS)
+    assert multiplexer.channel_count == 8
+    assert multiplexer.select(5)
+    assert gpio.outputs == [(40, gpio.HIGH), (41, gpio.LOW), (42, gpio.HIGH)]
+    gpio.outputs.clear()
+    assert not multiplexer.select(5)
+    assert multiplexer.select(7)
+    assert gpio.outputs == [(41, gpio.HIGH)]
+    gpio.outputs.clear()
+    multiplexer.invalidate()
+    multiplexer.select(7)
+    assert len(gpio.outputs) == 3
+
+
+def test_scan_reads_every_sensor(machine):
+    _set_levels(machine, water=50, beans=100, grounds=0)
+    scanner = _create_scanner()
+    assert scanner.levels() == {'WATER': None, 'COFFEE_BEANS': None, 'COFFEE_GROUNDS': None}
+    scanner.scan()
+    assert scanner.levels() == {'WATER': 50, 'COFFEE_BEANS': 100, 'COFFEE_GROUNDS': 0}
+
+
+def test_scan_visits_the_channels_in_gray_code_order(machine):
+    scanner = _create_scanner()
+    scanner.scan()
+    machine.gpio.outputs.clear()
+    scanner.scan()
+    # Channels 5, 6 and 7 in Gray code order are 6, 7, 5. Within the scan every switch changes one select line, the first one starts at channel 5 of the last scan
+    assert machine.gpio.outputs == [(40, machine.gpio.LOW), (41, machine.gpio.HIGH), (40, machine.gpio.HIGH), (41, machine.gpio.LOW)]
+
+
+def test_levels_are_smoothed(machine):
+    _set_levels(machine, water=80, beans=80, grounds=80)
+    scanner = _create_scanner(smoothing=0.5)
+    scanner.scan()
+    _set_levels(machine, water=40, beans=80, grounds=80)
+    scanner.scan()
+    assert scanner.levels()['WATER'] == 60
+
+
+def test_old_levels_are_unknown(machine):
+    scanner = _create_scanner(max_age=0)
+    scanner.scan()
+    assert scanner.levels() == {'WATER': None, 'COFFEE_BEANS': None, 'COFFEE_GROUNDS': None}
+
+
+def test_failed_reads_leave_the_level_unknown(machine):
+    # No ADC at this address
+    scanner = _create_scanner(address=0x49)
+    scanner.scan()
+    assert scanner.levels() == {'WATER': None, 'COFFEE_BEANS': None, 'COFFEE_GROUNDS': None}
+
+
+def test_sensors_may_count_down():
+    sensor = FillLevelSensor(name='WATER', channel=0, empty_value=20000, full_value=4000)
+    sensor.update(value=12000, smoothing=0.3, now=1.0)
+    assert sensor.level == 50
+    sensor.update(value=30000, smoothing=1.0, now=2.0)
+    assert sensor.level == 0
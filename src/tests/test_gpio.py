@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import core.gpio
+import core.pins
+from core import CM_API
+from core.gpio import GPIOReadMode, GPIOSnapshot, PinState, read_gpio_list, reduce_gpio_samples
+
+
+class _ScriptedGPIO:
+    # Returns the scripted levels of every pin one input() call after the other
+    BCM = 'BCM'
+    IN = 'IN'
+    PUD_DOWN = 'PUD_DOWN'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, levels: dict):
+        self._levels = {gpio: list(values) for gpio, values in levels.items()}
+        self.cleaned_up = None
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, gpio, direction, pull_up_down=None):
+        pass
+
+    def input(self, gpio):
+        return self._levels[gpio].pop(0)
+
+    def cleanup(self, gpio_numbers):
+        self.cleaned_up = gpio_numbers
+
+
+@pytest.fixture
+def scripted_gpio():
+    def install(levels: dict) -> _ScriptedGPIO:
+        gpio = _ScriptedGPIO(levels)
+        monkeypatch.setattr(core.gpio, 'GPIO', gpio)
+        monkeypatch.setattr(core.pins, 'GPIO', gpio)
+        return gpio
+
+    # The status sampler of the app must not read the scripted pins
+    with CM_API.hardware_lock, pytest.MonkeyPatch.context() as monkeypatch:
+        yield install
+
+
+def test_read_mode_from_str():
+    assert GPIOReadMode.from_str('edge') == GPIOReadMode.EDGE
+    with pytest.raises(ValueError):
+        GPIOReadMode.from_str('unknown')
+
+
+def test_pin_state_holds_blinking_leds_high():
+    state = PinState(gpio_number=5, value=True, now=10.0)
+    state.update(value=False, now=10.5)
+    assert state.last_edge == 10.5
+    # A LED that was HIGH within the hold window still counts as HIGH
+    assert state.is_high(now=11.0, hold_in_sec=1.5)
+    assert not state.is_high(now=12.5, hold_in_sec=1.5)
+
+
+def test_pin_state_ignores_repeated_values():
+    state = PinState(gpio_number=5, value=False, now=10.0)
+    assert state.last_high is None
+    assert not state.is_high(now=10.0, hold_in_sec=1.5)
+    state.update(value=False, now=11.0)
+    assert state.last_edge == 10.0
+    state.update(value=True, now=12.0)
+    assert (state.last_edge, state.last_high) == (12.0, 12.0)
+
+
+def test_reduce_gpio_samples_votes_on_the_cycles():
+    # 6 passes x 3 pins in 3 check cycles of 2 passes
+    samples = np.array([
+        [1, 0, 1],
+        [0, 0, 0],
+        [1, 0, 0],
+        [1, 0, 0],
+        [0, 1, 0],
+        [0, 0, 0],
+    ], dtype=np.uint8)
+    values, confidence, duty_cycle = reduce_gpio_samples(samples=samples, check_cycles=3)
+    # Pin 0 is seen HIGH in two cycles, pin 1 and pin 2 in one
+    assert values.tolist() == [True, False, False]
+    assert confidence.tolist() == pytest.approx([2 / 3, 2 / 3, 2 / 3])
+    assert duty_cycle.tolist() == pytest.approx([0.5, 1 / 6, 1 / 6])
+
+
+def test_reduce_gpio_samples_counts_ties_as_high():
+    samples = np.array([[1], [0], [0], [0]], dtype=np.uint8)
+    values, confidence, duty_cycle = reduce_gpio_samples(samples=samples, check_cycles=2)
+    assert values.tolist() == [True]
+    assert confidence.tolist() == [0.5]
+
+
+def test_reduce_gpio_samples_ignores_incomplete_cycles():
+    # The last pass does not fill a cycle of its own
+    samples = np.array([[0], [0], [0], [0], [1]], dtype=np.uint8)
+    values, confidence, duty_cycle = reduce_gpio_samples(samples=samples, check_cycles=2)
+    assert values.tolist() == [False]
+    with pytest.raises(ValueError):
+        reduce_gpio_samples(samples=samples, check_cycles=6)
+    with pytest.raises(ValueError):
+        reduce_gpio_samples(samples=samples, check_cycles=0)
+
+
+def test_snapshot_resolves_unknown_pins_with_the_fallback():
+    snapshot = GPIOSnapshot(values=0b0101, known=0b0011, time_in_milli=0)
+    assert snapshot.resolve(fallback=0b1000) == 0b1001
+    assert snapshot.resolve(fallback=0b1111) == 0b1101
+
+
+def test_poll_read_drops_pins_that_change_between_cycles(scripted_gpio):
+    # Two samples per cycle, pin 40 stays HIGH, pin 41 is HIGH in the first cycle only, pin 42 stays LOW
+    gpio = scripted_gpio({40: [0, 1, 1], 41: [1, 0, 0], 42: [0, 0, 0, 0]})
+    snapshot = read_gpio_list(gpio_numbers=[40, 41, 42], sample_rate=2, check_cycles=2)
+    assert (snapshot.values, snapshot.known) == (0b001, 0b101)
+    assert gpio.cleaned_up == [40, 41, 42]
+    with pytest.raises(ValueError):
+        read_gpio_list(gpio_numbers=[40], check_cycles=0)
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from core.history import StatusHistory
+
+
+class _Clock:
+    def __init__(self, now: int = 1000):
+        self.value = now
+
+    def __call__(self) -> int:
+        return self.value
+
+
+def _history(capacity=8, keepalive=10.0, file_path=None, clock=None):
+    history = StatusHistory(capacity, keepalive, file_path=file_path)
+    history.now = clock or _Clock()
+    return history
+
+
+def test_only_changes_and_keepalives_are_recorded():
+    clock = _Clock()
+    history = _history(clock=clock)
+    history.record(0b01)
+    clock.value += 500
+    history.record(0b01)
+    assert len(history) == 1
+    history.record(0b11)
+    clock.value += 10000
+    history.record(0b11)
+    assert history.records()['leds'].tolist() == [0b01, 0b11, 0b11]
+    assert history.records()['time_in_milli'].tolist() == [1000, 1500, 11500]
+
+
+def test_the_oldest_records_are_overwritten():
+    clock = _Clock()
+    history = _history(capacity=3, clock=clock)
+    for leds in range(5):
+        history.record(leds)
+        clock.value += 1
+    assert len(history) == history.capacity == 3
+    assert history.records()['leds'].tolist() == [2, 3, 4]
+
+
+def test_records_include_the_state_at_since():
+    clock = _Clock(0)
+    history = _history(clock=clock)
+    for leds in range(4):
+        history.record(leds)
+        clock.value += 100
+    assert history.records(since=150, until=250)['leds'].tolist() == [1, 2]
+    assert history.records(since=0)['leds'].tolist() == [0, 1, 2, 3]
+
+
+def test_records_never_go_backwards():
+    clock = _Clock(2000)
+    history = _history(clock=clock)
+    history.record(1)
+    clock.value = 1000
+    history.record(2)
+    assert history.records()['time_in_milli'].tolist() == [2000, 2000]
+
+
+def test_the_history_survives_a_restart(tmp_path):
+    path = tmp_path / 'history' / 'status_history.bin'
+    history = _history(file_path=path)
+    history.record(0b101)
+    history.close()
+    reopened = _history(file_path=path)
+    assert reopened.records()['leds'].tolist() == [0b101]
+    reopened.close()
+    # Another capacity starts a new history
+    resized = _history(capacity=16, file_path=path)
+    assert len(resized) == 0
+    resized.close()
+
+
+def test_capacity_must_hold_two_records():
+    with pytest.raises(ValueError):
+        StatusHistory(1, 10.0)
+
+
+def test_downsample_shares_of_the_leds():
+    clock = _Clock(0)
+    history = _history(clock=clock)
+    history.record(0b01)
+    clock.value = 1000
+    history.record(0b10)
+    clock.value = 2000
+    starts, coverage, shares = history.downsample(0, 2000, 4, led_count=2)
+    assert starts.tolist() == [0, 500, 1000, 1500]
+    assert coverage.tolist() == [1, 1, 1, 1]
+    assert shares.tolist() == [[1, 0], [1, 0], [0, 1], [0, 1]]
+    # Buckets across a change get the share of the time each LED was on
+    _, _, shares = history.downsample(500, 1500, 1, led_count=2)
+    assert shares.tolist() == [[0.5, 0.5]]
+
+
+def test_downsample_leaves_gaps_without_reads_uncovered():
+    clock = _Clock(0)
+    history = _history(keepalive=1.0, clock=clock)
+    history.record(0b1)
+    clock.value = 4000
+    _, coverage, shares = history.downsample(0, 4000, 2, led_count=1)
+    # A record holds for at most two keepalives
+    assert coverage.tolist() == [1, 0]
+    assert shares[0, 0] == 1
+    assert np.isnan(shares[1, 0])
+
+
+def test_downsample_without_records():
+    history = _history()
+    starts, coverage, shares = history.downsample(0, 1000, 2, led_count=8)
+    assert starts.tolist() == [0, 500]
+    assert coverage.tolist() == [0, 0]
+    assert shares.shape == (2, 8) and np.isnan(shares).all()
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+import core
+import core.i2c
+from core.exceptions import DACWriteException
+from core.i2c import I2CBusManager, _get_dac_message
+
+
+WATER = core.I2C_ADDRESS_MAPPINGS['WATER']
+COFFEE_STRENGTH = core.I2C_ADDRESS_MAPPINGS['COFFEE_STRENGTH']
+# Not configured in the simulated machine, writes are not acknowledged
+UNKNOWN_ADDRESS = 0x62
+
+
+def test_unchanged_values_are_skipped():
+    manager = I2CBusManager(cache_ttl=60)
+    manager.set_dac_value(bus_number=1, address=WATER, percent_value=30, i2c_delay=0)
+    manager.set_dac_value(bus_number=1, address=WATER, percent_value=30, i2c_delay=0)
+    value, stats = manager.stats(bus_number=1, address=WATER)
+    assert (stats.writes, stats.skipped_writes) == (1, 1)
+    assert value == _get_dac_message(30)[0]
+    manager.set_dac_value(bus_number=1, address=WATER, percent_value=40, i2c_delay=0)
+    assert manager.stats(bus_number=1, address=WATER)[1].writes == 2
+
+
+def test_cached_values_are_written_again_after_the_ttl():
+    manager = I2CBusManager(cache_ttl=0)
+    for _ in range(2):
+        manager.set_dac_value(bus_number=1, address=WATER, percent_value=30, i2c_delay=0)
+    assert manager.stats(bus_number=1, address=WATER)[1].writes == 2
+
+
+def test_a_batch_waits_once():
+    manager = I2CBusManager(cache_ttl=60)
+    started = time.monotonic()
+    acks = manager.set_dac_values(bus_number=1, percent_values={WATER: 10, COFFEE_STRENGTH: 20}, i2c_delay=0.2)
+    assert time.monotonic() - started < 0.35
+    assert acks == {WATER: None, COFFEE_STRENGTH: None}
+    # Nothing changed, nothing is written and nothing is waited for
+    started = time.monotonic()
+    assert manager.set_dac_values(bus_number=1, percent_values={WATER: 10, COFFEE_STRENGTH: 20}, i2c_delay=0.2) == {}
+    assert time.monotonic() - started < 0.1
+
+
+def test_verified_writes_end_once_the_dacs_hold_the_values():
+    manager = I2CBusManager(cache_ttl=60)
+    started = time.monotonic()
+    acks = manager.set_dac_values(bus_number=1, percent_values={WATER: 60, COFFEE_STRENGTH: 70}, i2c_delay=1, verify=True)
+    assert time.monotonic() - started < 0.5
+    assert sorted(acks.keys()) == [WATER, COFFEE_STRENGTH]
+    assert all(not (ack is None) and ack < 0.5 for ack in acks.values())
+
+
+class _PlainReadBus:
+    # Fails register reads, the MCP4725 would take the register byte for a command
+    def __init__(self, bus):
+        self._bus = bus
+        self.reads = []
+
+    def write_i2c_block_data(self, i2c_addr, register, data):
+        self._bus.write_i2c_block_data(i2c_addr, register, data)
+
+    def read_i2c_block_data(self, i2c_addr, register, length):
+        raise AssertionError('Register read of {:#x}'.format(i2c_addr))
+
+    def i2c_rdwr(self, *messages):
+        self.reads.extend((message.addr, message.len) for message in messages)
+        self._bus.i2c_rdwr(*messages)
+
+    def close(self):
+        self._bus.close()
+
+
+def test_dacs_are_read_back_without_a_command_byte(monkeypatch):
+    buses = []
+    create_bus = core.i2c.SMBus
+
+    def create_plain_read_bus(bus=None):
+        buses.append(_PlainReadBus(create_bus(bus)))
+        return buses[-1]
+
+    monkeypatch.setattr(core.i2c, 'SMBus', create_plain_read_bus)
+    manager = I2CBusManager(cache_ttl=60)
+    acks = manager.set_dac_values(bus_number=1, percent_values={WATER: 35}, i2c_delay=1, verify=True)
+    assert not (acks[WATER] is None)
+    assert buses[0].reads[0] == (WATER, 3)
+
+
+def test_failed_writes_are_reported_per_dac():
+    manager = I2CBusManager(cache_ttl=60)
+    manager.set_dac_value(bus_number=1, address=WATER, percent_value=80, i2c_delay=0)
+    with pytest.raises(DACWriteException) as err:
+        manager.set_dac_values(bus_number=1, percent_values={WATER: 80, UNKNOWN_ADDRESS: 10}, i2c_delay=0)
+    assert list(err.value.errors.keys()) == [UNKNOWN_ADDRESS]
+    assert manager.stats(bus_number=1, address=WATER)[1].skipped_writes == 1
+    assert manager.stats(bus_number=1, address=UNKNOWN_ADDRESS)[1].errors == 1
+    # The bus was reopened, no cached value is trusted anymore
+    assert manager.stats(bus_number=1, address=WATER)[0] is None
+
+
+def test_invalid_values_are_rejected_before_writing():
+    manager = I2CBusManager(cache_ttl=60)
+    with pytest.raises(ValueError):
+        manager.set_dac_values(bus_number=1, percent_values={WATER: 10, COFFEE_STRENGTH: 101}, i2c_delay=0)
+    assert manager.stats(bus_number=1, address=WATER)[1].writes == 0
@@ -0,0 +1,78 @@
+import json
+import logging
+import sys
+
+import pytest
+
+from config import logger as app_logger
+
+
+class _Counted:
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'counted'
+
+
+@pytest.fixture
+def restore_logging():
+    level = app_logger.logger.level
+    yield
+    app_logger.configure_logging(level=logging.getLevelName(level))
+
+
+def _record(msg, args=None, exc_info=None, **extra):
+    record = logging.LogRecord('app.test', logging.ERROR, __file__, 1, msg, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_lines_contain_the_message_and_extra_fields():
+    entry = json.loads(app_logger.json_formatter.format(_record('Job %s failed', ('abc',), job_id='abc', code=503)))
+    assert entry['message'] == 'Job abc failed'
+    assert entry['level'] == 'ERROR'
+    assert entry['logger'] == 'app.test'
+    assert (entry['job_id'], entry['code']) == ('abc', 503)
+    assert not ('args' in entry) and not ('msg' in entry)
+
+
+def test_json_lines_contain_the_traceback():
+    try:
+        raise ValueError('broken')
+    except ValueError:
+        exc_info = sys.exc_info()
+    entry = json.loads(app_logger.json_formatter.format(_record('Failed', exc_info=exc_info)))
+    assert 'ValueError: broken' in entry['exception']
+
+
+def test_queued_records_carry_the_merged_message():
+    argument = _Counted()
+    record = _record('Value %s', (argument,))
+    prepared = app_logger.queue_handler.prepare(record)
+    assert (prepared.msg, prepared.args) == ('Value counted', None)
+    assert argument.calls == 1
+    # The caller's record is left as it was
+    assert (record.msg, record.args) == ('Value %s', (argument,))
+
+
+def test_filtered_calls_do_not_build_the_message(restore_logging):
+    app_logger.configure_logging(level='INFO')
+    argument = _Counted()
+    logging.getLogger(app_logger.get_logger_name('test')).debug('Value %s', argument)
+    assert argument.calls == 0
+
+
+def test_configure_logging_sets_format_level_and_rotation(restore_logging):
+    max_bytes, backup_count = app_logger.general_file_handler.maxBytes, app_logger.general_file_handler.backupCount
+    try:
+        app_logger.configure_logging(level='DEBUG', log_format='json', max_bytes=2048, backup_count=2)
+        assert app_logger.logger.level == logging.DEBUG
+        assert app_logger.debug_handler.level == logging.DEBUG
+        assert all(handler.formatter is app_logger.json_formatter for handler in app_logger._handlers)
+        assert (app_logger.error_handler.maxBytes, app_logger.error_handler.backupCount) == (2048, 2)
+        assert (app_logger.general_file_handler.maxBytes, app_logger.general_file_handler.backupCount) == (2048, 2)
+    finally:
+        app_logger.configure_logging(log_format='text', max_bytes=max_bytes, backup_count=backup_count)
+    assert all(handler.formatter is app_logger.text_formatter for handler in app_logger._handlers)
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from config.flask_config import ResourceException
+from core.lookup import LookupCache
+
+
+def test_entries_are_kept_per_caller():
+    calls = []
+
+    def fetch(token, url, etag):
+        calls.append((token, url))
+        return {'owner': token}, None
+
+    cache = LookupCache(fetch=fetch, executor=ThreadPoolExecutor(max_workers=1), fresh_ttl=60, stale_ttl=60)
+    url = 'https://localhost:1/api/coffee/product/1'
+    assert cache.get('token-a', url) == {'owner': 'token-a'}
+    assert cache.get('token-a', url) == {'owner': 'token-a'}
+    # Another caller is asked for at the WebAPI with its own token
+    assert cache.peek('token-b', url) is None
+    assert cache.get('token-b', url) == {'owner': 'token-b'}
+    assert calls == [('token-a', url), ('token-b', url)]
+
+
+def test_stale_entries_are_revalidated_in_the_background():
+    calls = []
+
+    def fetch(token, url, etag):
+        calls.append(etag)
+        if etag is None:
+            return {'price': 100}, '"v1"'
+        # Not modified
+        return None, None
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    cache = LookupCache(fetch=fetch, executor=executor, fresh_ttl=0, stale_ttl=60)
+    url = 'https://localhost:1/api/coffee/product/1'
+    assert cache.get('token', url) == {'price': 100}
+    # The stale data is served right away, the revalidation sends the etag
+    assert cache.get('token', url) == {'price': 100}
+    executor.shutdown(wait=True)
+    assert calls == [None, '"v1"']
+    assert cache.peek('token', url) == {'price': 100}
+
+
+def test_entries_are_dropped_when_the_caller_loses_access():
+    def fetch(token, url, etag):
+        if etag is None:
+            return {'price': 100}, '"v1"'
+        raise ResourceException(status_code=403, message='Nicht erlaubt.')
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    cache = LookupCache(fetch=fetch, executor=executor, fresh_ttl=0, stale_ttl=60)
+    url = 'https://localhost:1/api/coffee/product/1'
+    cache.get('token', url)
+    cache.get('token', url)
+    executor.shutdown(wait=True)
+    assert cache.peek('token', url) is None
@@ -0,0 +1,88 @@
+from flask import Flask
+
+import resources.metrics
+from config.flask_config import FlaskExceptionConfig, ForbiddenResourceException, MetricsConfig
+from resources import METRICS_BP
+from utils.metrics import MetricsRegistry
+
+
+def _create_registry():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', 'Duration of a test.', ('button',), buckets=(0.1, 1.0))
+    counter = registry.counter('test_blocked_total', 'Blocked tests.')
+    return registry, histogram, counter
+
+
+def test_histograms_are_rendered_cumulative():
+    registry, histogram, counter = _create_registry()
+    histogram.observe(0.05, 'POWER')
+    histogram.observe(0.5, 'POWER')
+    histogram.observe(5, 'POWER')
+    counter.inc()
+    assert registry.render().split('\n') == [
+        '# HELP test_seconds Duration of a test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{button="POWER",le="0.1"} 1',
+        'test_seconds_bucket{button="POWER",le="1.0"} 2',
+        'test_seconds_bucket{button="POWER",le="+Inf"} 3',
+        'test_seconds_sum{button="POWER"} 5.55',
+        'test_seconds_count{button="POWER"} 3',
+        '# HELP test_blocked_total Blocked tests.',
+        '# TYPE test_blocked_total counter',
+        'test_blocked_total 1.0',
+        ''
+    ]
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', 'Tests.', ('route',))
+    counter.inc('a"b\\c\nd')
+    assert 'test_total{route="a\\"b\\\\c\\nd"} 1.0' in registry.render()
+
+
+def test_metrics_of_other_processes_are_added():
+    registry, histogram, counter = _create_registry()
+    counter.inc()
+    worker, worker_histogram, worker_counter = _create_registry()
+    worker_counter.inc(amount=2)
+    worker_histogram.observe(0.05, 'ECO')
+    registry.merge('4711', worker.state())
+    # Every merge replaces the previous state of the process
+    registry.merge('4711', worker.state())
+    rendered = registry.render()
+    assert 'test_blocked_total 3.0' in rendered
+    assert 'test_seconds_count{button="ECO"} 1' in rendered
+
+
+def test_metrics_endpoint_serves_the_text_format():
+    app = Flask(__name__)
+    MetricsConfig(app).configure_app()
+    app.register_blueprint(METRICS_BP)
+    client = app.test_client()
+    client.get('/metrics')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert '# TYPE coffee_machine_http_request_seconds histogram' in body
+    assert 'coffee_machine_http_request_seconds_count{endpoint="/metrics",method="GET",status="200"}' in body
+
+
+def test_other_hosts_need_an_admin_token(monkeypatch):
+    def verify_admin(token):
+        if token != 'admin':
+            raise ForbiddenResourceException('Kein Admin.')
+
+    monkeypatch.setattr(resources.metrics.TOKEN_VERIFIER, 'verify_admin', verify_admin)
+    app = Flask(__name__)
+    # Like the configurations of the app, flask_restful hands the exceptions on to the handlers
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    FlaskExceptionConfig(app).configure_app()
+    app.register_blueprint(METRICS_BP)
+    client = app.test_client()
+    remote = {'REMOTE_ADDR': '192.168.1.20'}
+    assert client.get('/metrics', environ_base=remote).status_code == 401
+    assert client.get('/metrics', environ_base=remote, headers={'x-access-token': 'user'}).status_code == 403
+    assert client.get('/metrics', environ_base=remote, headers={'x-access-token': 'admin'}).status_code == 200
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '::1'}).status_code == 200
@@ -0,0 +1,137 @@
+import os
+import stat
+
+import jwt
+
+from config.flask_config import ResourceException
+from core.outbox import JobOutbox, OutboxEntry
+from utils.auth import get_token_owner
+
+
+def _create_outbox(journal, send):
+    return JobOutbox(journal_path=journal, send=send, get_owner=get_token_owner)
+
+
+def test_tokens_are_not_journaled(tmp_path):
+    journal = tmp_path / 'job_outbox.jsonl'
+    outbox = _create_outbox(journal, send=lambda token, job: {})
+    outbox.append('secret-token', {'doses': 1})
+    assert stat.S_IMODE(os.stat(str(journal)).st_mode) == 0o600
+    assert not ('secret-token' in journal.read_text())
+
+    # After a restart the report waits for a token of its user
+    replayed = _create_outbox(journal, send=lambda token, job: {})
+    entry = list(replayed._pending.values())[0]
+    assert entry.state == OutboxEntry.AWAITING_TOKEN
+    replayed.provide_token('other-token')
+    assert entry.state == OutboxEntry.AWAITING_TOKEN
+    replayed.provide_token('secret-token')
+    assert entry.state == OutboxEntry.PENDING
+
+
+def test_rejected_token_waits_for_a_new_one(tmp_path):
+    expired_token = jwt.encode({'sub': '7', 'exp': 1}, 'key', algorithm='HS256')
+    fresh_token = jwt.encode({'sub': '7', 'exp': 4102444800}, 'key', algorithm='HS256')
+    sent = []
+
+    def send(token, job):
+        sent.append(token)
+        if token == expired_token:
+            raise ResourceException(status_code=401, message='Token ist abgelaufen.')
+        return {'id': 1}
+
+    outbox = _create_outbox(tmp_path / 'job_outbox.jsonl', send=send)
+    entry = outbox.append(expired_token, {'doses': 1})
+    assert outbox._flush(outbox._get_sendable())
+    # A 401 is no verdict on the job, the report is kept
+    assert entry.state == OutboxEntry.AWAITING_TOKEN
+    assert outbox._get_sendable() == []
+
+    outbox.provide_token(fresh_token)
+    assert outbox._flush(outbox._get_sendable())
+    assert outbox.get(entry.local_id).state == OutboxEntry.REPORTED
+    assert sent == [expired_token, fresh_token]
+
+
+def test_rejected_token_holds_back_the_later_reports_of_its_user(tmp_path):
+    expired_token = jwt.encode({'sub': '7', 'exp': 1}, 'key', algorithm='HS256')
+    fresh_token = jwt.encode({'sub': '7', 'exp': 4102444800}, 'key', algorithm='HS256')
+    other_token = jwt.encode({'sub': '8', 'exp': 4102444800}, 'key', algorithm='HS256')
+    sent = []
+
+    def send(token, job):
+        if token == expired_token:
+            raise ResourceException(status_code=401, message='Token ist abgelaufen.')
+        sent.append(job['doses'])
+        return {}
+
+    outbox = _create_outbox(tmp_path / 'job_outbox.jsonl', send=send)
+    outbox.append(expired_token, {'doses': 1})
+    outbox.append(fresh_token, {'doses': 2})
+    outbox.append(other_token, {'doses': 3})
+    # The batch ends with the rejected token, the next one only holds the report of the other user
+    assert outbox._flush(outbox._get_sendable())
+    assert sent == []
+    assert [entry.job['doses'] for entry in outbox._get_sendable()] == [3]
+    assert outbox._flush(outbox._get_sendable())
+    assert sent == [3]
+
+    outbox.provide_token(fresh_token)
+    assert outbox._flush(outbox._get_sendable())
+    assert sent == [3, 1, 2]
+    assert outbox.pending_count == 0
+
+
+def test_reports_are_replayed_until_acknowledged(tmp_path):
+    journal = tmp_path / 'job_outbox.jsonl'
+    outbox = _create_outbox(journal, send=lambda token, job: {'id': job['doses']})
+    first = outbox.append('token', {'doses': 1})
+    outbox.append('token', {'doses': 2})
+    assert outbox._flush(outbox._get_sendable()[:1])
+    assert outbox.get(first.local_id).server_job == {'id': 1}
+
+    replayed = _create_outbox(journal, send=lambda token, job: {})
+    assert replayed.pending_count == 1
+    assert [entry.job for entry in replayed._pending.values()] == [{'doses': 2}]
+
+
+def test_failing_report_blocks_the_ones_after_it(tmp_path):
+    sent = []
+
+    def send(token, job):
+        sent.append(job['doses'])
+        if job['doses'] == 1:
+            raise ResourceException(status_code=503, message='WebAPI ist nicht erreichbar.')
+        return {}
+
+    outbox = _create_outbox(tmp_path / 'job_outbox.jsonl', send=send)
+    outbox.append('token', {'doses': 1})
+    outbox.append('token', {'doses': 2})
+    assert not outbox._flush(outbox._get_sendable())
+    assert sent == [1]
+    assert outbox.pending_count == 2
+
+
+def test_rejected_reports_fail(tmp_path):
+    def send(token, job):
+        raise ResourceException(status_code=400, message='Auftrag ist ungültig.')
+
+    outbox = _create_outbox(tmp_path / 'job_outbox.jsonl', send=send)
+    entry = outbox.append('token', {'doses': 1})
+    assert outbox._flush(outbox._get_sendable())
+    entry = outbox.get(entry.local_id)
+    assert (entry.state, entry.message) == (OutboxEntry.FAILED, 'Auftrag ist ungültig.')
+    assert outbox.pending_count == 0
+
+
+def test_journal_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr('core.outbox.JOURNAL_COMPACTION_THRESHOLD', 2)
+    journal = tmp_path / 'job_outbox.jsonl'
+    outbox = _create_outbox(journal, send=lambda token, job: {})
+    for doses in (1, 2):
+        outbox.append('token', {'doses': doses})
+    outbox.append('token', {'doses': 3})
+    assert outbox._flush(outbox._get_sendable()[:2])
+    # Only the pending report is left in the journal
+    assert len(journal.read_text().splitlines()) == 1
+    assert stat.S_IMODE(os.stat(str(journal)).st_mode) == 0o600
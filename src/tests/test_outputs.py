@@ -0,0 +1,123 @@
+import pytest
+
+import core.outputs
+from core.outputs import GPIOOutputDriver, ShiftRegisterOutputDriver
+from core.simulation import SimulatedCoffeeMachine, SimulatedGPIO
+
+
+STROBE, DATA, CLOCK = 40, 41, 42
+BITS = {'ONE_DOSE': 0, 'TWO_DOSES': 1, 'POWER': 4, 'RELAIS': 6}
+IDLE = {'ONE_DOSE': True, 'TWO_DOSES': True, 'POWER': True, 'RELAIS': False}
+
+
+class _ShiftRegisterGPIO:
+    # Records the GPIO calls and emulates a 74HC4094 on them
+    BCM = 'BCM'
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self):
+        self.levels = {}
+        self.calls = []
+        self.setups = []
+        self.stage = 0
+        # Parallel outputs QP0 to QP7 after each strobe pulse
+        self.latched = []
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, gpio, direction, initial=None):
+        self.setups.append((gpio, initial))
+
+    def output(self, channel, value):
+        self.calls.append((channel, value))
+        channels, values = (channel, value) if isinstance(channel, list) else ([channel], [value])
+        for gpio, level in zip(channels, values):
+            rising = level and not self.levels.get(gpio, 0)
+            self.levels[gpio] = level
+            if gpio == CLOCK and rising:
+                if self.levels.get(STROBE):
+                    raise AssertionError('Shifted while the strobe was HIGH')
+                # QP0 takes the data input, the others take the output before them
+                self.stage = ((self.stage << 1) | self.levels.get(DATA, 0)) & 0xFF
+            elif gpio == STROBE and rising:
+                self.latched.append(self.stage)
+
+
+@pytest.fixture
+def gpio(monkeypatch):
+    gpio = _ShiftRegisterGPIO()
+    monkeypatch.setattr(core.outputs, 'GPIO', gpio)
+    return gpio
+
+
+def _shift_register_driver() -> ShiftRegisterOutputDriver:
+    return ShiftRegisterOutputDriver(strobe_gpio=STROBE, data_gpio=DATA, clock_gpio=CLOCK, bits=BITS, idle=IDLE)
+
+
+def test_frames_put_every_output_on_its_parallel_output(gpio):
+    driver = _shift_register_driver()
+    driver.commit()
+    # QP0, QP1 and QP4 idle HIGH, the relais on QP6 idles LOW
+    assert gpio.latched == [0b00010011]
+    assert sorted(gpio.setups) == [(STROBE, gpio.LOW), (DATA, gpio.LOW), (CLOCK, gpio.LOW)]
+
+    driver.apply({'RELAIS': True, 'POWER': False})
+    assert gpio.latched[-1] == 0b01000011
+    assert driver.frame({'ONE_DOSE': False, 'TWO_DOSES': False, 'POWER': False, 'RELAIS': True}) == 1 << 6
+    assert (driver.value('RELAIS'), driver.value('POWER')) == (True, False)
+
+
+def test_a_commit_latches_once(gpio):
+    driver = _shift_register_driver()
+    driver.stage('RELAIS', True)
+    driver.stage('ONE_DOSE', False)
+    assert gpio.latched == []
+    driver.commit()
+    assert gpio.latched == [0b01010010]
+    assert driver.frames == 1
+    # Unchanged values are not shifted out again
+    driver.commit()
+    driver.apply({'RELAIS': True})
+    assert driver.frames == 1
+    # A reset writes the idle frame also if the driver believes the hardware holds it
+    driver.reset()
+    driver.reset()
+    assert gpio.latched[1:] == [0b00010011, 0b00010011]
+
+
+def test_unknown_outputs_are_rejected(gpio):
+    driver = _shift_register_driver()
+    with pytest.raises(ValueError):
+        driver.stage('STEAM', True)
+
+
+def test_gpio_driver_writes_the_changed_pins_in_one_call(gpio):
+    pins = {'ONE_DOSE': 17, 'POWER': 22, 'RELAIS': 21}
+    driver = GPIOOutputDriver(pins=pins, idle={'ONE_DOSE': True, 'POWER': True, 'RELAIS': False})
+    assert driver.pins() == {17: True, 22: True, 21: False}
+    driver.commit()
+    assert gpio.calls == [([17, 22, 21], [gpio.HIGH, gpio.HIGH, gpio.LOW])]
+    gpio.calls.clear()
+    driver.apply({'RELAIS': True, 'POWER': False, 'ONE_DOSE': True})
+    assert gpio.calls == [([22, 21], [gpio.LOW, gpio.HIGH])]
+    # Released pins are written again by the next commit
+    gpio.calls.clear()
+    driver.release()
+    assert driver.value('RELAIS') is False
+    driver.commit()
+    assert gpio.calls == [([17, 22, 21], [gpio.HIGH, gpio.HIGH, gpio.LOW])]
+
+
+def test_simulated_shift_register_drives_the_outputs(monkeypatch):
+    machine = SimulatedCoffeeMachine(time_scale=1)
+    out_pins = {'ONE_DOSE': 17, 'TWO_DOSES': 18, 'POWER': 22, 'RELAIS': 21}
+    machine.configure(in_pins={}, out_pins=out_pins, dac_addresses={}, shift_register={'strobe': STROBE, 'data': DATA, 'clock': CLOCK, 'bits': BITS})
+    simulated_gpio = SimulatedGPIO(machine)
+    monkeypatch.setattr(core.outputs, 'GPIO', simulated_gpio)
+    driver = _shift_register_driver()
+    driver.apply({'RELAIS': True, 'TWO_DOSES': False})
+    assert {name: machine._outputs.get(pin) for name, pin in out_pins.items()} == {'ONE_DOSE': True, 'TWO_DOSES': False, 'POWER': True, 'RELAIS': True}
+    simulated_gpio.cleanup()
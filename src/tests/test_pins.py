@@ -0,0 +1,36 @@
+import pytest
+
+from core.hardware import GPIO
+from core.pins import PinConfiguration, PIN_CONFIGURATION, setup_inputs
+
+
+# Pins the app does not use
+IN_PIN = 2
+OUT_PIN = 3
+
+
+def test_pins_are_configured_once_and_released():
+    pins = PinConfiguration()
+    assert not pins.is_configured()
+    pins.configure(in_pins=[IN_PIN], out_pins={OUT_PIN: True})
+    assert pins.is_configured()
+    assert pins.are_inputs([IN_PIN]) and not pins.are_inputs([IN_PIN, OUT_PIN])
+    assert pins.is_output(OUT_PIN) and not pins.is_output(IN_PIN)
+    GPIO.output(OUT_PIN, GPIO.LOW)
+
+    pins.release()
+    assert not pins.is_configured()
+    with pytest.raises(RuntimeError):
+        GPIO.output(OUT_PIN, GPIO.HIGH)
+
+
+def test_configured_pins_are_not_set_up_again():
+    PIN_CONFIGURATION.configure(in_pins=[IN_PIN], out_pins={OUT_PIN: True})
+    try:
+        assert not setup_inputs([IN_PIN])
+    finally:
+        PIN_CONFIGURATION.release()
+    # Other pins are set up on every use and cleaned up by callers without a session
+    assert setup_inputs([IN_PIN])
+    assert not setup_inputs([IN_PIN], session=object())
+    GPIO.cleanup([IN_PIN])
@@ -0,0 +1,77 @@
+import time
+
+from flask import Flask
+
+from config.flask_config import ProfilingConfig, PROFILE_HEADER
+from utils.profiling import RequestProfiler, add_spans, format_server_timing, recording, span, PROFILE_SUFFIX, SUMMARY_SUFFIX
+
+
+def test_spans_are_only_recorded_while_recording():
+    with span('status'):
+        pass
+    with recording() as recorder:
+        with span('status'):
+            time.sleep(0.01)
+        add_spans([('press', 0.5)], prefix='brew-')
+        with recording() as inner:
+            with span('dac'):
+                pass
+    assert [name for name, duration in recorder.spans] == ['status', 'brew-press']
+    assert recorder.spans[0][1] >= 0.01
+    assert [name for name, duration in inner.spans] == ['dac']
+
+
+def test_server_timing_sums_up_repeated_steps():
+    header = format_server_timing([('auth', 0.002), ('press', 0.25), ('press', 0.5), ('total', 0.8)])
+    assert header == 'auth;dur=2.0, press;dur=750.0;desc="2x", total;dur=800.0'
+
+
+def test_profiler_keeps_the_latest_captures(tmp_path):
+    profiler = RequestProfiler(directory=tmp_path, max_files=2)
+    names = []
+    for _ in range(3):
+        profile = profiler.start()
+        # Only one capture at a time
+        assert profiler.start() is None
+        sum(range(1000))
+        names.append(profiler.stop(profile, 'GET /device/status'))
+        time.sleep(0.002)
+    listed = [entry['name'] for entry in profiler.list()]
+    assert sorted(listed) == sorted([name + suffix for name in names[1:] for suffix in (PROFILE_SUFFIX, SUMMARY_SUFFIX)])
+    assert not (profiler.path(names[-1] + PROFILE_SUFFIX) is None)
+    # Only files of the listing are served
+    assert profiler.path('../' + names[-1] + PROFILE_SUFFIX) is None
+    assert profiler.path(names[0] + PROFILE_SUFFIX) is None
+
+
+def _create_app(tmp_path, server_timing: bool) -> Flask:
+    app = Flask(__name__)
+    config = ProfilingConfig(app, profiler=RequestProfiler(directory=tmp_path, max_files=5), is_admin=lambda token: token == 'admin')
+    config.server_timing = server_timing
+    config.sample_rate = 0
+    config.configure_app()
+
+    @app.route('/status')
+    def status():
+        with span('status'):
+            pass
+        return 'ok'
+    return app
+
+
+def test_server_timing_header(tmp_path):
+    client = _create_app(tmp_path, server_timing=True).test_client()
+    response = client.get('/status')
+    assert response.headers['Server-Timing'].startswith('status;dur=')
+    assert 'total;dur=' in response.headers['Server-Timing']
+    assert not ('X-Profile-Name' in response.headers)
+
+
+def test_only_admins_profile_requests(tmp_path):
+    client = _create_app(tmp_path, server_timing=False).test_client()
+    assert not ('Server-Timing' in client.get('/status').headers)
+    response = client.get('/status', headers={PROFILE_HEADER: '1', 'x-access-token': 'user'})
+    assert not ('X-Profile-Name' in response.headers)
+    response = client.get('/status', headers={PROFILE_HEADER: '1', 'x-access-token': 'admin'})
+    assert (tmp_path / response.headers['X-Profile-Name']).is_file()
+    assert 'Server-Timing' in response.headers
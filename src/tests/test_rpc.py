@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from config.flask_config import ResourceException
+from core.rpc import HardwareClient, HardwareServer, RemoteController, StatusMirror
+from core.snapshot import StatusCache, StatusDemand
+from models import DeviceStatus
+
+
+AUTHKEY = b'test-authkey'
+
+
+class _Controller:
+    def brew(self, doses: int, water_in_percent: int = 50) -> dict:
+        return {'doses': doses, 'water_in_percent': water_in_percent}
+
+    def reject(self):
+        raise ResourceException(status_code=405, message='Kaffeemaschine ist nicht bereit.')
+
+    def fail(self):
+        raise RuntimeError('GPIO nicht lesbar')
+
+    def _private(self):
+        return 'secret'
+
+
+@pytest.fixture
+def server():
+    # Unix socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp(prefix='hw-')
+    socket_path = os.path.join(directory, 'hardware.sock')
+    cache = StatusCache()
+    demand = StatusDemand(idle_time=60)
+    server = HardwareServer(
+        socket_path=socket_path,
+        authkey=AUTHKEY,
+        services={'job': _Controller(), 'StatusDemand': demand},
+        refresh_status=lambda: None,
+        status_cache=cache,
+        push_interval=0.05
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    server.socket_path = socket_path
+    server.cache = cache
+    server.demand = demand
+    yield server
+    server.close()
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def test_controller_calls_round_trip(server):
+    controller = RemoteController('job', HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY))
+    assert controller.brew(2, water_in_percent=70) == {'doses': 2, 'water_in_percent': 70}
+    # The connection of the thread is reused
+    assert controller.brew(1) == {'doses': 1, 'water_in_percent': 50}
+
+
+def test_errors_are_raised_in_the_worker(server):
+    controller = RemoteController('job', HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY))
+    with pytest.raises(ResourceException) as err:
+        controller.reject()
+    assert (err.value.status_code, err.value.message) == (405, 'Kaffeemaschine ist nicht bereit.')
+    with pytest.raises(ResourceException) as err:
+        controller.fail()
+    assert err.value.status_code == 500
+    with pytest.raises(ResourceException) as err:
+        RemoteController('settings', controller._client).brew(1)
+    assert err.value.status_code == 501
+    # Private methods are neither proxied nor served
+    with pytest.raises(AttributeError):
+        controller._private()
+    client = HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY)
+    with pytest.raises(ResourceException) as err:
+        client.call('job', '_private')
+    assert err.value.status_code == 501
+
+
+def test_unknown_authkey_is_rejected(server):
+    client = HardwareClient(socket_path=server.socket_path, authkey=b'wrong')
+    with pytest.raises(ResourceException) as err:
+        client.call('job', 'brew', 1)
+    assert err.value.status_code == 503
+
+
+def test_status_snapshots_are_mirrored(server):
+    status = DeviceStatus()
+    status.device_ready = True
+    published = server.cache.publish(status)
+    mirror = StatusMirror(connect=HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY).connect, max_age=1)
+    mirror.start()
+    snapshot = mirror.get_status_snapshot()
+    assert snapshot.version == published.version
+    assert snapshot.status.device_ready
+
+    status.device_ready = False
+    changed = server.cache.publish(status)
+    snapshot = mirror.wait_for_snapshot(version=published.version, timeout=2)
+    assert snapshot.version == changed.version
+    assert not snapshot.status.device_ready
+
+
+def test_status_reads_pass_the_demand_on(server):
+    server.cache.publish(DeviceStatus())
+    client = HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY)
+    touches = []
+
+    def touch():
+        touches.append(1)
+        client.call('StatusDemand', 'touch')
+
+    mirror = StatusMirror(connect=client.connect, max_age=1, touch=touch)
+    mirror.start()
+    assert not server.demand.is_active()
+    mirror.get_status_snapshot()
+    assert server.demand.is_active()
+    # Further reads within STATUS_DEMAND_INTERVAL stay in the worker
+    mirror.get_status_snapshot()
+    mirror.wait_for_snapshot(version=0, timeout=1)
+    assert touches == [1]
+
+
+def test_status_reads_work_without_the_demand_reaching_the_owner(server):
+    server.cache.publish(DeviceStatus())
+
+    def touch():
+        raise ResourceException(status_code=503, message='Kaffeemaschine ist nicht erreichbar.')
+
+    mirror = StatusMirror(connect=HardwareClient(socket_path=server.socket_path, authkey=AUTHKEY).connect, max_age=1, touch=touch)
+    mirror.start()
+    assert mirror.get_status_snapshot().version == 1
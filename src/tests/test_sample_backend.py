@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from core.gpio import InterleavedGPIOSampler
+from core.sample_backend import PythonSampleBackend, load_sample_backend
+
+
+class _ReplayBackend:
+    # Sample backend that replays recorded pass masks
+    name = 'replay'
+
+    def __init__(self, masks):
+        self._masks = masks
+
+    def sample(self, gpio_numbers, masks, timestamps, session = None):
+        masks[:] = self._masks
+        timestamps[:] = np.arange(len(self._masks), dtype=np.uint64)
+
+
+def test_missing_native_library_falls_back_to_python(tmp_path):
+    backend = load_sample_backend(name='native', library_path=str(tmp_path / 'libreadgpio.so'))
+    assert isinstance(backend, PythonSampleBackend)
+    with pytest.raises(ValueError):
+        load_sample_backend(name='unknown')
+
+
+def test_sample_buffers_are_checked():
+    backend = PythonSampleBackend()
+    with pytest.raises(ValueError):
+        backend.sample(gpio_numbers=[5], masks=np.zeros(4, dtype=np.int64), timestamps=np.zeros(4, dtype=np.uint64))
+    with pytest.raises(ValueError):
+        backend.sample(gpio_numbers=[5], masks=np.zeros(4, dtype=np.uint32), timestamps=np.zeros(3, dtype=np.uint64))
+    with pytest.raises(ValueError):
+        backend.sample(gpio_numbers=list(range(33)), masks=np.zeros(4, dtype=np.uint32), timestamps=np.zeros(4, dtype=np.uint64))
+
+
+def test_sampler_unpacks_the_pass_masks():
+    # Bit i of a pass mask is the level of the i-th pin
+    backend = _ReplayBackend(masks=np.array([0b01, 0b11, 0b01, 0b00], dtype=np.uint32))
+    sampler = InterleavedGPIOSampler(gpio_numbers=[5, 6], passes=4, backend=backend)
+    sampler.sample()
+    assert sampler.samples.tolist() == [[1, 0], [1, 1], [1, 0], [0, 0]]
+    snapshot = sampler.read(check_cycles=2)
+    # Pin 6 is HIGH in one of the two check cycles
+    assert (snapshot.values, snapshot.known, snapshot.uncertain) == (0b11, 0b11, 0b10)
@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from core.exceptions import DeviceBlockedException
+from core.session import SessionState, SessionSupervisor
+from core.snapshot import StatusCache
+from models import DeviceStatus
+
+
+class _Machine:
+    # Relay and ready LED of a machine, refresh publishes its status like the status sampler
+    def __init__(self, cache: StatusCache):
+        self.cache = cache
+        self.relay_closed = False
+        self.device_ready = False
+        self.relay_calls = []
+
+    def open_relay(self):
+        self.relay_calls.append('open')
+        self.relay_closed = True
+
+    def close_relay(self):
+        self.relay_calls.append('close')
+        self.relay_closed = False
+
+    def refresh(self):
+        status = DeviceStatus()
+        status.device_ready = self.device_ready
+        self.cache.publish(status)
+
+
+def _create_supervisor(machine: _Machine, max_release_wait: float = 2) -> SessionSupervisor:
+    return SessionSupervisor(
+        open_relay=machine.open_relay,
+        close_relay=machine.close_relay,
+        refresh_status=machine.refresh,
+        status_cache=machine.cache,
+        refresh_interval=0.01,
+        ready_stable_time=0.05,
+        max_release_wait=max_release_wait
+    )
+
+
+def _wait_for_state(supervisor: SessionSupervisor, state: str, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while supervisor.state != state and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert supervisor.state == state
+
+
+def test_session_is_released_once_the_machine_is_ready():
+    machine = _Machine(StatusCache())
+    supervisor = _create_supervisor(machine)
+    owner = object()
+    supervisor.acquire(owner)
+    assert (supervisor.state, machine.relay_closed) == (SessionState.ACTIVE, True)
+    with pytest.raises(DeviceBlockedException):
+        supervisor.acquire(object())
+
+    supervisor.release(owner)
+    assert supervisor.state == SessionState.RELEASING
+    # The relay stays closed while the machine is busy
+    time.sleep(0.1)
+    assert (supervisor.state, machine.relay_closed) == (SessionState.RELEASING, True)
+    with pytest.raises(DeviceBlockedException):
+        supervisor.acquire(object())
+
+    machine.device_ready = True
+    _wait_for_state(supervisor, SessionState.IDLE)
+    assert machine.relay_calls == ['open', 'close']
+    assert supervisor.info()['releases_on_ready'] == 1
+
+
+def test_session_is_released_after_the_timeout():
+    machine = _Machine(StatusCache())
+    supervisor = _create_supervisor(machine, max_release_wait=0.1)
+    owner = object()
+    supervisor.acquire(owner)
+    supervisor.release(owner)
+    _wait_for_state(supervisor, SessionState.IDLE)
+    assert not machine.relay_closed
+    info = supervisor.info()
+    assert (info['releases_on_ready'], info['releases_on_timeout']) == (0, 1)
+
+
+def test_only_the_owner_releases_the_session():
+    machine = _Machine(StatusCache())
+    supervisor = _create_supervisor(machine)
+    owner = object()
+    supervisor.acquire(owner)
+    supervisor.release(object())
+    assert supervisor.state == SessionState.ACTIVE
+    supervisor.release(owner)
+    machine.device_ready = True
+    _wait_for_state(supervisor, SessionState.IDLE)
+    # The next caller gets the session
+    supervisor.acquire(owner)
+    assert supervisor.info()['sessions_opened'] == 2
+
+
+def test_failing_relay_leaves_the_session_idle():
+    machine = _Machine(StatusCache())
+
+    def open_relay():
+        raise OSError('Relais nicht erreichbar')
+
+    machine.open_relay = open_relay
+    supervisor = _create_supervisor(machine)
+    with pytest.raises(OSError):
+        supervisor.acquire(object())
+    assert supervisor.is_idle()
@@ -0,0 +1,70 @@
+import json
+import os
+import stat
+
+from core import CoffeeMachineHardwareAPI
+from models import DeviceSettings
+from utils.files import atomic_write
+
+
+def _create_api(path) -> CoffeeMachineHardwareAPI:
+    api = CoffeeMachineHardwareAPI()
+    api.file_path = path
+    return api
+
+
+def test_missing_settings_are_initialized(tmp_path):
+    path = tmp_path / 'coffee_machine_settings.json'
+    api = _create_api(path)
+    assert api.settings.price == -1
+    assert json.loads(path.read_text())['price'] == -1
+
+
+def test_settings_are_cached_until_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr('core.SETTINGS_CHECK_INTERVAL', 0)
+    path = tmp_path / 'coffee_machine_settings.json'
+    api = _create_api(path)
+    api.settings = DeviceSettings(price=50)
+    reads = []
+    real_open = open
+    monkeypatch.setattr('builtins.open', lambda *args, **kwargs: reads.append(args[0]) or real_open(*args, **kwargs))
+    assert api.settings.price == 50
+    assert reads == []
+
+    # External edits are picked up by their new stamp
+    path.write_text(json.dumps({'coffee_machine_id': 1, 'coffee_product_id': 2, 'price': 120}))
+    assert api.settings.price == 120
+    assert reads == [path]
+
+
+def test_settings_are_checked_once_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr('core.SETTINGS_CHECK_INTERVAL', 60)
+    path = tmp_path / 'coffee_machine_settings.json'
+    api = _create_api(path)
+    api.settings = DeviceSettings(price=50)
+    path.write_text(json.dumps({'price': 120}))
+    assert api.settings.price == 50
+    api.read_settings(force=True)
+    assert api.settings.price == 120
+
+
+def test_callers_get_a_copy_of_the_settings(tmp_path):
+    api = _create_api(tmp_path / 'coffee_machine_settings.json')
+    api.settings = DeviceSettings(price=50)
+    settings = api.settings
+    settings.price = 0
+    assert api.settings.price == 50
+
+
+def test_atomic_write_keeps_the_file_mode(tmp_path):
+    path = tmp_path / 'settings.json'
+    atomic_write(path, 'first')
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o644
+    os.chmod(str(path), 0o600)
+    atomic_write(path, 'second')
+    assert path.read_text() == 'second'
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o600
+    atomic_write(path, 'third', mode=0o640)
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o640
+    # No temporary files are left behind
+    assert [p.name for p in tmp_path.iterdir()] == ['settings.json']
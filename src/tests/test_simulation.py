@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from core.simulation import SimulatedCoffeeMachine, SimulatedGPIO, SimulatedI2CMessage, SimulatedSMBus
+
+
+IN_PINS = {'ONE_DOSE': 5, 'TWO_DOSES': 6, 'WATER': 13, 'ECO': 19}
+OUT_PINS = {'POWER': 17, 'ECO': 27, 'ONE_DOSE': 22, 'RELAIS': 21}
+DAC_ADDRESSES = {'WATER': 0x60}
+
+
+@pytest.fixture
+def machine():
+    # 1/100 of the real durations: startup in 0.2 s, a dose in 0.25 s
+    machine = SimulatedCoffeeMachine(time_scale=0.01)
+    machine.configure(in_pins=IN_PINS, out_pins=OUT_PINS, dac_addresses=DAC_ADDRESSES)
+    return machine
+
+
+def _press(gpio: SimulatedGPIO, name: str):
+    gpio.output(OUT_PINS[name], gpio.LOW)
+    time.sleep(0.01)
+    gpio.output(OUT_PINS[name], gpio.HIGH)
+
+
+def _wait_for(predicate, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_buttons_need_the_relais(machine):
+    gpio = SimulatedGPIO(machine)
+    gpio.setmode(gpio.BCM)
+    gpio.setup(list(IN_PINS.values()), gpio.IN, pull_up_down=gpio.PUD_DOWN)
+    gpio.setup(list(OUT_PINS.values()), gpio.OUT, initial=gpio.HIGH)
+    gpio.output(OUT_PINS['RELAIS'], gpio.LOW)
+    _press(gpio, 'POWER')
+    assert machine.runtime_state == SimulatedCoffeeMachine.OFF
+
+    gpio.output(OUT_PINS['RELAIS'], gpio.HIGH)
+    _press(gpio, 'POWER')
+    assert machine.runtime_state == SimulatedCoffeeMachine.STARTUP
+    assert _wait_for(lambda: machine.runtime_state == SimulatedCoffeeMachine.ON)
+    # Both dose LEDs are on once the machine is ready
+    assert gpio.input(IN_PINS['ONE_DOSE']) == gpio.HIGH and gpio.input(IN_PINS['TWO_DOSES']) == gpio.HIGH
+
+
+def test_brewing_uses_water_and_blinks_the_dose_led(machine):
+    gpio = SimulatedGPIO(machine)
+    gpio.setmode(gpio.BCM)
+    gpio.setup(list(IN_PINS.values()), gpio.IN, pull_up_down=gpio.PUD_DOWN)
+    gpio.setup(list(OUT_PINS.values()), gpio.OUT, initial=gpio.HIGH)
+    _press(gpio, 'POWER')
+    assert _wait_for(lambda: machine.runtime_state == SimulatedCoffeeMachine.ON)
+
+    _press(gpio, 'ONE_DOSE')
+    assert machine.is_brewing
+    assert machine.water_level == 100 - SimulatedCoffeeMachine.WATER_PER_DOSE
+    # The other dose LED is off while brewing
+    assert gpio.input(IN_PINS['TWO_DOSES']) == gpio.LOW
+    assert _wait_for(lambda: not machine.is_brewing)
+
+
+def test_dac_registers_are_read_back(machine):
+    bus = SimulatedSMBus(machine, 1)
+    value = 0xABC
+    bus.write_i2c_block_data(0x60, SimulatedSMBus.REG_WRITE_DAC, [value >> 4, (value & 0xF) << 4])
+    data = bus.read_i2c_block_data(0x60, 0x00, 3)
+    assert (data[1] << 4) | (data[2] >> 4) == value
+    # Plain reads get the status byte and the DAC register as well
+    message = SimulatedI2CMessage.read(0x60, 3)
+    bus.i2c_rdwr(message)
+    assert list(message) == data
+    # Unknown addresses do not acknowledge
+    with pytest.raises(OSError):
+        bus.write_i2c_block_data(0x62, SimulatedSMBus.REG_WRITE_DAC, [0, 0])
@@ -0,0 +1,145 @@
+import threading
+import time
+
+from core.snapshot import StatusCache, StatusDemand, StatusSampler
+from models import DeviceStatus
+
+
+def _status(device_ready: bool) -> DeviceStatus:
+    status = DeviceStatus()
+    status.device_ready = device_ready
+    return status
+
+
+def test_snapshots_are_versioned_and_expire():
+    cache = StatusCache()
+    assert cache.get(max_age=1) is None
+    first = cache.publish(_status(False))
+    second = cache.publish(_status(False))
+    third = cache.publish(_status(True))
+    # The version only moves when the status changed
+    assert (first.version, second.version, third.version) == (1, 1, 2)
+    assert cache.get(max_age=1) is third
+    time.sleep(0.05)
+    assert cache.get(max_age=0.01) is None
+
+
+def test_waiting_for_a_version_times_out():
+    cache = StatusCache()
+    snapshot = cache.publish(_status(False))
+    started = time.monotonic()
+    assert cache.wait_for_version(version=snapshot.version, timeout=0.05) is snapshot
+    assert time.monotonic() - started >= 0.05
+
+
+def test_waiting_for_a_version_ends_with_the_change():
+    cache = StatusCache()
+    snapshot = cache.publish(_status(False))
+    # Publishing the same status wakes up waiters, but does not end the wait
+    publisher = threading.Timer(0.05, lambda: [cache.publish(_status(False)), cache.publish(_status(True))])
+    publisher.start()
+    changed = cache.wait_for_version(version=snapshot.version, timeout=2)
+    publisher.join()
+    assert changed.version == snapshot.version + 1
+    assert changed.status.device_ready
+
+
+def test_snapshot_status_is_a_copy():
+    cache = StatusCache()
+    status = DeviceStatus()
+    status.device_ready = True
+    snapshot = cache.publish(status)
+    # Neither the published status nor the returned copies change the snapshot
+    status.device_ready = False
+    copy = snapshot.status
+    copy.device_ready = False
+    assert snapshot.status.device_ready
+
+
+def test_snapshot_warnings_are_copied():
+    cache = StatusCache()
+    status = DeviceStatus()
+    status.device_warnings = ['warning']
+    snapshot = cache.publish(status)
+    status.device_warnings.append('error')
+    snapshot.status.device_warnings.append('error')
+    assert snapshot.status.device_warnings == ['warning']
+    assert snapshot.to_dict()['device_warnings'] == ['warning']
+
+
+def test_sampler_publishes_until_stopped():
+    cache = StatusCache()
+    reads = []
+    read = threading.Event()
+
+    def read_status():
+        reads.append(time.monotonic())
+        if len(reads) >= 3:
+            read.set()
+        return DeviceStatus()
+
+    sampler = StatusSampler(read_status=read_status, cache=cache, interval=0.01)
+    sampler.start()
+    assert read.wait(timeout=2)
+    sampler.stop()
+    assert not sampler.is_running()
+    count = len(reads)
+    snapshot = cache.snapshot
+    time.sleep(0.05)
+    assert len(reads) == count
+    assert cache.snapshot is snapshot
+
+
+def test_sampler_survives_failing_reads():
+    cache = StatusCache()
+    calls = []
+    read = threading.Event()
+
+    def read_status():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError('GPIO nicht lesbar')
+        read.set()
+        return DeviceStatus()
+
+    sampler = StatusSampler(read_status=read_status, cache=cache, interval=0.01)
+    sampler.start()
+    assert read.wait(timeout=2)
+    sampler.stop()
+    assert cache.snapshot.version >= 1
+
+
+def test_demand_expires_after_the_idle_time():
+    demand = StatusDemand(idle_time=0.05)
+    assert not demand.is_active()
+    assert not demand.wait(timeout=0.01)
+    demand.touch()
+    assert demand.is_active() and demand.wait()
+    time.sleep(0.1)
+    assert not demand.is_active()
+
+
+def test_sampler_pauses_without_demand():
+    cache = StatusCache()
+    demand = StatusDemand(idle_time=0.1)
+    reads = []
+    sampler = StatusSampler(read_status=lambda: reads.append(1) or DeviceStatus(), cache=cache, interval=0.01, demand=demand)
+    sampler.start()
+    try:
+        time.sleep(0.05)
+        assert reads == []
+        demand.touch()
+        time.sleep(0.05)
+        assert len(reads) > 0
+        # Nobody asked again, the sampler pauses after the idle time
+        time.sleep(0.15)
+        count = len(reads)
+        time.sleep(0.05)
+        assert len(reads) == count
+        assert sampler.is_running()
+    finally:
+        started = time.monotonic()
+        sampler.stop()
+    # Stopping wakes the paused sampler up
+    assert time.monotonic() - started < 0.5
+    assert not sampler.is_running()
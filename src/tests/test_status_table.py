@@ -0,0 +1,81 @@
+import pytest
+
+from core import CM_API, GPIO_IN_PINS, LED_FALLBACK_MASK, LED_GPIOS, LED_NAMES, STATUS_TABLE
+from core.gpio import GPIOSnapshot
+from models import DeviceRuntimeState, DeviceWarning
+
+
+# Fallback values of the per-LED reads the table replaced
+_FALLBACKS = {
+    'WATER': True,
+    'COFFEE_GROUNDS_CONTAINER': True,
+    'ONE_DOSE': False,
+    'TWO_DOSES': False,
+    'WARNING': True,
+    'STEAM': False,
+    'MAINTENANCE': True,
+    'ECO': False
+}
+
+
+def _reference_status(reads: dict) -> tuple:
+    # The status rules of the per-LED reads, reads: GPIO => value of the reliably read GPIOs
+    led = {name: reads.get(gpio, _FALLBACKS[name]) for name, gpio in GPIO_IN_PINS.items()}
+    water_tank_ready = led['WATER'] is False
+    coffee_grounds_container_ready = led['COFFEE_GROUNDS_CONTAINER'] is False
+    is_on = led['ONE_DOSE'] and led['TWO_DOSES']
+    runtime_state = DeviceRuntimeState.ON if is_on else DeviceRuntimeState.OFF
+    warnings = []
+    if led['WATER']:
+        warnings.append(DeviceWarning.WATER_TANK_EMPTY)
+    if led['COFFEE_GROUNDS_CONTAINER']:
+        warnings.append(DeviceWarning.COFFEE_GROUNDS_CONTAINER_FULL)
+    if led['WARNING']:
+        warnings.append(DeviceWarning.WARNING)
+    return (
+        water_tank_ready,
+        coffee_grounds_container_ready,
+        led['ECO'],
+        led['MAINTENANCE'],
+        led['STEAM'],
+        runtime_state.state_id,
+        water_tank_ready and coffee_grounds_container_ready and is_on,
+        warnings
+    )
+
+
+def _table_status(leds: int) -> tuple:
+    status = STATUS_TABLE[leds]
+    return (
+        status.water_tank_ready,
+        status.coffee_grounds_container_ready,
+        status.device_eco_mode,
+        status.device_maintenance,
+        status.device_steam,
+        status.coffee_machine_runtime_state,
+        status.device_ready,
+        status.device_warnings
+    )
+
+
+def test_table_matches_the_per_led_rules():
+    assert len(STATUS_TABLE) == 256
+    for leds in range(256):
+        reads = {gpio: bool(leds & (1 << bit)) for bit, gpio in enumerate(LED_GPIOS)}
+        assert _table_status(leds) == _reference_status(reads), hex(leds)
+
+
+@pytest.mark.parametrize('missing', [None] + LED_NAMES)
+def test_unreliable_leds_fall_back_like_the_per_led_rules(missing):
+    # All LEDs read reliably, or all but one
+    known = 0xff if missing is None else 0xff & ~(1 << LED_NAMES.index(missing))
+    for values in range(256):
+        snapshot = GPIOSnapshot(values=values & known, known=known, time_in_milli=0)
+        reads = {gpio: bool(values & (1 << bit)) for bit, gpio in enumerate(LED_GPIOS) if known & (1 << bit)}
+        assert _table_status(CM_API._resolve_leds(snapshot)) == _reference_status(reads), hex(values)
+
+
+def test_nothing_read_is_the_fallback_status():
+    snapshot = GPIOSnapshot(values=0, known=0, time_in_milli=0)
+    assert CM_API._resolve_leds(snapshot) == LED_FALLBACK_MASK
+    assert _table_status(LED_FALLBACK_MASK) == _reference_status({})
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+import core.gpio
+import core.outputs
+import core.pins
+from core import CM_API
+from core.gpio import press_output
+from core.outputs import GPIOOutputDriver
+from core.simulation import SimulatedCoffeeMachine, SimulatedGPIO
+from core.timing import ActionTiming, TimingCalibration, TIMING_MIN_SAMPLES
+
+
+IN_PINS = {'ONE_DOSE': 5, 'TWO_DOSES': 6}
+OUT_PINS = {'POWER': 17, 'RELAIS': 21}
+
+
+@pytest.fixture
+def gpio():
+    # A machine of its own, the status sampler of the app must not read it while it is swapped in
+    machine = SimulatedCoffeeMachine(time_scale=1)
+    machine.configure(in_pins=IN_PINS, out_pins=OUT_PINS, dac_addresses={})
+    gpio = SimulatedGPIO(machine)
+    gpio.machine = machine
+    gpio.setmode(gpio.BCM)
+    gpio.setup(list(OUT_PINS.values()), gpio.OUT, initial=gpio.HIGH)
+    with CM_API.hardware_lock, pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(core.gpio, 'GPIO', gpio)
+        monkeypatch.setattr(core.pins, 'GPIO', gpio)
+        monkeypatch.setattr(core.outputs, 'GPIO', gpio)
+        yield gpio
+
+
+def _create_outputs(relais: bool) -> GPIOOutputDriver:
+    # The button idles HIGH, the relais is held at the given value
+    return GPIOOutputDriver(pins=OUT_PINS, idle={'POWER': True, 'RELAIS': relais})
+
+
+def _create_calibration(tmp_path) -> TimingCalibration:
+    return TimingCalibration(file_path=tmp_path / 'timing.json', button_press_duration=2, button_press_min_duration=0.25, i2c_delay=0.05)
+
+
+def test_estimator_follows_the_latency():
+    timing = ActionTiming()
+    timing.record(0.2)
+    assert (timing.latency, timing.deviation) == (0.2, 0.1)
+    timing.record(0.4)
+    assert timing.latency == pytest.approx(0.875 * 0.2 + 0.125 * 0.4)
+    assert timing.deviation == pytest.approx(0.75 * 0.1 + 0.25 * 0.2)
+
+
+def test_upper_bound_is_used_until_calibrated(tmp_path):
+    calibration = _create_calibration(tmp_path)
+    for _ in range(TIMING_MIN_SAMPLES - 1):
+        calibration.record_press('POWER', 0.5)
+    assert calibration.press_timeout('POWER') == 2
+    assert calibration.press_min_duration('POWER') == 0.25
+    calibration.record_press('POWER', 0.5)
+    # The deviation decays with every matching sample
+    timing = calibration.button_timing('POWER')
+    assert calibration.press_timeout('POWER') == pytest.approx(0.5 + 4 * timing.deviation)
+    assert calibration.press_min_duration('POWER') == 0.25
+    # Unacknowledged presses are counted and do not change the estimate
+    calibration.record_press('POWER', None)
+    assert calibration.button_timing('POWER').misses == 1
+    assert calibration.button_timing('POWER').latency == 0.5
+
+
+def test_timeouts_stay_within_the_bounds(tmp_path):
+    calibration = _create_calibration(tmp_path)
+    for _ in range(TIMING_MIN_SAMPLES):
+        calibration.record_press('POWER', 10)
+        calibration.record_dac_write(0.0001)
+    assert calibration.press_timeout('POWER') == 2
+    assert calibration.press_min_duration('POWER') == 2
+    assert calibration.dac_timeout() == pytest.approx(0.005)
+
+
+def test_calibration_is_persisted(tmp_path):
+    calibration = _create_calibration(tmp_path)
+    calibration.record_press('ONE_DOSE', 0.3)
+    calibration.record_dac_write(0.01)
+    calibration.flush()
+    loaded = _create_calibration(tmp_path)
+    assert loaded.button_names() == ['ONE_DOSE']
+    assert loaded.button_timing('ONE_DOSE').latency == 0.3
+    assert loaded.dac_timing().samples == 1
+    loaded.reset()
+    assert _create_calibration(tmp_path).button_names() == []
+
+
+def test_saves_are_spaced_out(tmp_path, monkeypatch):
+    calibration = _create_calibration(tmp_path)
+    saves = []
+    save = calibration._save
+    monkeypatch.setattr(calibration, '_save', lambda: saves.append(1) or save())
+    for _ in range(5):
+        calibration.record_press('ONE_DOSE', 0.3)
+    # The first action is saved right away, the others wait for the interval or a flush
+    assert len(saves) == 1
+    assert _create_calibration(tmp_path).button_timing('ONE_DOSE').samples == 1
+    calibration.flush()
+    calibration.flush()
+    assert len(saves) == 2
+    assert _create_calibration(tmp_path).button_timing('ONE_DOSE').samples == 5
+
+
+def test_press_ends_once_the_machine_acknowledged_it(gpio):
+    machine = gpio.machine
+
+    started = time.monotonic()
+    ack = press_output(_create_outputs(relais=True), 'POWER', duration_in_sec=2, ack_gpio_numbers=list(IN_PINS.values()), min_duration_in_sec=0.25)
+    duration = time.monotonic() - started
+    assert machine.runtime_state == SimulatedCoffeeMachine.STARTUP
+    # The dose LEDs start blinking once the button was recognized, within half a blink period
+    assert SimulatedCoffeeMachine.BUTTON_RECOGNITION_DELAY <= ack < SimulatedCoffeeMachine.BUTTON_RECOGNITION_DELAY + SimulatedCoffeeMachine.BLINK_PERIOD
+    assert 0.25 <= duration < 1
+
+
+def test_unacknowledged_press_is_held_for_the_full_duration(gpio):
+    machine = gpio.machine
+    # Without the relais the machine does not see the button
+    gpio.output(OUT_PINS['RELAIS'], gpio.LOW)
+
+    started = time.monotonic()
+    ack = press_output(_create_outputs(relais=False), 'POWER', duration_in_sec=0.3, ack_gpio_numbers=list(IN_PINS.values()), min_duration_in_sec=0.1)
+    assert ack is None
+    assert time.monotonic() - started >= 0.3
+    assert machine.runtime_state == SimulatedCoffeeMachine.OFF
@@ -0,0 +1,88 @@
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from config.flask_config import ResourceException
+from core import WebAPI
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Answers every request with the next status code of the server, or stalls if it is None
+    def _answer(self):
+        self.server.requests.append(self.command)
+        status_code = self.server.status_codes.pop(0) if self.server.status_codes else 200
+        if status_code is None:
+            time.sleep(0.5)
+            status_code = 200
+        body = b'{"message": "Fehler"}'
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._answer()
+
+    def do_POST(self):
+        self._answer()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    server.requests = []
+    server.status_codes = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _web_api(port: int, **kwargs) -> WebAPI:
+    return WebAPI(domain='http://127.0.0.1', port=port, ssl_ca_bundle='', **kwargs)
+
+
+def _unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_idempotent_requests_are_retried(server):
+    web_api = _web_api(server.server_port, retries=2)
+    server.status_codes = [503, 200]
+    web_api.get(web_api.url, token='token')
+    assert server.requests == ['GET', 'GET']
+
+
+def test_posts_are_not_retried_after_a_response(server):
+    web_api = _web_api(server.server_port, retries=2)
+    server.status_codes = [503]
+    with pytest.raises(ResourceException) as err:
+        web_api.post(web_api.url, token='token', json={})
+    assert err.value.status_code == 503
+    assert server.requests == ['POST']
+
+
+def test_slow_answers_are_reported_as_timeouts(server):
+    web_api = _web_api(server.server_port, read_timeout=0.1, retries=0)
+    server.status_codes = [None]
+    with pytest.raises(ResourceException) as err:
+        web_api.get(web_api.url, token='token')
+    assert err.value.status_code == 504
+
+
+def test_unreachable_webapi_is_reported():
+    web_api = _web_api(_unused_port(), retries=0)
+    with pytest.raises(ResourceException) as err:
+        web_api.get(web_api.url, token='token')
+    assert err.value.status_code == 503
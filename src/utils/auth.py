@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from typing import Callable, List
+
+import jwt
+
+from config.flask_config import AuthenticationFailed, ResourceException
+from config.logger import logging, get_logger_name
+from utils.cache import TTLCache, SingleFlight, MISSING
+
+
+logger = logging.getLogger(get_logger_name(__name__))
+
+
+class TokenVerifier:
+    def __init__(self, web_api, jwt_key: str = None, jwks_url: str = None, algorithms: List[str] = None, cache_size: int = 1024, cache_ttl: float = 60, negative_cache_ttl: float = 5):
+        self._web_api = web_api
+        self._jwt_key = jwt_key
+        self._jwks_client = jwt.PyJWKClient(jwks_url) if jwks_url else None
+        self._algorithms = algorithms or ['HS256']
+        self._cache_ttl = cache_ttl
+        self._negative_cache_ttl = negative_cache_ttl
+        # sha256(token) => None (valid) or (status_code, message) of the rejection
+        self._verdicts = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self._single_flight = SingleFlight()
+
+    @property
+    def verifies_locally(self) -> bool:
+        return bool(self._jwt_key) or not (self._jwks_client is None)
+
+    def verify(self, token: str):
+        if self.verifies_locally and self._verify_locally(token):
+            return
+        self._verify_remotely(token)
+
+    def _verify_locally(self, token: str) -> bool:
+        try:
+            key = self._jwt_key
+            if not (self._jwks_client is None):
+                key = self._jwks_client.get_signing_key_from_jwt(token).key
+            jwt.decode(token, key, algorithms=self._algorithms, options={'require': ['exp']})
+        except jwt.PyJWKClientError as err:
+            logger.warning('Could not fetch JWT signing key, verifying remotely: %s', err)
+            return False
+        except jwt.InvalidTokenError as err:
+            logger.debug('Local token verification failed: %s', err)
+            raise AuthenticationFailed('Token ist invalide.')
+        return True
+
+    def verify_admin(self, token: str):
+        # Admin rights are only known to the WebAPI, its verdict is cached like the one of a remote verification
+        self.verify(token)
+        key = 'admin:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+        self._check_verdict(key, token, self._web_api.is_admin)
+
+    def _verify_remotely(self, token: str):
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        self._check_verdict(key, token, self._web_api.is_user)
+
+    def _check_verdict(self, key: str, token: str, fetch: Callable[[str], object]):
+        verdict = self._verdicts.get(key)
+        if verdict is MISSING:
+            verdict = self._single_flight.do(key, lambda: self._fetch_verdict(key, token, fetch))
+        if not (verdict is None):
+            status_code, message = verdict
+            raise ResourceException(status_code=status_code, message=message)
+
+    def _fetch_verdict(self, key: str, token: str, fetch: Callable[[str], object]):
+        try:
+            fetch(token)
+        except ResourceException as err:
+            if err.status_code in (401, 403):
+                verdict = (err.status_code, err.message)
+                self._verdicts.set(key, verdict, ttl=self._negative_cache_ttl)
+                return verdict
+            raise
+        self._verdicts.set(key, None, ttl=self._ttl_for(token))
+        return None
+
+    def _ttl_for(self, token: str) -> float:
+        # A valid verdict must not outlive the token
+        try:
+            claims = jwt.decode(token, options={'verify_signature': False})
+        except jwt.InvalidTokenError:
+            return None
+        exp = claims.get('exp')
+        if exp is None:
+            return None
+        return min(exp - time.time(), self._cache_ttl)
+
+
+def get_token_owner(token: str) -> str:
+    # Identifies the user of a token without keeping the token itself: the subject of the token or a hash of it
+    try:
+        subject = jwt.decode(token, options={'verify_signature': False}).get('sub')
+    except jwt.InvalidTokenError:
+        subject = None
+    if not (subject is None):
+        return 'sub:{}'.format(subject)
+    return 'sha256:' + hashlib.sha256(token.encode('utf-8')).hexdigest()
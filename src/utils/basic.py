@@ -14,7 +14,7 @@ def is_percent_value(value: int, accuracy: int = 0) -> bool:
     value = get_percent_value(value, accuracy)
     in_range = value in range(0, 101)
 
-    logger.debug('Accuracy: {0}, Value: {1}, In Range: {2}'.format(accuracy, value, in_range))
+    logger.debug('Accuracy: %s, Value: %s, In Range: %s', accuracy, value, in_range)
     
     return in_range
 
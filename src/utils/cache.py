@@ -0,0 +1,92 @@
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, max_size: int, ttl: float):
+        if max_size < 1:
+            raise ValueError('Cache size must be greater than 0')
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        # key => (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=MISSING):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value, ttl: float = None):
+        if ttl is None:
+            ttl = self._ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share the result of the first call
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: Hashable, func: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if not (call.error is None):
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,40 @@
+import os
+import tempfile
+
+from pathlib import Path
+
+
+# Mode of newly created files, like open(path, 'w') with the usual umask of 022
+DEFAULT_FILE_MODE = 0o644
+
+
+def fsync_directory(directory: Path):
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, content: str, mode: int = None):
+    # Readers either see the old or the new file, never a partially written one.
+    # Without a mode the file keeps its mode, new files get DEFAULT_FILE_MODE.
+    path = Path(path)
+    if mode is None:
+        try:
+            mode = os.stat(str(path)).st_mode & 0o777
+        except FileNotFoundError:
+            mode = DEFAULT_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix='.{}.'.format(path.name), suffix='.tmp')
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_directory(path.parent)
@@ -7,12 +7,24 @@ from simplexml import dumps
 from werkzeug.wrappers import Response
 from werkzeug.http import HTTP_STATUS_CODES
 
-from config.flask_config import AuthenticationFailed
+from config.flask_config import AuthenticationFailed, ResourceException
+from config.environment_tools import get_webapi_jwt_key, get_webapi_jwks_url, get_webapi_jwt_algorithms, get_auth_cache_size, get_auth_cache_ttl
 from core import WEB_API
+from utils.auth import TokenVerifier
+from utils.profiling import span
 
 
 CODE = 201
 
+TOKEN_VERIFIER = TokenVerifier(
+    web_api=WEB_API,
+    jwt_key=get_webapi_jwt_key(),
+    jwks_url=get_webapi_jwks_url(),
+    algorithms=get_webapi_jwt_algorithms(),
+    cache_size=get_auth_cache_size(),
+    cache_ttl=get_auth_cache_ttl()
+)
+
 
 def token_required(roles:List[str]=None):
     def decorator(func):
@@ -25,20 +37,32 @@ def token_required(roles:List[str]=None):
             if not token:
                 raise AuthenticationFailed('Token fehlt.')
             
-            # Verifies user token
-            WEB_API.is_user(token)
+            # Verifies user token locally if possible, otherwise with a cached verdict of the WebAPI
+            with span('auth'):
+                if roles and 'admin' in roles:
+                    TOKEN_VERIFIER.verify_admin(token)
+                else:
+                    TOKEN_VERIFIER.verify(token)
 
             return func(token=token, *args, **kwargs)
         return wrapper
     return decorator
 
 
-def get_post_response(body, content_type, api, obj_id):
+def is_admin(token: str) -> bool:
+    try:
+        TOKEN_VERIFIER.verify_admin(token)
+    except ResourceException:
+        return False
+    return True
+
+
+def get_post_response(body, content_type, api, obj_id, code: int = CODE):
     if content_type == 'application/json':
         body = json.dumps(body.__dict__)
     response = Response(body)
-    response.status = HTTP_STATUS_CODES[CODE]
-    response.status_code = CODE
+    response.status = HTTP_STATUS_CODES[code]
+    response.status_code = code
     response.headers['location'] = '{api}/{new_id}'.format(api=api, new_id=obj_id)
     response.autocorrect_location_header = False
     response.content_type = content_type
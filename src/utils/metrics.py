@@ -0,0 +1,173 @@
+import threading
+import time
+
+from bisect import bisect_left
+from typing import List, Tuple
+
+
+class Histogram:
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = DEFAULT_BUCKETS if buckets is None else tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values => [count per bucket (not cumulative) ..., count above the last bucket, sum, count]
+        self._values = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = [0] * (len(self.buckets) + 3)
+                self._values[label_values] = values
+            values[index] = values[index] + 1
+            values[-2] = values[-2] + value
+            values[-1] = values[-1] + 1
+
+    def time(self, *label_values) -> '_Timer':
+        return _Timer(self, label_values)
+
+    def state(self) -> dict:
+        with self._lock:
+            return {label_values: list(values) for label_values, values in self._values.items()}
+
+    def merge_values(self, values: list, other: list) -> list:
+        return [a + b for a, b in zip(values, other)]
+
+    def samples(self, state: dict) -> List[str]:
+        lines = []
+        for label_values, values in sorted(state.items()):
+            labels = _format_labels(self.label_names, label_values)
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float('inf'),), values[:-2]):
+                cumulative = cumulative + count
+                bucket_labels = _format_labels(self.label_names + ('le',), label_values + (_format_value(bucket),))
+                lines.append('{0}_bucket{1} {2}'.format(self.name, bucket_labels, cumulative))
+            lines.append('{0}_sum{1} {2}'.format(self.name, labels, _format_value(values[-2])))
+            lines.append('{0}_count{1} {2}'.format(self.name, labels, values[-1]))
+        return lines
+
+
+class Counter:
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        # label values => count, a counter without labels is reported from the start
+        self._values = {} if len(label_names) > 0 else {(): 0}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def state(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def merge_values(self, value: float, other: float) -> float:
+        return value + other
+
+    def samples(self, state: dict) -> List[str]:
+        return ['{0}{1} {2}'.format(self.name, _format_labels(self.label_names, label_values), _format_value(value)) for label_values, value in sorted(state.items())]
+
+
+class MetricsRegistry:
+    # Metrics in the Prometheus text format. Other processes (HTTP workers) can add their metrics, see merge().
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        # source => state of the metrics of another process, replaced with every merge
+        self._sources = {}
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = None) -> Histogram:
+        return self._register(Histogram(name=name, documentation=documentation, label_names=label_names, buckets=buckets))
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name=name, documentation=documentation, label_names=label_names))
+
+    def state(self) -> dict:
+        return {metric.name: metric.state() for metric in self._metrics}
+
+    def merge(self, source: str, state: dict):
+        with self._lock:
+            self._sources[source] = state
+
+    def render(self) -> str:
+        with self._lock:
+            sources = list(self._sources.values())
+        lines = []
+        for metric in self._metrics:
+            state = metric.state()
+            for source in sources:
+                for label_values, values in source.get(metric.name, {}).items():
+                    current = state.get(label_values)
+                    state[label_values] = values if current is None else metric.merge_values(current, values)
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.TYPE))
+            lines.extend(metric.samples(state))
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_label_values', '_started')
+
+    def __init__(self, histogram: Histogram, label_values: tuple):
+        self._histogram = histogram
+        self._label_values = label_values
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._histogram.observe(time.perf_counter() - self._started, *self._label_values)
+        return False
+
+
+def _format_labels(label_names: tuple, label_values: tuple) -> str:
+    if len(label_names) == 0:
+        return ''
+    pairs = ('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in zip(label_names, label_values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+# Upper bounds in seconds, from a single GPIO scan up to a WebAPI call with retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = MetricsRegistry()
+
+GPIO_READ_SECONDS = REGISTRY.histogram('coffee_machine_gpio_read_seconds', 'Duration of a GPIO scan of the LEDs.', ('mode',))
+
+DAC_WRITE_SECONDS = REGISTRY.histogram('coffee_machine_dac_write_seconds', 'Duration of an I2C write to a DAC.', ('address',))
+
+BUTTON_PRESS_SECONDS = REGISTRY.histogram('coffee_machine_button_press_seconds', 'Duration of a button press until the machine acknowledged it.', ('button',))
+
+WEBAPI_REQUEST_SECONDS = REGISTRY.histogram('coffee_machine_webapi_request_seconds', 'Duration of a WebAPI request incl. retries.', ('route', 'method'))
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram('coffee_machine_http_request_seconds', 'Duration of an HTTP request until the response (first byte of streams).', ('endpoint', 'method', 'status'))
+
+DEVICE_BLOCKED_TOTAL = REGISTRY.counter('coffee_machine_device_blocked_total', 'Requests rejected because the device was busy.')
+
+GPIO_FALLBACK_TOTAL = REGISTRY.counter('coffee_machine_gpio_fallback_total', 'GPIO reads without a result, answered with the fallback value.', ('gpio',))
+
+FILL_LEVEL_SCAN_SECONDS = REGISTRY.histogram('coffee_machine_fill_level_scan_seconds', 'Duration of a scan of all fill level sensors.')
+
+I2C_ERRORS_TOTAL = REGISTRY.counter('coffee_machine_i2c_errors_total', 'I2C operations that failed with an OSError.', ('operation',))
@@ -0,0 +1,153 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+
+from pathlib import Path
+from typing import List, Tuple
+
+
+class SpanRecorder:
+    # Durations of the steps of one request (or brew), reported in the Server-Timing header
+    __slots__ = ('spans',)
+
+    def __init__(self):
+        # (name, seconds) in the order the steps ended
+        self.spans = []
+
+    def add(self, name: str, duration: float):
+        self.spans.append((name, duration))
+
+
+class span:
+    # Times a step of the current request, costs a thread local lookup if nothing is recorded
+    __slots__ = ('_name', '_recorder', '_started')
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __enter__(self):
+        self._recorder = getattr(_local, 'recorder', None)
+        if not (self._recorder is None):
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not (self._recorder is None):
+            self._recorder.add(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class recording:
+    # Records the spans of the current thread, e.g. while a request or a brew runs
+    __slots__ = ('_recorder', '_previous')
+
+    def __enter__(self) -> SpanRecorder:
+        self._previous = getattr(_local, 'recorder', None)
+        self._recorder = SpanRecorder()
+        _local.recorder = self._recorder
+        return self._recorder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.recorder = self._previous
+        return False
+
+
+def add_spans(spans: List[Tuple[str, float]], prefix: str = ''):
+    # Spans recorded elsewhere, e.g. in the hardware owner process or while a ticket was brewed
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return
+    for name, duration in spans:
+        recorder.add(prefix + name, duration)
+
+
+def format_server_timing(spans: List[Tuple[str, float]]) -> str:
+    # Spans with the same name are summed up, e.g. two button presses
+    totals = {}
+    for name, duration in spans:
+        total, count = totals.get(name, (0, 0))
+        totals[name] = (total + duration, count + 1)
+    metrics = []
+    for name, (total, count) in totals.items():
+        metric = '{0};dur={1:.1f}'.format(name, total * 1000)
+        if count > 1:
+            metric = metric + ';desc="{}x"'.format(count)
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class RequestProfiler:
+    # cProfile captures of single requests, stored as pstats dump and text summary
+    def __init__(self, directory: Path, max_files: int):
+        self._directory = Path(directory)
+        self._max_files = max_files
+        # Only one capture at a time, profiling concurrent requests would mix their threads up
+        self._lock = threading.Lock()
+
+    def start(self) -> cProfile.Profile:
+        # None if another request is being profiled
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this thread
+            self._lock.release()
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, label: str) -> str:
+        # Returns the name of the capture
+        try:
+            profile.disable()
+            self._directory.mkdir(parents=True, exist_ok=True)
+            now = time.time()
+            name = '{0}{1:03d}-{2}-{3}'.format(time.strftime('%Y%m%d-%H%M%S', time.localtime(now)), int(now * 1000) % 1000, os.getpid(), re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_'))
+            profile.dump_stats(str(self._directory / (name + PROFILE_SUFFIX)))
+            summary = io.StringIO()
+            pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+            with open(self._directory / (name + SUMMARY_SUFFIX), 'w') as f:
+                f.write(summary.getvalue())
+            self._prune()
+            return name
+        finally:
+            self._lock.release()
+
+    def list(self) -> List[dict]:
+        if not self._directory.is_dir():
+            return []
+        files = []
+        for path in sorted(self._directory.iterdir(), reverse=True):
+            stat = path.stat()
+            files.append({'name': path.name, 'size': stat.st_size, 'created_at': int(stat.st_mtime)})
+        return files
+
+    def path(self, name: str) -> Path:
+        # Only files of the listing are served, never other paths
+        if not (name.endswith(PROFILE_SUFFIX) or name.endswith(SUMMARY_SUFFIX)) or name != os.path.basename(name):
+            return None
+        path = self._directory / name
+        return path if path.is_file() else None
+
+    def _prune(self):
+        captures = sorted(self._directory.glob('*' + PROFILE_SUFFIX))
+        for capture in captures[:max(0, len(captures) - self._max_files)]:
+            capture.unlink()
+            summary = capture.with_suffix(SUMMARY_SUFFIX)
+            if summary.exists():
+                summary.unlink()
+
+
+_local = threading.local()
+
+PROFILE_SUFFIX = '.prof'
+
+SUMMARY_SUFFIX = '.txt'
+
+# Number of functions in the text summary of a capture
+PROFILE_SUMMARY_LINES = 60